@@ -8,15 +8,10 @@
 # export SKYWAYROOT=/project/rcc/trung/skyway-github
 
 import skyway
-from skyway.cloud.aws import *
-from skyway.cloud.gcp import *
-from skyway.cloud.azure import *
-from skyway.cloud.oci import *
-from skyway.cloud.slurm import *
+from skyway import cli, jobs
 
 import os
 import subprocess
-from datetime import datetime, timezone
 from io import StringIO
 
 import streamlit as st
@@ -27,151 +22,45 @@ import pandas as pd
 
 import colorama
 
-class InstanceDescriptor:
+class InstanceDescriptor(cli.InstanceDescriptor):
+    """
+    A job of the skyway CLI, with the job script uploaded to the dashboard
+    """
     def __init__(self, jobname: str, account_name: str, node_type: str, walltime: str, vendor_name: str, job_script: str):
-        self.jobname = jobname
-        self.account_name = account_name
-        self.node_type = node_type.split(' ')[0]
-        self.walltime = walltime
-        self.vendor_name = vendor_name
+        super().__init__(jobname, account_name, node_type.split(' ')[0], walltime)
         self.job_script = job_script
 
-        self.account = None
-        if 'aws' in vendor_name:
-            self.account = AWS(account_name)
-        elif 'gcp' in vendor_name:
-            self.account = GCP(account_name)
-        elif 'azure' in vendor_name:
-            self.account = AZURE(account_name)
-        elif 'oci' in vendor_name:
-            self.account = OCI(account_name)
-        elif 'midway3' in vendor_name:
-            self.account = SLURMCluster(account_name)
-
-        self.user = os.environ['USER']
-
     def submitJob(self):
         #st.warning("Do you want to create this instance?")
         #if st.button("Yes"):
 
+        # the node is created by a background worker, its state is read from the job store (see skyway.jobs)
         print(f"creating node from {self.vendor_name} with account {self.account_name}")
-        self.account.create_nodes(self.node_type, [self.jobname], need_confirmation=False, walltime=self.walltime)
-        nodes_ready = False
-        while nodes_ready == False:
-            instanceID = self.account.get_instance_ID(self.jobname)
-            if instanceID != "":
-                nodes_ready = True
+        job_id = jobs.submit(self.account_name, self.jobname, self.node_type, self.walltime)
 
         if self.job_script != "":
-            args = self.parse_script(job_script)
-            skyway_cmd = args['skyway_cmd']
+            job = jobs.JobStore().wait(job_id)
+            if job is None or job['state'] != 'ready':
+                st.error(f"Job {job_id} failed: {job['message'] if job else 'not found'}")
+                return False
+
+            args = cli.parse_script(self.job_script)
 
             # execute pre-execute commands after nodes are available: e.g. data transfers
-            if skyway_cmd != "":
-                # append the command with account and job name
-                pre_execute = skyway_cmd + " --account=" + self.account_name + " -J" + self.jobname
-                os.system(pre_execute)
+            if args['skyway_cmd'] != "":
+                cli.run_skyway_cmd(args['skyway_cmd'], self)
 
-            instanceID = self.account.get_instance_ID(self.jobname)
-            self.account.execute_script(instanceID, self.job_script)
+            self.execute(self.job_script)
 
         initializing = True
         return initializing
 
-    def connectJob(self, node_names):
-        '''
-        only get on a on-premise compute node for now with rcc-staff
-        '''
-        
-        if "midway3" in self.vendor_name:
-            instanceID = self.account.get_host_ip(self.jobname)
-            self.account.connect_node(instanceID)
-
-        elif "aws" in self.vendor_name:
-            instanceID = self.account.get_instance_ID(self.jobname)
-            self.account.connect_node(instanceID)
-
-        elif "gcp" in self.vendor_name:
-            instanceID = self.account.get_instance_ID(self.jobname)
-            self.account.connect_node(instanceID)
-
-        elif "oci" in self.vendor_name:
-            instanceID = self.account.get_instance_ID(self.jobname)
-            self.account.connect_node(instanceID)
-
     def terminateJob(self, node_names = [], instance_id=""):
-        if "midway3" in self.vendor_name:
-            instanceID = self.account.get_instance_ID(self.jobname)
-            st.write(f"Terminating instance ID {instanceID} ...")
-            self.account.destroy_nodes(IDs=[instanceID], need_confirmation=False)
-        else:
-            if instance_id == "":
-                st.write(f"Terminating instance name {node_names} ...")
-                self.account.destroy_nodes(node_names=node_names, need_confirmation=False)
-            else:
-                st.write(f"Terminating instance ID {instance_id}...")
-                self.account.destroy_nodes(node_names=node_names, IDs=[instance_id], need_confirmation=False)
-
-    def getBalance(self):
-        # retrieve from database for the given account
-        accumulating_cost, remaining_balance = self.account.get_cost_and_usage_from_db(user_name=self.user)
-        return remaining_balance
-
-    def getEstimateCost(self):
-        pt = datetime.strptime(self.walltime, "%H:%M:%S")
-        walltime_in_hours = int(pt.hour + pt.minute/60)
-        if "midway3" in self.vendor_name:
-            unit_price = 1.0 # float(self.account.get_unit_price(self.node_type))
+        if instance_id == "":
+            st.write(f"Terminating instance name {node_names} ...")
         else:
-            unit_price = float(self.account.get_unit_price(self.node_type))
-        cost = walltime_in_hours * unit_price
-        return cost
-  
-    def list_nodes(self):
-        nodes, list_of_nodes = self.account.list_nodes(verbose=False) 
-        return nodes
-
-
-    '''
-    parse the job script to get the account information, node type (constraint) and walltime
-    '''
-    def parse_script(self, filename):
-        jobname = "my-run"
-        account = ""
-        constraint = ""
-        walltime = ""
-        skyway_cmd = ""
-        with open(filename, 'r') as f:
-            lines = f.readlines()
-            for line in lines:
-                # extract only lines with #SBATCH, remove \n characters
-                # remove all the spaces
-                # split at '='
-                if "#SBATCH" in line:
-                    # remove #SBATCH
-                    line = line.replace('#SBATCH ','').strip('\n')
-                    line = line.replace(' ','')
-                    args = line.split('=')
-                    if len(args) == 2:
-                        if args[0] == "-job-name":
-                            jobname = args[1]
-                        if args[0] == "--account":
-                            account = args[1]
-                        if args[0] == "--constraint":
-                            constraint = args[1]
-                        if args[0] == "--time":
-                            walltime = args[1]                        
-                elif "skyway_" in line:
-                    skyway_cmd = line.strip('\n')
-                else:
-                    continue
-
-        return { 'jobname': jobname,
-                'account': account,
-                'constraint': constraint,
-                'walltime': walltime,
-                'skyway_cmd': skyway_cmd
-                }
+            st.write(f"Terminating instance ID {instance_id}...")
+        super().terminateJob(node_names=node_names, instance_id=instance_id)
 
 if __name__ == "__main__":
 
@@ -283,10 +172,16 @@ if __name__ == "__main__":
             st.markdown(f"Balance after job completion would be: ${balance - estimatedSU:0.3f}")
 
         pending = False
-        jobs = st.empty()
+        job_status = st.empty()
         if st.button('Submit', type='primary', help='Create a cloud node or a compute node', on_click=instanceDescriptor.submitJob):
             #st.markdown("#### Job status")
-            jobs.write("Node initializing..")
+            job_status.write("Node initializing, see the submitted jobs below..")
+
+        st.markdown("#### Submitted jobs")
+        job_list = jobs.JobStore().list(limit=10)
+        st.table(pd.DataFrame([[job['id'], job['account'], job['jobname'], job['node_type'], job['state'],
+                                ', '.join(job['nodes']), job['submitted'], job['updated'], job['message'] or ""]
+                               for job in job_list], columns=jobs.columns))
 
         st.markdown("#### Running nodes")
         headers=['Name', 'User', 'Status',  'Type', 'Instance ID', 'Host', 'Elapsed Time', 'Running Cost']
@@ -300,7 +195,7 @@ if __name__ == "__main__":
 
         # handle the button clicks
         if st.button('Connect', type='primary', help="Create an interactive session on the instance"):
-            instanceDescriptor.connectJob(node_names=['your_run'])
+            instanceDescriptor.connectJob()
         st.markdown("NOTE: Only support interactive sessions on the nodes provided by AWS, GCP, OCI and RCC Midway3 for now.")
 
         instance_id = st.text_input(r"$\textsf{Instance ID to terminate}$", "")
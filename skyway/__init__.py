@@ -4,7 +4,6 @@
 # Maintainer: Yuxing Peng, Trung Nguyen
 
 import os
-import yaml
 from . import utils
 
 # SKYWAYROOT is the path to the on-premises folders (not the skyway source code folder)
@@ -23,14 +22,9 @@ if 'SKYWAYROOT' not in os.environ:
 cfg_path = os.environ['SKYWAYROOT'] + '/etc/'
 debug = 'SKYWAYDEBUG' in os.environ
 
+# parsed with the C loader if available and cached per user (see utils.load_config)
 def load_config(cfg_name):
-    cfg_file = cfg_path + cfg_name + '.yaml'
-
-    if not os.path.isfile(cfg_file):
-        raise Exception(f'Configuration file {cfg_name} cannot be found.')
-    
-    with open(cfg_file, 'r') as f:
-        return yaml.load(f.read(), Loader=yaml.FullLoader)
+    return utils.load_config(cfg_name, cfg_path)
 
 # load the configuration from $SKYWAYROOT/etc/skyway.yaml into cfg, a dictionary
 cfg = load_config('skyway')
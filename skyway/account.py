@@ -20,11 +20,7 @@ def load_cfg(account):
     if account not in accounts():
         raise Exception(f'Account {account} does not exist.')
 
-    cfg_file = f"{cfg['paths']['etc']}/accounts/{account}.yaml"
-    with open(cfg_file, "r") as f:
-        acct_cfg = yaml.load(f, Loader=yaml.FullLoader)
-    
-    return acct_cfg
+    return utils.load_config(account, f"{cfg['paths']['etc']}/accounts/")
 
 def list():
     print("\nAccounts:\n\n" + yaml.dump(accounts()))
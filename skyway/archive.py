@@ -0,0 +1,149 @@
+# Copyright (c) 2019-2024 The University of Chicago.
+# Part of skyway, released under the BSD 3-Clause License.
+
+# Maintainer: Trung Nguyen, Yuxing Peng
+
+"""@package docstring
+Usage archive: the records of the usage ledgers exported to Parquet files, partitioned by account, year and month
+(the month the node was terminated)
+
+  $SKYWAYROOT/var/usage/account=rcc-aws/year=2024/month=9/part-[first id]-[last id].parquet
+
+Each export writes the records appended to the ledger since the previous export (the watermark, the last exported
+record id, is kept in the ledger), so the files are never rewritten. The reports read only the partitions
+and the columns they need:
+
+  skyway ledger archive [-A rcc-aws]
+  skyway usage --report --since 2023-07 --until 2024-06 [-A rcc-aws] [-u user1] [--by month]
+
+pyarrow is only imported by the functions of this module.
+"""
+
+import os
+from datetime import datetime
+
+from . import cfg
+from . import ledger
+
+# the columns of the Parquet files, besides the partition keys account, year and month
+archive_columns = ['id', 'user', 'instance_id', 'instance_type', 'start', 'end', 'cost', 'balance']
+
+def archive_path():
+    return os.path.join(cfg['paths']['var'], 'usage')
+
+def _parse_month(month):
+    '''
+    "2024-06" -> (2024, 6)
+    '''
+    try:
+        pt = datetime.strptime(month, "%Y-%m")
+    except ValueError:
+        raise Exception(f"Invalid month {month}, expected YYYY-MM.")
+    return pt.year, pt.month
+
+def _partition_of(end):
+    # the records are partitioned by the month the node was terminated (end in ISO format),
+    # None if end is not a date
+    try:
+        pt = datetime.fromisoformat(end)
+        return pt.year, pt.month
+    except (TypeError, ValueError):
+        return None
+
+def export_account(account_name, batch_size=10000):
+    '''
+    write the records of an account appended since the last export, return the number of records written;
+    the records whose end is not a date are reported and left out of the archive (they stay in the ledger)
+    '''
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if not os.path.isfile(ledger.ledger_path(account_name)) and not os.path.isfile(ledger.pickle_path(account_name)):
+        return 0
+
+    usage_ledger = ledger.open_ledger(account_name)
+    last_id = int(usage_ledger.get_meta('archived', '0'))
+
+    count = 0
+    skipped = []
+    while True:
+        rows = usage_ledger.records_after(last_id, batch_size)
+        if len(rows) == 0:
+            break
+
+        partitions = {}
+        for row in rows:
+            partition = _partition_of(row[5])
+            if partition is None:
+                skipped.append(row)
+                continue
+            partitions.setdefault(partition, []).append(row)
+
+        for (year, month), records in partitions.items():
+            folder = os.path.join(archive_path(), f"account={account_name}", f"year={year}", f"month={month}")
+            os.makedirs(folder, exist_ok=True)
+
+            table = pa.table({ name: [r[i] for r in records] for i, name in enumerate(archive_columns) },
+                             schema=pa.schema([('id', pa.int64()), ('user', pa.string()),
+                                               ('instance_id', pa.string()), ('instance_type', pa.string()),
+                                               ('start', pa.string()), ('end', pa.string()),
+                                               ('cost', pa.float64()), ('balance', pa.float64())]))
+
+            # the file name is given by the record ids: exporting again after a failure overwrites the same file
+            parquet_file = os.path.join(folder, f"part-{records[0][0]}-{records[-1][0]}.parquet")
+            pq.write_table(table, parquet_file + '.tmp')
+            os.replace(parquet_file + '.tmp', parquet_file)
+
+        last_id = rows[-1][0]
+        usage_ledger.set_meta('archived', str(last_id))
+        count += sum(len(records) for records in partitions.values())
+
+    usage_ledger.close()
+
+    if len(skipped) > 0:
+        print(f"{account_name}: {len(skipped)} usage records not archived, their end time is not a date:")
+        for row in skipped:
+            print(f"  record {row[0]}: user {row[1]}, instance {row[2]}, end {row[5]}, cost {row[6]}")
+    return count
+
+def report(accounts=[], users=[], since=None, until=None, by='user'):
+    '''
+    total cost and number of nodes per account and user (by='user') or per account and month (by='month')
+    from the archive, reading only the partitions in [since, until] (YYYY-MM) of the given accounts
+    '''
+    import pyarrow.dataset as ds
+
+    if not os.path.isdir(archive_path()):
+        raise Exception(f"Usage archive {archive_path()} is not available, run: skyway ledger archive")
+
+    dataset = ds.dataset(archive_path(), format='parquet', partitioning='hive')
+
+    # filters on the partition keys prune the folders, the filter on user is pushed down to the row groups
+    conditions = []
+    if len(accounts) > 0:
+        conditions.append(ds.field('account').isin(accounts))
+    if len(users) > 0:
+        conditions.append(ds.field('user').isin(users))
+    if since is not None:
+        year, month = _parse_month(since)
+        conditions.append((ds.field('year') > year) | ((ds.field('year') == year) & (ds.field('month') >= month)))
+    if until is not None:
+        year, month = _parse_month(until)
+        conditions.append((ds.field('year') < year) | ((ds.field('year') == year) & (ds.field('month') <= month)))
+
+    condition = None
+    for c in conditions:
+        condition = c if condition is None else condition & c
+
+    if by == 'month':
+        keys = ['account', 'year', 'month']
+    else:
+        keys = ['account', 'user']
+
+    table = dataset.to_table(columns=keys + ['cost'], filter=condition)
+    totals = table.group_by(keys).aggregate([('cost', 'sum'), ('cost', 'count')])
+
+    data = sorted(zip(*[totals.column(k).to_pylist() for k in keys],
+                      totals.column('cost_sum').to_pylist(),
+                      totals.column('cost_count').to_pylist()))
+    return [list(row) for row in data], keys + ['Cost', 'Nodes']
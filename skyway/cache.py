@@ -0,0 +1,212 @@
+# Copyright (c) 2019-2024 The University of Chicago.
+# Part of skyway, released under the BSD 3-Clause License.
+
+# Maintainer: Trung Nguyen, Yuxing Peng
+
+"""@package docstring
+Listing cache: values (e.g. the list of nodes of an account) shared by processes through a file
+under $SKYWAYROOT/run, so that the dashboard refreshes and several skyway list commands running
+at the same time do not each call the vendor API.
+
+A value younger than ttl seconds is used as is. An older value, up to ttl + stale seconds, is still
+returned while one process refreshes it in the background (stale-while-revalidate); beyond that,
+or after invalidate() (e.g. when nodes are created or destroyed), the value is computed again.
+The refreshes are serialized with a lock file (fcntl) and the file is replaced atomically.
+
+The files are only writable by the user who wrote them, and a file is only loaded if it was written
+by the current user or by the owner of its folder, and nobody else can write to it: the values are pickled,
+loading a file planted by another user would run its code. The values are therefore shared between
+the processes of one user (commands, dashboard, the user's skywayd); with a run folder writable by all,
+each user computes the values (e.g. lists the nodes) at most once per ttl.
+
+The ttl and stale times (in seconds) can be set in $SKYWAYROOT/etc/skyway.yaml:
+
+  listing:
+    ttl: 30
+    stale: 120
+
+The vendor metadata of an account (locations, sizes, subnets, images, see Cloud.get_metadata) change rarely:
+they are kept under $SKYWAYROOT/var for a week (metadata: ttl: in seconds), until skyway catalog --refresh.
+"""
+
+from contextlib import contextmanager
+import fcntl
+import os
+import pickle
+import threading
+import time
+
+from . import cfg
+
+def run_path():
+    if 'run' in cfg['paths']:
+        return cfg['paths']['run']
+    return os.path.join(os.environ['SKYWAYROOT'], 'run')
+
+def var_path():
+    if 'var' in cfg['paths']:
+        return cfg['paths']['var']
+    return os.path.join(os.environ['SKYWAYROOT'], 'var')
+
+def listing_cache(account_name):
+    '''
+    the cache of the list of nodes of an account: $SKYWAYROOT/run/listing-[account]
+    '''
+    listing_cfg = cfg.get('listing') or {}
+    return FileCache(os.path.join(run_path(), f"listing-{account_name}"),
+                     ttl=float(listing_cfg.get('ttl', 30)),
+                     stale=float(listing_cfg.get('stale', 120)))
+
+def metadata_cache(account_name):
+    '''
+    the cache of the vendor metadata of an account: $SKYWAYROOT/var/metadata-[account], computed again when too old
+    '''
+    metadata_cfg = cfg.get('metadata') or {}
+    return FileCache(os.path.join(var_path(), f"metadata-{account_name}"),
+                     ttl=float(metadata_cfg.get('ttl', 7*24*3600)),
+                     stale=0)
+
+@contextmanager
+def run_lock(name):
+    '''
+    hold the lock file $SKYWAYROOT/run/[name].lock, serializing the processes of all the users on this host
+    (e.g. claiming the instances of a warm pool)
+    '''
+    lock_file = FileCache(os.path.join(run_path(), name))
+    fd = lock_file._lock()
+    try:
+        yield
+    finally:
+        lock_file._unlock(fd)
+
+class FileCache():
+    """
+    A value shared between processes through a pickle file, with the time it was computed (see _trusted)
+    """
+
+    def __init__(self, path, ttl=30, stale=120):
+        self.path = path
+        self.ttl = ttl
+        self.stale = stale
+
+    def _trusted(self, stat):
+        '''
+        whether a file (its os.stat) can be loaded: owned by the current user or by the owner of the folder,
+        and not writable by the group or the others
+        '''
+        if stat.st_mode & 0o022:
+            return False
+        if stat.st_uid == os.getuid():
+            return True
+        try:
+            return stat.st_uid == os.stat(os.path.dirname(self.path)).st_uid
+        except OSError:
+            return False
+
+    def _read(self):
+        try:
+            with open(self.path, 'rb') as f:
+                if not self._trusted(os.fstat(f.fileno())):
+                    return None
+                return pickle.load(f)
+        except Exception:
+            return None
+
+    def _write(self, entry):
+        # other users of the account read the file, only its writer can change it (see _trusted)
+        tmp_file = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            os.fchmod(fd, 0o644)
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, self.path)
+        except (OSError, pickle.PicklingError, TypeError, AttributeError):
+            # the cache is optional (e.g. $SKYWAYROOT/run is not writable, or the value cannot be pickled)
+            try:
+                os.remove(tmp_file)
+            except OSError:
+                pass
+
+    def _lock(self, blocking=True):
+        '''
+        take the lock file of the cache, return its file descriptor, or None if not available
+        '''
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            fd = os.open(self.path + '.lock', os.O_RDWR | os.O_CREAT, 0o666)
+        except OSError:
+            try:
+                fd = os.open(self.path + '.lock', os.O_RDONLY)
+            except OSError:
+                return None
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return None
+        return fd
+
+    def _unlock(self, fd):
+        if fd is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _refresh(self, compute, started):
+        value = compute()
+        # do not overwrite an invalidation made while computing
+        entry = self._read()
+        if entry is not None and entry.get('invalidated', 0) > started:
+            return value
+        self._write({ 'time': started, 'value': value })
+        return value
+
+    def _revalidate(self, compute, lock=None):
+        # the lock of the caller is taken before the lock file, in the same order as the callers holding it
+        if lock is not None:
+            with lock:
+                return self._revalidate(compute)
+
+        # only one process refreshes the value, the others keep using the stale one
+        fd = self._lock(blocking=False)
+        if fd is None:
+            return
+        try:
+            entry = self._read()
+            if entry is None or time.time() - entry['time'] >= self.ttl:
+                self._refresh(compute, time.time())
+        except Exception:
+            pass
+        finally:
+            self._unlock(fd)
+
+    def get(self, compute, lock=None):
+        '''
+        return (value, age in seconds), calling compute() if the cached value is missing or too old;
+        lock (e.g. Cloud.call_lock) is held by the background refresh while calling compute()
+        '''
+        entry = self._read()
+        if entry is not None:
+            age = time.time() - entry['time']
+            if age < self.ttl:
+                return entry['value'], age
+            if age < self.ttl + self.stale:
+                # a daemon thread: a one-shot command (e.g. skyway list) does not wait for the refresh at exit
+                threading.Thread(target=self._revalidate, args=(compute, lock), daemon=True).start()
+                return entry['value'], age
+
+        fd = self._lock()
+        try:
+            # another process may have computed the value while waiting for the lock
+            entry = self._read()
+            if entry is not None and time.time() - entry['time'] < self.ttl:
+                return entry['value'], time.time() - entry['time']
+            return self._refresh(compute, time.time()), 0.0
+        finally:
+            self._unlock(fd)
+
+    def invalidate(self):
+        '''
+        mark the cached value as outdated
+        '''
+        self._write({ 'time': 0, 'invalidated': time.time(), 'value': None })
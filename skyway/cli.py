@@ -0,0 +1,812 @@
+# Copyright (c) 2019-2024 The University of Chicago.
+# Part of skyway, released under the BSD 3-Clause License.
+
+# Maintainer: Trung Nguyen, Yuxing Peng
+
+"""@package docstring
+The skyway command line interface: one entry point (bin/skyway) with subcommands
+
+  skyway alloc       -A rcc-aws --constraint=t1 -t 01:00:00 -J my-run [--no-wait] [--spot]
+  skyway status      [job ID]
+  skyway interactive -A rcc-aws --constraint=t1 -t 01:00:00 -J my-run
+  skyway batch       job.sh
+  skyway run         job.sh [--max-resubmit 3]
+  skyway execute     -A rcc-aws -J my-run job.sh
+  skyway transfer    -A rcc-aws -J my-run data.tgz
+  skyway connect     -A rcc-aws -J my-run
+  skyway cancel      -A rcc-aws my-run
+  skyway list        -A rcc-aws
+  skyway list        --all [--format jsonl]
+  skyway nodetypes   -A rcc-aws
+  skyway usage       -A rcc-aws --byjob [--since 2024-06] [--limit 20] [--format csv]
+  skyway ledger      migrate -A rcc-aws
+  skyway ledger      verify -A rcc-aws
+  skyway ledger      archive
+  skyway pool        list -A rcc-aws
+  skyway pool        fill [-A rcc-aws]
+  skyway catalog     [-A rcc-gcp] [--refresh]
+  skyway usage       --report --since 2023-07 --until 2024-06
+  skyway advisor     job.sh
+
+The former bin/skyway_* scripts are kept as thin wrappers of these subcommands.
+"""
+
+import argparse
+from datetime import datetime
+import os
+import shlex
+import sys
+
+import colorama
+from colorama import Fore
+from tabulate import tabulate
+
+from . import account, cloud, daemon
+
+# the vendors whose drivers create nodes in another region than the account region (--region)
+region_vendors = ['aws']
+
+def check_region(account_name, region):
+    '''
+    raise an exception if a region is given for an account whose driver does not take one
+    '''
+    if region == "" or region is None:
+        return
+    vendor_name = cloud.get_vendor(account_name)
+    if vendor_name not in region_vendors:
+        raise Exception(f"Account {account_name} ({vendor_name}) does not support --region, "
+                        f"only the {', '.join(region_vendors)} accounts do.")
+
+class InstanceDescriptor:
+    """
+    A job (a node with a job name) under an account: allocation, transfer, execution and termination
+    all go through the same driver instance
+    """
+    def __init__(self, jobname: str, account_name: str, node_type="", walltime="", region="", spot=False):
+        self.jobname = jobname
+        self.account_name = account_name
+        self.node_type = node_type
+        self.walltime = walltime
+        self.region = region
+        self.spot = spot
+
+        # the vendor is the cloud: entry of the account file
+        self.vendor_name = cloud.get_vendor(account_name)
+        check_region(account_name, region)
+
+        # served by skywayd if it is running, otherwise only the driver of the account's vendor (and its SDK) is imported
+        self.account = daemon.create(account_name)
+
+        self.user = os.environ['USER']
+
+    def submitJob(self, need_confirmation=False, interactive=False):
+        print(Fore.BLUE + f"Requesting nodes from {self.vendor_name} with account {self.account_name}")
+        # only the drivers of multi-region accounts (aws) take a region (see check_region)
+        kwargs = {}
+        if self.region != "":
+            kwargs['region'] = self.region
+        # spot/preemptible nodes from the cloud drivers only
+        if self.spot == True:
+            if self.account.onpremises == True:
+                raise Exception(f"Account {self.account_name} is on-premises, it has no spot nodes.")
+            kwargs['spot'] = True
+        nodes = self.account.create_nodes(self.node_type,
+                                          [self.jobname],
+                                          need_confirmation=need_confirmation,
+                                          walltime=self.walltime,
+                                          interactive=interactive,
+                                          **kwargs)
+        return nodes
+
+    def getNodeID(self):
+        '''
+        the ID used by the driver to refer to the node of this job
+        '''
+        if self.account.onpremises == True:
+            # for on-premises like midway3 the node ID is the host ip (which happens to be the node name)
+            return self.account.get_host_ip(self.jobname)
+        if self.vendor_name == 'azure':
+            # the azure driver refers to the nodes by their names
+            return self.jobname
+        return self.account.get_instance_ID(self.jobname)
+
+    def connectJob(self):
+        self.account.connect_node(self.getNodeID())
+
+    def checkInterruption(self):
+        '''
+        the reason why the spot node of this job was interrupted by the vendor, None if it was not (or is not a spot node);
+        the interrupted node is terminated and its usage recorded by the driver
+        '''
+        if self.spot == False:
+            return None
+        return self.account.check_interruption(self.jobname)
+
+    def execute(self, script_name):
+        # execute the commands listed in the script on the compute node
+        self.account.execute_script(self.getNodeID(), script_name)
+
+    def transferData(self, local_data, from_cloud=False, cloud_path=""):
+        if self.account.onpremises == True:
+            print("The on-premises nodes share the file systems of the login nodes, no data transfer needed.")
+            return
+
+        node_info = self.account.get_node_connection_info(self.getNodeID())
+        private_key = node_info['private_key']
+        remote = node_info['login']
+        local = ' '.join(local_data)
+
+        if from_cloud == True:
+            # copy from cloud
+            cmd = f"scp -rC -i {private_key} -o StrictHostKeyChecking=accept-new {remote}:{cloud_path} {local_data[0]}"
+        else:
+            # copy to cloud
+            if cloud_path == "":
+                cmd = f"scp -rC -i {private_key} -o StrictHostKeyChecking=accept-new {local} {remote}:~/"
+            else:
+                cmd = f"scp -rC -i {private_key} -o StrictHostKeyChecking=accept-new {local} {remote}:/{cloud_path}"
+
+        print(f"Executing: {cmd}")
+        os.system(cmd)
+
+    def terminateJob(self, node_names=[], instance_id=""):
+        if self.account.onpremises == True:
+            instanceID = self.account.get_instance_ID(self.jobname)
+            self.account.destroy_nodes(IDs=[instanceID], need_confirmation=False)
+        elif instance_id != "":
+            self.account.destroy_nodes(IDs=[instance_id], need_confirmation=False)
+        else:
+            self.account.destroy_nodes(node_names=node_names, need_confirmation=False)
+
+    def getBalance(self):
+        # retrieve from database for the given account
+        accumulating_cost, remaining_balance = self.account.get_cost_and_usage_from_db(user_name=self.user)
+        return remaining_balance
+
+    def getEstimateCost(self):
+        pt = datetime.strptime(self.walltime, "%H:%M:%S")
+        walltime_in_hours = int(pt.hour + pt.minute/60)
+        if self.account.onpremises == True:
+            unit_price = 1.0 # float(self.account.get_unit_price(self.node_type))
+        else:
+            unit_price = float(self.account.get_unit_price(self.node_type))
+        cost = walltime_in_hours * unit_price
+        return cost
+
+    def getUsage(self, user_name):
+        # retrieve from database for the given account
+        user_budget = self.account.get_budget(user_name=user_name, verbose=False)
+        accumulating_cost, remaining_balance = self.account.get_cost_and_usage_from_db(user_name=user_name)
+        return user_budget, accumulating_cost, remaining_balance
+
+    def getUsageHistory(self, user_name):
+        df = self.account.get_usage_history_from_db(user_name=user_name)
+        return df
+
+    def list_nodes(self):
+        # shared with the other commands and the dashboard for a few seconds (see skyway.cache)
+        return self.account.list_nodes_cached()
+
+'''
+   parse the job script to get the account information, node type (constraint) and walltime,
+   and the skyway command (e.g. skyway_transfer data.tgz) to run once the node is ready
+'''
+def parse_script(filename):
+    jobname = "my-run"
+    account = ""
+    constraint = ""
+    walltime = ""
+    region = ""
+    spot = False
+    skyway_cmd = ""
+    with open(filename, 'r') as f:
+        lines = f.readlines()
+        for line in lines:
+            # extract only lines with #SBATCH, remove \n characters
+            # remove all the spaces
+            # split at '='
+            if "#SBATCH" in line:
+                # remove #SBATCH
+                line = line.replace('#SBATCH ','').strip('\n')
+                line = line.replace(' ','')
+                args = line.split('=')
+                if len(args) == 2:
+                    if args[0] == "--job-name" or args[0] == "-job-name":
+                        jobname = args[1]
+                    if args[0] == "--account":
+                        account = args[1]
+                    if args[0] == "--constraint":
+                        constraint = args[1]
+                    if args[0] == "--time":
+                        walltime = args[1]
+                    if args[0] == "--region":
+                        region = args[1]
+                elif args[0] == "--spot":
+                    spot = True
+            elif "skyway_" in line or line.startswith("skyway "):
+                skyway_cmd = line.strip('\n')
+            else:
+                continue
+
+    return { 'jobname': jobname,
+             'account': account,
+             'constraint': constraint,
+             'walltime': walltime,
+             'region': region,
+             'spot': spot,
+             'skyway_cmd': skyway_cmd
+            }
+
+def run_skyway_cmd(skyway_cmd, instanceDescriptor):
+    '''
+    run the skyway command of a job script (e.g. skyway_transfer data.tgz, or skyway transfer data.tgz)
+    in this process, on the driver of the job
+    '''
+    words = shlex.split(skyway_cmd)
+    command = os.path.basename(words[0])
+    if command == "skyway":
+        argv = words[1:]
+    else:
+        argv = [command.replace("skyway_", "", 1)] + words[1:]
+
+    # append the command with account and job name
+    argv += ["--account=" + instanceDescriptor.account_name, "-J", instanceDescriptor.jobname]
+    args = build_parser().parse_args(argv)
+    return args.func(args, instanceDescriptor)
+
+def get_descriptor(args, instanceDescriptor=None, node_type="", walltime="", region="", spot=False):
+    '''
+    the job given on the command line, reusing the job (and its driver) of the caller if any
+    '''
+    if instanceDescriptor is not None:
+        return instanceDescriptor
+    return InstanceDescriptor(args.jobname, args.account, node_type, walltime, region, spot)
+
+def run_job(instanceDescriptor, job, script, max_resubmit=0, terminate=False):
+    '''
+    allocate the node of a job script, run its skyway command and execute the script on the node,
+    then terminate the node if terminate is True (even if the transfer or the execution fails);
+    the job of a spot node interrupted by the vendor is resubmitted, at most max_resubmit times
+    '''
+    attempt = 0
+    while True:
+        nodes = instanceDescriptor.submitJob()
+        if not nodes:
+            return 1
+
+        interruption = None
+        try:
+            try:
+                # execute pre-execute commands after nodes are available: e.g. data transfers
+                if job['skyway_cmd'] != "":
+                    run_skyway_cmd(job['skyway_cmd'], instanceDescriptor)
+                instanceDescriptor.execute(script)
+            finally:
+                # the execution ends (or fails) when the node is interrupted
+                interruption = instanceDescriptor.checkInterruption()
+        except Exception:
+            if interruption is None:
+                raise
+        finally:
+            if terminate == True and interruption is None:
+                print(Fore.BLUE + f"Terminating {instanceDescriptor.jobname}")
+                instanceDescriptor.terminateJob(node_names=[instanceDescriptor.jobname])
+
+        if interruption is None:
+            return 0
+
+        print(Fore.RED + f"The node of {instanceDescriptor.jobname} was interrupted: {interruption}")
+        if attempt >= max_resubmit:
+            print(f"The job was resubmitted {attempt} times (--max-resubmit), giving up.")
+            return 1
+        attempt += 1
+        print(Fore.BLUE + f"Resubmitting {instanceDescriptor.jobname} ({attempt}/{max_resubmit})")
+
+# subcommands
+
+def cmd_alloc(args, instanceDescriptor=None):
+    if args.no_wait == True and instanceDescriptor is None:
+        # created by a background worker, see skyway.jobs
+        from . import jobs
+        check_region(args.account, args.region)
+        job_id = jobs.submit(args.account, args.jobname, args.constraint, args.walltime, args.region, args.spot)
+        print(f"Submitted job {job_id} ({args.jobname} under {args.account}), check its state with: skyway status {job_id}")
+        return
+
+    instanceDescriptor = get_descriptor(args, instanceDescriptor, args.constraint, args.walltime, args.region, args.spot)
+    instanceDescriptor.submitJob(need_confirmation=True, interactive=True)
+
+def cmd_interactive(args, instanceDescriptor=None):
+    instanceDescriptor = get_descriptor(args, instanceDescriptor, args.constraint, args.walltime, args.region, args.spot)
+    nodes = instanceDescriptor.submitJob(need_confirmation=True, interactive=True)
+    if nodes:
+        instanceDescriptor.connectJob()
+
+def cmd_batch(args, instanceDescriptor=None):
+    job = parse_script(args.script)
+    instanceDescriptor = InstanceDescriptor(job['jobname'], job['account'], job['constraint'], job['walltime'], job['region'], job['spot'])
+    return run_job(instanceDescriptor, job, args.script, max_resubmit=args.max_resubmit)
+
+def cmd_run(args, instanceDescriptor=None):
+    job = parse_script(args.script)
+    instanceDescriptor = InstanceDescriptor(job['jobname'], job['account'], job['constraint'], job['walltime'], job['region'], job['spot'])
+    return run_job(instanceDescriptor, job, args.script, max_resubmit=args.max_resubmit, terminate=True)
+
+def cmd_execute(args, instanceDescriptor=None):
+    instanceDescriptor = get_descriptor(args, instanceDescriptor)
+
+    # execute pre-launch commands: e.g. data transfers
+    job = parse_script(args.script)
+    if job['skyway_cmd'] != "":
+        run_skyway_cmd(job['skyway_cmd'], instanceDescriptor)
+
+    instanceDescriptor.execute(args.script)
+
+def cmd_transfer(args, instanceDescriptor=None):
+    instanceDescriptor = get_descriptor(args, instanceDescriptor)
+    instanceDescriptor.transferData(args.data, from_cloud=args.from_cloud, cloud_path=args.cloud_path)
+
+def cmd_connect(args, instanceDescriptor=None):
+    instanceDescriptor = get_descriptor(args, instanceDescriptor)
+    print(Fore.BLUE + f"Connecting to {instanceDescriptor.jobname}")
+    instanceDescriptor.connectJob()
+
+def cmd_cancel(args, instanceDescriptor=None):
+    if len(args.names) > 0:
+        args.jobname = args.names[0]
+    if args.jobname == "" and args.instance_id == "":
+        print("Need a job name or an instance id to proceed")
+        return 1
+
+    instanceDescriptor = get_descriptor(args, instanceDescriptor)
+    instanceDescriptor.terminateJob(node_names=[instanceDescriptor.jobname], instance_id=args.instance_id)
+
+# the columns of the listings: some drivers (e.g. Azure, OCI, SLURM) do not give the user
+node_headers = ['Name', 'User', 'Status', 'Type', 'Instance ID', 'Host', 'Elapsed Time', 'Running Cost']
+
+def node_rows(nodes):
+    return [list(node) if len(node) == len(node_headers) else [node[0], ""] + list(node[1:]) for node in nodes]
+
+def cmd_list(args, instanceDescriptor=None):
+    if args.all == True:
+        return list_all_accounts(args)
+
+    instanceDescriptor = get_descriptor(args, instanceDescriptor)
+
+    # listing all the running nodes/instances
+    headers = node_headers
+
+    nodes = node_rows(instanceDescriptor.list_nodes())
+
+    if nodes:
+        import pandas as pd
+        df = pd.DataFrame(nodes, columns=headers)
+        df.style.hide(axis="index")
+        print(df)
+    else:
+        print(tabulate([], headers=headers))
+        print("")
+
+def list_all_accounts(args):
+    '''
+    list the nodes of all the accounts, args.jobs accounts at a time, each given args.timeout seconds
+    '''
+    import threading
+    import time
+
+    results = {}
+    finished = []
+    changed = threading.Condition()
+    def list_account(account_name):
+        try:
+            result = ('ok', node_rows(daemon.create(account_name).list_nodes_cached()))
+        except Exception as e:
+            result = ('error', f"{type(e).__name__}: {e}")
+        with changed:
+            # ignored if the account has timed out
+            results.setdefault(account_name, result)
+            finished.append(account_name)
+            changed.notify()
+
+    account_names = account.accounts()
+    pending = list(account_names)
+    # the accounts being listed, with their start time: the accounts that timed out stay here
+    # until their thread returns, so that they keep counting against args.jobs
+    running = {}
+    with changed:
+        while True:
+            for account_name in finished:
+                del running[account_name]
+            finished.clear()
+
+            now = time.time()
+            for account_name, start in running.items():
+                if now - start > args.timeout:
+                    results.setdefault(account_name, ('error', f"timed out after {args.timeout} seconds"))
+
+            # all the threads are stuck on accounts that timed out: give up on the other accounts
+            if len(pending) > 0 and len(running) >= args.jobs and all(account_name in results for account_name in running):
+                for account_name in pending:
+                    results[account_name] = ('error', f"not listed, {len(running)} accounts did not respond")
+                pending = []
+
+            while len(pending) > 0 and len(running) < args.jobs:
+                account_name = pending.pop(0)
+                # daemon threads: an account that does not respond does not keep the command from exiting
+                threading.Thread(target=list_account, args=(account_name,), daemon=True).start()
+                running[account_name] = time.time()
+
+            starts = [start for account_name, start in running.items() if account_name not in results]
+            if len(starts) == 0:
+                break
+            # woken up when an account is listed, or when the oldest one times out
+            changed.wait(max(0, min(starts) + args.timeout - time.time()))
+
+    errors = [[account_name, results[account_name][1]] for account_name in account_names if results[account_name][0] == 'error']
+
+    if args.format == 'jsonl':
+        import json
+        for account_name in account_names:
+            status, value = results[account_name]
+            if status == 'error':
+                sys.stdout.write(json.dumps({ 'Account': account_name, 'Error': value }) + '\n')
+                continue
+            for node in value:
+                sys.stdout.write(json.dumps(dict(zip(['Account'] + node_headers, [account_name] + node)), default=str) + '\n')
+    else:
+        data = []
+        for account_name in account_names:
+            if results[account_name][0] == 'ok':
+                data += [[account_name] + node for node in results[account_name][1]]
+        print(tabulate(data, headers=['Account'] + node_headers))
+        print("")
+        if len(errors) > 0:
+            print(tabulate(errors, headers=['Account', 'Error']))
+            print("")
+
+    return 1 if len(errors) > 0 else 0
+
+def cmd_status(args, instanceDescriptor=None):
+    '''
+    the states of the jobs submitted with skyway alloc --no-wait (or from the dashboard), from the job store
+    '''
+    from . import jobs
+    store = jobs.JobStore()
+    states = None if args.state is None else [args.state]
+    job_list = store.list(job_id=args.job_id, account_name=args.account or None, states=states, limit=args.limit)
+    if args.job_id is not None and len(job_list) == 0:
+        print(f"Job {args.job_id} is not found.")
+        return 1
+
+    data = []
+    for job in job_list:
+        data.append([job['id'], job['account'], job['jobname'], job['node_type'], job['state'],
+                     ', '.join(job['nodes']), job['submitted'], job['updated'], job['message'] or ""])
+    print(tabulate(data, headers=jobs.columns))
+    print("")
+
+def cmd_nodetypes(args, instanceDescriptor=None):
+    instanceDescriptor = get_descriptor(args, instanceDescriptor)
+    print(Fore.GREEN + f"Available node types under {instanceDescriptor.account_name}")
+    instanceDescriptor.account.get_node_types()
+
+def cmd_usage(args, instanceDescriptor=None):
+    if args.report == True:
+        return usage_report(args)
+
+    if args.username is None:
+        args.username = os.environ['USER']
+    args.jobname = ""
+    instanceDescriptor = get_descriptor(args, instanceDescriptor)
+
+    # usage
+    headers=["User", 'Allocation', 'Usage', 'Balance']
+    user_budget, usage, balance = instanceDescriptor.getUsage(args.username)
+
+    data = [[args.username, user_budget, usage, balance]]
+    print(tabulate(data, headers=headers))
+
+    if args.byjob == True:
+        print("")
+        print_usage_history(args)
+
+def print_usage_history(args):
+    '''
+    stream the records of a user from the usage ledger to stdout (table, csv or jsonl),
+    one batch at a time so that the memory use does not depend on the size of the history
+    '''
+    from . import ledger
+    usage_ledger = ledger.open_ledger(args.account)
+    records = usage_ledger.query(args.username, since=args.since, until=args.until, instance_type=args.instance_type,
+                                 limit=args.limit, offset=args.offset)
+    headers = ['User', 'InstanceID', 'InstanceType', 'Start', 'End', 'Cost']
+
+    if args.format == 'csv':
+        import csv
+        writer = csv.writer(sys.stdout)
+        writer.writerow(headers)
+        for record in records:
+            writer.writerow(record)
+
+    elif args.format == 'jsonl':
+        import json
+        for record in records:
+            sys.stdout.write(json.dumps(dict(zip(headers, record))) + '\n')
+
+    else:
+        # fixed column widths: the rows are printed as they are read
+        row_format = "{:<12} {:<24} {:<16} {:<32} {:<32} {:>10}"
+        print(row_format.format(*headers))
+        print(row_format.format(*['-' * n for n in [12, 24, 16, 32, 32, 10]]))
+        for user, instance_id, instance_type, start, end, cost in records:
+            print(row_format.format(user, str(instance_id), str(instance_type), str(start), str(end), f"{cost:0.5f}"))
+
+    usage_ledger.close()
+
+def usage_report(args):
+    '''
+    cost and number of nodes per account and user (or per month) from the usage archive
+    '''
+    from . import archive
+    accounts = [args.account] if args.account != "" else []
+    users = [args.username] if args.username is not None else []
+    data, columns = archive.report(accounts=accounts, users=users, since=args.since, until=args.until, by=args.by)
+
+    headers = [c.capitalize() for c in columns]
+    total_cost = sum(row[-2] for row in data)
+    total_nodes = sum(row[-1] for row in data)
+    data.append(['Total'] + [''] * (len(columns) - 3) + [total_cost, total_nodes])
+    print(tabulate(data, headers=headers, floatfmt='.2f'))
+
+def cmd_ledger(args, instanceDescriptor=None):
+    from . import ledger
+
+    if args.action == 'archive':
+        # all the accounts by default (e.g. from a cron job)
+        from . import archive
+        account_names = [args.account] if args.account != "" else account.accounts()
+        for account_name in account_names:
+            count = archive.export_account(account_name)
+            print(f"{account_name}: {count} usage records archived to {archive.archive_path()}")
+        return
+
+    usage_ledger = ledger.open_ledger(args.account)
+
+    if args.action == 'migrate':
+        pkl_file = ledger.pickle_path(args.account)
+        if not os.path.isfile(pkl_file):
+            print(f"Usage history {pkl_file} is not available")
+            return 1
+        count = usage_ledger.import_pickle(pkl_file)
+        print(f"Imported {count} usage records from {pkl_file} into {usage_ledger.db_file}")
+
+    elif args.action == 'verify':
+        mismatches = usage_ledger.verify_totals()
+        if len(mismatches) > 0:
+            data = []
+            for user, cost, actual_cost, records, actual_records in mismatches:
+                data.append([user if user is not None else "(account)", cost, actual_cost, records, actual_records])
+            print(tabulate(data, headers=['User', 'Total', 'Recomputed', 'Records', 'Recomputed']))
+            print(f"Run: skyway ledger rebuild -A {args.account}")
+            usage_ledger.close()
+            return 1
+        print(f"Totals are consistent with the records, account total: {usage_ledger.account_cost():0.5f}")
+
+    elif args.action == 'rebuild':
+        usage_ledger.rebuild_totals()
+        print(f"Totals recomputed, account total: {usage_ledger.account_cost():0.5f}")
+
+    usage_ledger.close()
+
+def cmd_pool(args, instanceDescriptor=None):
+    from . import utils
+
+    # all the accounts with a warm pool by default (e.g. from a cron job)
+    account_names = [args.account] if args.account != "" else account.accounts()
+    for account_name in account_names:
+        account_cfg, _ = utils.load_account_config(account_name)
+        if args.account == "" and not account_cfg['account'].get('warm_pool'):
+            continue
+        acct = daemon.create(account_name)
+        print(Fore.BLUE + f"Warm pool of {account_name}")
+
+        if args.action == 'fill':
+            acct.fill_pool()
+            continue
+
+        sizes = acct.get_pool_sizes()
+        states = {}
+        for instance in acct.get_pool_instances():
+            node_type = acct.get_pool_node_type(instance)
+            state = acct.get_instance_keys(instance)[3]
+            states.setdefault(node_type, []).append(state)
+        data = []
+        for node_type in sorted(set(sizes) | set(states)):
+            stopped = states.get(node_type, []).count('stopped')
+            data.append([node_type, sizes.get(node_type, 0), stopped, len(states.get(node_type, [])) - stopped])
+        print(tabulate(data, headers=['Node Type', 'Pool Size', 'Ready (stopped)', 'Preparing']))
+        print("")
+
+def cmd_catalog(args, instanceDescriptor=None):
+    # all the accounts by default (e.g. from a cron job)
+    account_names = [args.account] if args.account != "" else account.accounts()
+    for account_name in account_names:
+        # only the drivers of the vendors in use are imported
+        if cloud.get_vendor(account_name) not in cloud.vendors:
+            continue
+        acct = daemon.create(account_name)
+        metadata = acct.get_metadata(refresh=args.refresh)
+        if len(metadata) == 0:
+            continue
+
+        data = []
+        for entry, value in metadata.items():
+            if isinstance(value, dict):
+                value = ', '.join(str(name) for name in value)
+            elif hasattr(value, 'name'):
+                value = value.name
+            data.append([entry, value])
+        print(Fore.BLUE + f"Vendor metadata of {account_name}")
+        print(tabulate(data, headers=['Entry', 'Value']))
+        print("")
+
+def cmd_advisor(args, instanceDescriptor=None):
+    print(Fore.GREEN + "Skyway Advisor")
+    job = parse_script(args.script)
+    node_type = job['constraint']
+
+    data = []
+    # iterate through the accounts that the group rcc have access to and find the similar node types
+    for acct_name in account.accounts():
+        if "rcc" in acct_name:
+            # only the drivers of the vendors in use are imported
+            if cloud.get_vendor(acct_name) not in cloud.vendors:
+                continue
+            acct = daemon.create(acct_name)
+            if node_type in acct.vendor['node-types']:
+                data.append([acct_name,
+                             acct.vendor['node-types'][node_type]['name'],
+                             acct.vendor['node-types'][node_type]['price'],
+                             acct.onpremises,
+                            ])
+
+    print(f"Available accounts and instances for {args.script}:")
+    print(tabulate(data, headers=['Account', 'Instance Type', 'Per-hour Cost', 'On-premises']))
+    print("")
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='skyway', description="Skyway: run jobs on cloud accounts and on-premises allocations")
+    subparsers = parser.add_subparsers(dest='command', metavar='command')
+
+    # options shared by the subcommands that operate on a job
+    def add_job_options(p, default_jobname="your-run"):
+        p.add_argument('-J', '--job-name', dest='jobname', default=default_jobname, help="Job name")
+        p.add_argument('-A', '--account', dest='account', default="", help="Account name")
+        p.add_argument('--provider', dest='provider', default="", help="Ignored, the vendor is read from the account file")
+
+    def add_node_options(p):
+        p.add_argument('--partition', dest='partition', default="", help="Partition")
+        p.add_argument('--constraint', dest='constraint', default="", help="Node type")
+        p.add_argument('-t', '--time', dest='walltime', default="", help="Walltime")
+        p.add_argument('--region', dest='region', default="", help="Region of the node (AWS accounts with several regions, default: the account region)")
+        p.add_argument('--spot', dest='spot', action='store_true', default=False,
+                       help="Spot/preemptible node: cheaper, but the vendor may interrupt it at any time")
+
+    p = subparsers.add_parser('alloc', help="allocate/provision an instance")
+    add_job_options(p, "my-run")
+    add_node_options(p)
+    p.add_argument('--no-wait', dest='no_wait', action='store_true', default=False,
+                   help="Return right away (without confirmation), the instance is created in the background (see skyway status)")
+    p.set_defaults(func=cmd_alloc)
+
+    p = subparsers.add_parser('interactive', help="allocate an instance and connect to it")
+    add_job_options(p)
+    add_node_options(p)
+    p.set_defaults(func=cmd_interactive)
+
+    p = subparsers.add_parser('batch', help="allocate an instance and execute a job script on it")
+    p.add_argument(dest='script', help="Job script")
+    p.add_argument('--max-resubmit', dest='max_resubmit', type=int, default=3,
+                   help="Times a job on a spot node (#SBATCH --spot) is resubmitted when the node is interrupted")
+    p.set_defaults(func=cmd_batch)
+
+    p = subparsers.add_parser('run', help="allocate an instance, transfer the data, execute a job script and terminate the instance")
+    p.add_argument(dest='script', help="Job script")
+    p.add_argument('--max-resubmit', dest='max_resubmit', type=int, default=3,
+                   help="Times a job on a spot node (#SBATCH --spot) is resubmitted when the node is interrupted")
+    p.set_defaults(func=cmd_run)
+
+    p = subparsers.add_parser('execute', help="execute a script on a running instance")
+    add_job_options(p)
+    p.add_argument(dest='script', help="Script to run")
+    p.set_defaults(func=cmd_execute)
+
+    p = subparsers.add_parser('transfer', help="transfer data to or from a running instance")
+    add_job_options(p)
+    p.add_argument('--from-cloud', dest='from_cloud', action='store_true', default=False, help="Copy data from cloud if specified")
+    p.add_argument('--cloud-path', dest='cloud_path', default="", help="Path to cloud space, empty for $HOME")
+    p.add_argument(dest='data', nargs='*', default=[], help="Data to transfer to the VM")
+    p.set_defaults(func=cmd_transfer)
+
+    p = subparsers.add_parser('connect', help="connect to a running instance")
+    add_job_options(p)
+    p.set_defaults(func=cmd_connect)
+
+    p = subparsers.add_parser('cancel', help="cancel/terminate an instance")
+    add_job_options(p, "")
+    p.add_argument('-i', '--instance-id', dest='instance_id', default="", help="Instance ID")
+    p.add_argument(dest='names', nargs='*', default=[], help="Job name to cancel")
+    p.set_defaults(func=cmd_cancel)
+
+    p = subparsers.add_parser('status', help="show the state of the jobs submitted with alloc --no-wait")
+    p.add_argument(dest='job_id', type=int, nargs='?', default=None, help="Job ID (all the recent jobs if not given)")
+    p.add_argument('-A', '--account', dest='account', default="", help="Account name")
+    p.add_argument('--state', dest='state', choices=['pending', 'running', 'ready', 'failed'], default=None, help="Show only the jobs in this state")
+    p.add_argument('--limit', dest='limit', type=int, default=20, help="Show at most this number of jobs")
+    p.set_defaults(func=cmd_status)
+
+    p = subparsers.add_parser('list', help="list the running instances of an account")
+    add_job_options(p)
+    p.add_argument('--all', dest='all', action='store_true', default=False, help="List the instances of all the accounts")
+    p.add_argument('--jobs', dest='jobs', type=int, default=8, help="Number of accounts listed at the same time with --all")
+    p.add_argument('--timeout', dest='timeout', type=float, default=60, help="Seconds given to each account with --all")
+    p.add_argument('--format', dest='format', choices=['table', 'jsonl'], default='table', help="Output format with --all")
+    p.set_defaults(func=cmd_list)
+
+    p = subparsers.add_parser('nodetypes', help="list the node types of an account")
+    add_job_options(p)
+    p.add_argument('--partition', dest='partition', default="", help="Partition")
+    p.set_defaults(func=cmd_nodetypes)
+
+    p = subparsers.add_parser('usage', help="usage of a user under an account")
+    p.add_argument('-u', '--user', dest='username', default=None, help="User name (default: $USER, all users with --report)")
+    p.add_argument('-A', '--account', dest='account', default="", help="Account name (all accounts with --report if not given)")
+    p.add_argument('--byjob', dest='byjob', action='store_true', default=False, help="Show jobs if specified")
+    p.add_argument('--report', dest='report', action='store_true', default=False, help="Cost report from the usage archive")
+    p.add_argument('--since', dest='since', default=None, help="First month (YYYY-MM) of the report, or first day (YYYY-MM-DD) of the jobs")
+    p.add_argument('--until', dest='until', default=None, help="Last month (YYYY-MM) of the report, or last day (YYYY-MM-DD) of the jobs")
+    p.add_argument('--instance-type', dest='instance_type', default=None, help="Show only the jobs of an instance type")
+    p.add_argument('--limit', dest='limit', type=int, default=None, help="Show at most this number of jobs")
+    p.add_argument('--offset', dest='offset', type=int, default=0, help="Skip this number of (most recent) jobs")
+    p.add_argument('--format', dest='format', choices=['table', 'csv', 'jsonl'], default='table', help="Output format of the jobs")
+    p.add_argument('--by', dest='by', choices=['user', 'month'], default='user', help="Report per account and user, or per account and month")
+    p.add_argument('--provider', dest='provider', default="", help="Ignored, the vendor is read from the account file")
+    p.set_defaults(func=cmd_usage)
+
+    p = subparsers.add_parser('ledger', help="maintain the usage ledger of an account")
+    p.add_argument(dest='action', choices=['migrate', 'verify', 'rebuild', 'archive'],
+                   help="migrate: import the records of usage-[account].pkl, verify: check the per-user totals against the records, "
+                        "rebuild: recompute the totals, archive: export the new records to the Parquet usage archive")
+    p.add_argument('-A', '--account', dest='account', default="", help="Account name (all accounts for archive if not given)")
+    p.set_defaults(func=cmd_ledger)
+
+    p = subparsers.add_parser('pool', help="show or fill the warm pool of stopped instances of an account")
+    p.add_argument(dest='action', choices=['list', 'fill'],
+                   help="list: the instances of the warm pool per node type, fill: launch the missing instances of the pool")
+    p.add_argument('-A', '--account', dest='account', default="", help="Account name (all the accounts with a warm pool if not given)")
+    p.set_defaults(func=cmd_pool)
+
+    p = subparsers.add_parser('catalog', help="show the vendor metadata (locations, sizes, subnets, images) cached for the accounts")
+    p.add_argument('-A', '--account', dest='account', default="", help="Account name (all the accounts if not given)")
+    p.add_argument('--refresh', dest='refresh', action='store_true', default=False, help="List the metadata from the vendor API again")
+    p.set_defaults(func=cmd_catalog)
+
+    p = subparsers.add_parser('advisor', help="list the accounts providing the node type of a job script")
+    p.add_argument(dest='script', help="Job script")
+    p.set_defaults(func=cmd_advisor)
+
+    return parser
+
+def main(argv=None):
+    colorama.init(autoreset=True)
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 1
+
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
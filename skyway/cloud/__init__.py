@@ -0,0 +1,50 @@
+# Copyright (c) 2019-2024 The University of Chicago.
+# Part of skyway, released under the BSD 3-Clause License.
+
+# Maintainer: Yuxing Peng, Trung Nguyen
+
+import os
+from importlib import import_module
+
+from .. import utils
+
+# vendor registry: maps the cloud: key of an account .yaml file to the driver module
+# under skyway/cloud/ and the driver class in that module.
+# A driver module (and the vendor SDK it wraps) is only imported when an account of that vendor is used,
+# so that e.g. skyway_usage with a SLURM account does not pay for importing boto3, libcloud, azure or oci.
+vendors = {
+    'aws'   : ('aws',   'AWS'),
+    'gcp'   : ('gcp',   'GCP'),
+    'azure' : ('azure', 'AZURE'),
+    'oci'   : ('oci',   'OCI'),
+    'slurm' : ('slurm', 'SLURMCluster'),
+}
+
+def get_vendor(account_name: str):
+    '''
+    get the cloud vendor (the cloud: key) of an account from $SKYWAYROOT/etc/accounts/[account_name].yaml
+    '''
+    account_path = os.environ['SKYWAYROOT'] + '/etc/accounts/'
+    account_cfg = utils.load_config(account_name, account_path)
+    if 'cloud' not in account_cfg:
+        raise Exception(f'Cloud vendor is not specified for account {account_name}.')
+    return account_cfg['cloud'].lower()
+
+def get_driver_class(vendor: str):
+    '''
+    import the driver module of a vendor on demand and return the driver class
+    '''
+    vendor = vendor.lower()
+    if vendor not in vendors:
+        raise Exception(f'Cloud vendor {vendor} is undefined.')
+
+    module_name, class_name = vendors[vendor]
+    module = import_module('skyway.cloud.' + module_name)
+    return getattr(module, class_name)
+
+def create(account_name: str):
+    '''
+    create the driver object for an account, importing only the driver of the account's vendor
+    '''
+    cloud_class = get_driver_class(get_vendor(account_name))
+    return cloud_class(account_name)
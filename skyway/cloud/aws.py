@@ -7,26 +7,69 @@
 Documentation for AWS Class
 """
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 import io
 import logging
 import os
+import re
 import subprocess
+import time
 from tabulate import tabulate
 
+from .catalog import NodeTypeCatalog
 from .core import Cloud
 from .. import utils
 
 from colorama import Fore
-import pandas as pd
 
-# AWS python SDK
-import boto3
-
-# It is also possible to use libcloud EC2NodeDriver
-from libcloud.compute.types import Provider
-from libcloud.compute.providers import get_driver
-from libcloud.compute.drivers.ec2 import EC2NodeDriver
+# NOTE: the AWS python SDK (boto3) and pandas are imported where they are first used,
+#       so that constructing the driver, or running commands that do not call the API, stays cheap
+
+# the error codes of the launches for which another availability zone, region or instance type may have capacity
+capacity_errors = ['InsufficientInstanceCapacity', 'InsufficientHostCapacity', 'InsufficientCapacity', 'Unsupported']
+
+# the market options of the spot instances (create_nodes with spot=True): one-time requests at the current spot price
+# (capped by the on-demand price), the instances are terminated when AWS takes the capacity back
+spot_market_options = {
+    'MarketType' : 'spot',
+    'SpotOptions' : {
+        'SpotInstanceType' : 'one-time',
+        'InstanceInterruptionBehavior' : 'terminate',
+    }
+}
+
+# the status codes of the spot requests whose instance is about to be interrupted (the two-minute notice) or was
+spot_interruption_codes = ['marked-for-termination', 'marked-for-stop', 'instance-terminated-by-price',
+                           'instance-terminated-no-capacity', 'instance-terminated-capacity-oversubscribed']
+
+# the seconds the spot prices from the spot price history are kept by the driver
+spot_price_ttl = 600
+
+# the tag of the instances of the warm pool (the node type of the instance)
+pool_tag = 'SkywayPool'
+
+# the tag of the instances of the warm pool being claimed by a process (the token of the claim, see claim_pool_instances),
+# the claims older than pool_claim_ttl seconds are stale (the process claiming the instances died) and ignored
+pool_claim_tag = 'SkywayPoolClaim'
+pool_claim_ttl = 600
+
+# the seconds the claims are left to settle before they are checked (the tags are eventually consistent)
+pool_claim_settle = 2
+
+# the user-data of the instances of the warm pool: install a cloud-init per-boot script running the user-data
+# of the instance (replaced by create_nodes with the post-boot script of the node when the instance is claimed),
+# then power off (the instance stops and waits in the pool)
+pool_user_data = """#!/bin/bash
+cat > /var/lib/cloud/scripts/per-boot/skyway-user-data.sh << 'SCRIPT'
+#!/bin/bash
+TOKEN=$(curl -s -X PUT http://169.254.169.254/latest/api/token -H "X-aws-ec2-metadata-token-ttl-seconds: 300")
+curl -s -H "X-aws-ec2-metadata-token: $TOKEN" http://169.254.169.254/latest/user-data -o /run/skyway-user-data.sh
+bash /run/skyway-user-data.sh
+SCRIPT
+chmod 755 /var/lib/cloud/scripts/per-boot/skyway-user-data.sh
+shutdown -P now
+"""
 
 class AWS(Cloud):
     """Documentation for AWS Class
@@ -43,9 +86,10 @@ class AWS(Cloud):
 
         #super().__init__(vendor_cfg, kwargs)
 
-        # load [account].yaml under $SKYWAYROOT/etc/accounts
+        # load [account].yaml under $SKYWAYROOT/etc/accounts and the aws section of cloud.yaml under $SKYWAYROOT/etc/
+        # (validated and cached, see utils.load_account_config)
         account_path = os.environ['SKYWAYROOT'] + '/etc/accounts/'
-        account_cfg = utils.load_config(account, account_path)
+        account_cfg, vendor_cfg = utils.load_account_config(account)
         if account_cfg['cloud'] != 'aws' :
             raise Exception(f'Service provider aws is not associated with this account.')
 
@@ -53,45 +97,35 @@ class AWS(Cloud):
             setattr(self, k.replace('-','_'), v)
 
         self.usage_history = f"{account_path}usage-{account}.pkl"
+        self.usage_ledger = f"{account_path}usage-{account}.db"
 
-        # load cloud.yaml under $SKYWAYROOT/etc/
-        cloud_path = os.environ['SKYWAYROOT'] + '/etc/'
-        vendor_cfg = utils.load_config('cloud', cloud_path)
-        if 'aws' not in vendor_cfg:
-            raise Exception(f'Cloud vendor aws is undefined.')
-
-        self.vendor = vendor_cfg['aws']
+        self.vendor = vendor_cfg
+        # instance type -> price, cores, memory and GPUs of the node types in cloud.yaml
+        self.catalog = NodeTypeCatalog(vendor_cfg['node-types'])
         self.account_name = account
         self.onpremises = False
 
         # using_trusted_agent = False means that no use of master account key and secret as defined in cloud.yaml
         self.using_trusted_agent = False
-        if self.using_trusted_agent == False:
-            # This is how the existing skyway creates the ec2 resource without master for rcc-aws
-            self.ec2 = boto3.resource('ec2',
-                                       aws_access_key_id = self.account['access_key_id'],
-                                       aws_secret_access_key = self.account['secret_access_key'],
-                                       region_name = self.account['region'])
-        else:
-            # This is how the testing skyway (midway3 VM) for rcc-aws: uses the IAM rcc-skyway as a trusted agent from the RCC-Skyway account (391009850283)
-            self.client = boto3.client('sts',
-                aws_access_key_id = self.vendor['master_access_key_id'],
-                aws_secret_access_key = self.vendor['master_secret_access_key'])
-
-            self.assumed_role = self.client.assume_role(
-                RoleArn = "arn:aws:iam::%s:role/%s" % (self.account['account_id'], self.account['role_name']), 
-                RoleSessionName = "RCCSkyway"
-            )
-            credentials = self.assumed_role['Credentials']
-            self.ec2 = boto3.resource('ec2',
-                                      aws_access_key_id = credentials['AccessKeyId'],
-                                      aws_secret_access_key = credentials['SecretAccessKey'],
-                                      aws_session_token= credentials['SessionToken'],
-                                      region_name = self.account['region'])
         self.using_libcloud = False
-        if self.using_libcloud:
-            EC2 = get_driver(Provider.EC2)
-            self.driver = EC2(self.account['access_key_id'], self.account['secret_access_key'], self.account['region'])
+
+        # the regions of the account: account['region'] is the home region where the nodes are created by default,
+        # account['regions'] (optional) lists the other regions where the nodes are listed and may be created,
+        # either as a list of region names, or as a dictionary of region name -> ami_id and security_group of the region
+        self.region = self.account.get('region')
+        other_regions = self.account.get('regions') or []
+        if self.region is None:
+            if len(other_regions) == 0:
+                raise Exception(f'Entry region (or regions) is missing for account {account}.')
+            self.region = list(other_regions)[0]
+        self.regions = [self.region] + [region for region in other_regions if region != self.region]
+
+        # the EC2 resources (one per region) and libcloud driver are created on first use, see ec2_resource() below
+        self._ec2 = {}
+        self._credentials = None
+        self._driver = None
+        # (region, availability zone, instance type) -> (time, price) of the spot prices looked up, see get_spot_price()
+        self._spot_prices = {}
         
         # copy ssh pem file to ~/, change the permission to 400
         pem_file_full_path = account_path + self.account['key_name'] + '.pem'
@@ -99,6 +133,75 @@ class AWS(Cloud):
         cmd = f"cp {pem_file_full_path} {self.my_ssh_private_key}; chmod 400 {self.my_ssh_private_key}"
         p = subprocess.run(cmd, shell=True, text=True, capture_output=True)
 
+    @property
+    def ec2(self):
+        """
+        The boto3 EC2 resource of the home region of the account, created on first use
+        """
+        return self.ec2_resource(self.region)
+
+    def ec2_resource(self, region):
+        """
+        The boto3 EC2 resource of a region of the account, created on first use
+        """
+        if region in self._ec2:
+            return self._ec2[region]
+
+        import boto3
+        if self.using_trusted_agent == False:
+            # This is how the existing skyway creates the ec2 resource without master for rcc-aws
+            self._ec2[region] = boto3.resource('ec2',
+                                               aws_access_key_id = self.account['access_key_id'],
+                                               aws_secret_access_key = self.account['secret_access_key'],
+                                               region_name = region)
+        else:
+            # This is how the testing skyway (midway3 VM) for rcc-aws: uses the IAM rcc-skyway as a trusted agent from the RCC-Skyway account (391009850283)
+            # the role is assumed once for all the regions
+            if self._credentials is None:
+                self.client = boto3.client('sts',
+                    aws_access_key_id = self.vendor['master_access_key_id'],
+                    aws_secret_access_key = self.vendor['master_secret_access_key'])
+
+                self.assumed_role = self.client.assume_role(
+                    RoleArn = "arn:aws:iam::%s:role/%s" % (self.account['account_id'], self.account['role_name']), 
+                    RoleSessionName = "RCCSkyway"
+                )
+                self._credentials = self.assumed_role['Credentials']
+            credentials = self._credentials
+            self._ec2[region] = boto3.resource('ec2',
+                                               aws_access_key_id = credentials['AccessKeyId'],
+                                               aws_secret_access_key = credentials['SecretAccessKey'],
+                                               aws_session_token= credentials['SessionToken'],
+                                               region_name = region)
+        return self._ec2[region]
+
+    def region_settings(self, region):
+        """
+        The ami_id and security_group used to create the nodes in a region of the account
+        (the entries of the region in account['regions'] if any, those of the account otherwise)
+        """
+        if region not in self.regions:
+            raise ValueError(f"Region {region} is not listed in the regions of account {self.account_name}: {', '.join(self.regions)}.")
+
+        settings = { 'ami_id': self.account.get('ami_id'), 'security_group': self.account.get('security_group') }
+        other_regions = self.account.get('regions')
+        if isinstance(other_regions, dict) and isinstance(other_regions.get(region), dict):
+            for k in settings:
+                if k in other_regions[region]:
+                    settings[k] = other_regions[region][k]
+        return settings
+
+    @property
+    def driver(self):
+        """
+        It is also possible to use libcloud EC2NodeDriver (if using_libcloud is True), created on first use
+        """
+        if self._driver is None and self.using_libcloud:
+            from libcloud.compute.types import Provider
+            from libcloud.compute.providers import get_driver
+            EC2 = get_driver(Provider.EC2)
+            self._driver = EC2(self.account['access_key_id'], self.account['secret_access_key'], self.region)
+        return self._driver
        
     def list_nodes(self, show_protected_nodes=False, verbose=False):
         """Member function: list_nodes
@@ -108,24 +211,23 @@ class AWS(Cloud):
                 (1) instance name (2) state (3) type (4) identifier
         """
         
-        instances = self.get_instances()
+        inventory = self.inventory()
         nodes = []
         
-        for instance in instances:
-            node_name = self.get_instance_name(instance)
-            if show_protected_nodes == False and node_name in self.account['protected_nodes']:
+        for instance in inventory:
+            node_name, instance_id, instance_user_name, state = inventory.keys_of(instance)
+            if show_protected_nodes == False and (node_name in self.account['protected_nodes'] or self.get_pool_node_type(instance) is not None):
                 continue
 
-            if instance.state['Name'] != 'terminated':
+            if state != 'terminated':
                 running_time = datetime.now(timezone.utc) - instance.launch_time
                 
                 instance_unit_cost = self.get_unit_price_instance(instance)
                 running_cost = running_time.total_seconds()/3600.0 * instance_unit_cost
-                instance_user_name = self.get_instance_user_name(instance)
 
-                nodes.append([self.get_instance_name(instance),
+                nodes.append([node_name,
                               instance_user_name,
-                              instance.state['Name'],
+                              state,
                               instance.instance_type, 
                               instance.instance_id,
                               instance.public_ip_address,
@@ -142,28 +244,40 @@ class AWS(Cloud):
             print("", file=output_str)
         return nodes, output_str
 
-    def create_nodes(self, node_type: str, node_names = [], interactive = False, need_confirmation = True, walltime = None, image_id = ""):
+    def create_nodes(self, node_type: str, node_names = [], interactive = False, need_confirmation = True, walltime = None, image_id = "", region = None, spot = False):
         """Member function: create_compute
         Create a group of compute instances(nodes, servers, virtual-machines 
         ...) with the given type.
         
          - node_type: instance type information from the Skyway definitions
          - node_names: a list of names for the nodes, to get the number of nodes
+         - region: one of the regions of the account (default: the home region account['region'])
+         - spot: create spot instances (at the current spot price, see get_spot_price), which AWS may interrupt
         
         Return: a dictionary of instance ID (i.e., names) for created instances.
         """
         user_name = os.environ['USER']
+        if region is None or region == "":
+            region = self.region
+        # raise if the region is not a region of the account
+        self.region_settings(region)
+
         user_budget = self.get_budget(user_name=user_name, verbose=False)
         usage, remaining_balance = self.get_cost_and_usage_from_db(user_name=user_name)
-        running_cost = self.get_running_cost(verbose=False)
+        # the running nodes of the user in all the regions of the account
+        running_cost = self.get_running_cost(verbose=False, user_name=user_name)
         usage = usage + running_cost
         remaining_balance = user_budget - usage
         unit_price = self.vendor['node-types'][node_type]['price']
+        market = ""
+        if spot == True:
+            unit_price = self.get_spot_price(self.vendor['node-types'][node_type]['name'], region)
+            market = "spot "
         if need_confirmation == True:
             print(f"User budget: ${user_budget:.3f}")
             print(f"+ Usage    : ${usage:.3f}")
             print(f"+ Available: ${remaining_balance:.3f}")
-            response = input(f"Do you want to create an instance of type {node_type} (${unit_price}/hr)? (y/n) ")
+            response = input(f"Do you want to create a {market}instance of type {node_type} (${unit_price}/hr) in {region}? (y/n) ")
             if response == 'n':
                 return
 
@@ -172,87 +286,314 @@ class AWS(Cloud):
 
         print(Fore.BLUE + f"Allocating {count} instance ...", end=" ")
         
-        # ImageID and KeyName provided by the account then user can connect to the running node
-        #   if ImageID is from the vendor, KeyName from the account, ssh connections is denied
-        vm_image = self.account['ami_id']
-        if image_id != "":
-            vm_image = image_id
-
-        instances = self.ec2.create_instances(
-            ImageId          = vm_image,                  # self.vendor['ami_id']
-            KeyName          = self.account['key_name'],  # self.vendor['key_name']
-            SecurityGroupIds = self.account['security_group'],
-            InstanceType     = self.vendor['node-types'][node_type]['name'],
-            MaxCount         = count,
-            MinCount         = count,
-            TagSpecifications=[
-                {
-                    'ResourceType' : 'instance',
-                    'Tags' : [
-                         {
-                            'Key' : 'Name',
-                            'Value' : node_name
-                         },
-                         {
-                            'Key' : 'User',
-                            'Value' : user_name
-                         }
-                    ]
-                },
-
-            ])
-
+        # post boot tasks run by cloud-init while the instance boots (user-data)
+        #   + shut down the instance after the walltime
+        #   + mounting storage from io-server 172.31.47.245 (private IP of the rcc-io node) (rcc-aws, not using a trusted agent)
+        #     (need to install nfs-utils on the VM, or having an image that has nfs-utils installed)
+        #   + executing some custom scripts
+        io_server = "172.31.47.245"
+        #user_data = self.get_post_boot_script(walltime, ["mkdir -p /software", f"mount -t nfs {io_server}:/skyway /home", f"mount -t nfs {io_server}:/software /software"])
+        user_data = self.get_post_boot_script(walltime, ["mkdir -p /cloud/rcc-aws", f"mount -t nfs {io_server}:/cloud/rcc-aws /cloud/rcc-aws"])
+
+        # the stopped instances of the warm pool (home region, account image, on-demand) are started first,
+        # the other nodes are launched
+        instances = []
+        if region == self.region and image_id == "" and spot == False:
+            instances = self.claim_pool_instances(node_type, node_names, user_name, user_data)
+        if len(instances) < count:
+            instances += self.launch_instances(region, node_type, node_names[len(instances):], image_id, user_name, user_data, spot)
+
+        # one waiter for all the instances of a region (one DescribeInstances call on all their IDs per poll),
+        # the instances may have been launched in another region of the account (see launch_instances)
+        instance_ids = [instance.instance_id for instance in instances]
+        region_ids = {}
         for instance in instances:
-            instance.wait_until_running()
+            region_ids.setdefault(self.get_instance_region(instance), []).append(instance.instance_id)
+        for instance_region, ids in region_ids.items():
+            try:
+                self.ec2_resource(instance_region).meta.client.get_waiter('instance_running').wait(InstanceIds=ids)
+            except Exception as e:
+                # e.g. an instance terminated right away: the running instances are still returned
+                print(f"\nNot all the instances are running: {e}")
+        self.invalidate_listing()
+
+        # one call per region to load all the instances (public IPs, states), in the order of node_names
+        loaded = {}
+        for instance_region, ids in region_ids.items():
+            loaded.update({ instance.instance_id: instance for instance in self.ec2_resource(instance_region).instances.filter(InstanceIds=ids) })
+        instances = [loaded.get(ID, instance) for ID, instance in zip(instance_ids, instances)]
         
         nodes = {}
-        # .pem file is the private key of the local machine that has a correponding public key listed
-        # as in ~/.ssh/authorized_keys on the node
-        path = os.environ['SKYWAYROOT'] + '/etc/accounts/'
+        # node name -> reason, for the nodes that did not start
+        failures = {}
         username = self.vendor['username']
-        region = self.account['region']
-
-        if walltime is None:
-            walltime_str = "00:05:00"
-        else:
-            walltime_str = walltime
-
-        # shutdown the instance after the walltime (in minutes)
-        pt = datetime.strptime(walltime_str, "%H:%M:%S")
-        walltime_in_minutes = int(pt.hour * 60 + pt.minute + pt.second/60)
 
+        running = []
         for inode, instance in enumerate(instances):
-            instance.load()
+            if instance.state['Name'] != 'running' or instance.public_ip_address is None:
+                failures[node_names[inode]] = f"instance {instance.instance_id} is {instance.state['Name']}"
+                continue
 
             # record node_type, launch time
             instance_type = str(instance.instance_type)
             launch_time = instance.launch_time.strftime("%Y-%m-%dT%H:%M:%S.%f%z")
             nodes[node_names[inode]] = [instance_type, launch_time, str(instance.public_ip_address)]
+            running.append((node_names[inode], instance))
 
-            # perform post boot tasks on each node
-            #   + mounting storage (/home, /software) from io-server 172.31.47.245 (private IP of the rcc-io node) (rcc-aws, not using a trusted agent)
-            #   + executing some custom scripts
-            #   + shut down the instance after the walltime
-            io_server = "172.31.47.245"
-            ip = instance.public_ip_address
-            ip_converted = ip.replace('.','-')
+        for node_name, instance in running:
+            host = self.get_host_name(instance)
+            print(f"\nCreated instance: {node_name}")
+            print("To connect to the instance, run:")
+            print(f"  ssh -i {self.my_ssh_private_key} -o StrictHostKeyChecking=accept-new {username}@{host} or")
+            print(f"  skyway_connect --account={self.account_name} -J {node_name}")
+
+        if len(failures) > 0:
+            print("")
+            print(tabulate([[node_name, error] for node_name, error in failures.items()], headers=['Node', 'Error']))
 
-            print(f"\nCreated instance: {node_names[inode]}")
+        return nodes
 
-            # need to install nfs-utils on the VM (or having an image that has nfs-utils installed)
-            #cmd = f"ssh -i {pem_file_full_path} {username}@ec2-{ip_converted}.{region}.compute.amazonaws.com -t 'sudo mount -t nfs 172.31.47.245:/skyway /home' "
+    def launch_instances(self, region, node_type, node_names, image_id, user_name, user_data, spot=False):
+        """Member function: launch the instances of a node type in a region, one per node name
+        When AWS has no capacity for the instance type (e.g. InsufficientInstanceCapacity), the launch is raced
+        across the candidates of the fallback entry of the node type in cloud.yaml (see Cloud.get_fallback):
+        availability zones (zones), regions of the account (regions) and equivalent node types (node-types).
+        The first launch that succeeds is kept, the others are terminated.
 
-            print("To connect to the instance, run:")
-            cmd = f"ssh -i {self.my_ssh_private_key} -o StrictHostKeyChecking=accept-new {username}@ec2-{ip_converted}.{region}.compute.amazonaws.com "
-            
-            print(f"  {cmd} or")
-            print(f"  skyway_connect --account={self.account_name} -J {node_names[inode]}")
-            #cmd = f"ssh -i {pem_file_full_path} -o StrictHostKeyChecking=accept-new {username}@ec2-{ip_converted}.{region}.compute.amazonaws.com "
-            #cmd += f"-t 'sudo shutdown -P {walltime_in_minutes}; sudo mkdir -p /software; sudo mount -t nfs {io_server}:/skyway /home; sudo mount -t nfs {io_server}:/software /software' "
-            cmd += f"-t 'sudo shutdown -P {walltime_in_minutes}; sudo mkdir -p /cloud/rcc-aws; sudo mount -t nfs {io_server}:/cloud/rcc-aws /cloud/rcc-aws' "
-            p = subprocess.run(cmd, shell=True, text=True, capture_output=True)
+         - image_id: the image of the nodes, "" for the ami_id of each region
+         - spot: launch spot instances (see spot_market_options)
 
-        return nodes
+        Return: the launched instances
+        """
+        count = len(node_names)
+
+        # ImageID and KeyName provided by the account then user can connect to the running node
+        #   if ImageID is from the vendor, KeyName from the account, ssh connections is denied
+        #   AMIs and security groups are regional: the key pair is expected to be imported under the same name in all the regions
+        def launch(candidate):
+            launch_region, zone, launch_type = candidate
+            settings = self.region_settings(launch_region)
+            params = dict(
+                ImageId          = image_id if image_id != "" else settings['ami_id'],
+                KeyName          = self.account['key_name'],  # self.vendor['key_name']
+                SecurityGroupIds = settings['security_group'],
+                InstanceType     = self.vendor['node-types'][launch_type]['name'],
+                MaxCount         = count,
+                MinCount         = count,
+                UserData         = user_data,
+                TagSpecifications=[
+                    {
+                        'ResourceType' : 'instance',
+                        'Tags' : [
+                             {
+                                'Key' : 'Name',
+                                'Value' : node_names[0]
+                             },
+                             {
+                                'Key' : 'User',
+                                'Value' : user_name
+                             }
+                        ]
+                    },
+
+                ])
+            if zone is not None:
+                params['Placement'] = { 'AvailabilityZone': zone }
+            if spot == True:
+                params['InstanceMarketOptions'] = spot_market_options
+            # the clients are thread-safe, unlike the resources
+            response = self.ec2_resource(launch_region).meta.client.run_instances(**params)
+            return [instance['InstanceId'] for instance in response['Instances']]
+
+        def cancel(candidate, instance_ids):
+            self.ec2_resource(candidate[0]).meta.client.terminate_instances(InstanceIds=instance_ids)
+
+        # the candidates: (region, availability zone or None, node type), the first one being the requested launch
+        fallback = self.get_fallback(node_type)
+        candidates = []
+        for launch_type in [node_type] + fallback.get('node-types', []):
+            # an availability zone is the name of its region followed by a letter (e.g. us-east-2b)
+            candidates += [(zone[:-1], zone, launch_type) for zone in fallback.get('zones', [])]
+            candidates += [(launch_region, None, launch_type) for launch_region in [region] + fallback.get('regions', [])]
+        candidates = list(dict.fromkeys([(region, None, node_type)] + candidates))
+
+        try:
+            candidate = candidates[0]
+            instance_ids = launch(candidate)
+        except Exception as e:
+            error_code = getattr(e, 'response', {}).get('Error', {}).get('Code')
+            if error_code not in capacity_errors or len(candidates) == 1:
+                raise
+            print(f"\nNo capacity for {self.vendor['node-types'][node_type]['name']} in {region} ({error_code}), "
+                  f"trying {len(candidates) - 1} other launches ...", end=" ")
+            # the resources are created beforehand: creating boto3 resources is not thread-safe
+            for launch_region in set(c[0] for c in candidates[1:] if c[0] in self.regions):
+                self.ec2_resource(launch_region)
+            candidate, instance_ids = self.race_launches(launch, candidates[1:], cancel)
+            launch_region, zone, launch_type = candidate
+            print(f"\nLaunched {count} instance(s) of type {launch_type} in {zone or launch_region}", end=" ")
+
+        ec2 = self.ec2_resource(candidate[0])
+        return [ec2.Instance(instance_id) for instance_id in instance_ids]
+
+    def get_pool_node_type(self, instance):
+        """Member function: get the node type of an instance of the warm pool, None if the instance is not in the pool
+         - instance: an instance self.ec2.Instance()
+        """
+        if instance.tags is None: return None
+
+        for tag in instance.tags:
+            if tag['Key'] == pool_tag:
+                return tag['Value']
+
+        return None
+
+    def get_pool_claim(self, instance):
+        """Member function: get the token of the claim on an instance of the warm pool, None if the instance is not claimed
+        or if the claim is stale
+         - instance: an instance self.ec2.Instance()
+        """
+        if instance.tags is None: return None
+
+        for tag in instance.tags:
+            if tag['Key'] == pool_claim_tag:
+                claimed_at = tag['Value'].split(':')[0]
+                if claimed_at.isdigit() and time.time() - int(claimed_at) > pool_claim_ttl:
+                    return None
+                return tag['Value']
+
+        return None
+
+    def check_pool_claims(self, instances, token):
+        """Member function: get the instances still claimed with token (described again)
+        """
+        claimed = []
+        for instance in instances:
+            instance.reload()
+            if self.get_pool_claim(instance) == token:
+                claimed.append(instance)
+        return claimed
+
+    def release_pool_claims(self, instances, token):
+        """Member function: remove the claim with token from the instances, they are back in the pool
+        """
+        for instance in self.check_pool_claims(instances, token):
+            instance.delete_tags(Tags=[{ 'Key': pool_claim_tag }])
+
+    def get_pool_instances(self, node_type=None, states=['pending', 'running', 'stopping', 'stopped']):
+        """Member function: get the instances of the warm pool (in the home region), of a node type if given
+        (listed by the API, not from the inventory: the pool changes while nodes are created)
+        """
+        filters = [{ "Name" : "instance-state-name", "Values" : states }]
+        if node_type is None:
+            filters.append({ "Name" : "tag-key", "Values" : [pool_tag] })
+        else:
+            filters.append({ "Name" : f"tag:{pool_tag}", "Values" : [node_type] })
+        return list(self.ec2.instances.filter(Filters = filters))
+
+    def claim_pool_instances(self, node_type, node_names, user_name, user_data):
+        """Member function: start stopped instances of the warm pool for the first nodes of node_names
+         - user_data: the post-boot script of the nodes, run when the instances start (see pool_user_data)
+        Return: the claimed instances (started, named and tagged with the user), possibly fewer than the nodes
+
+        EC2 has no conditional tag update: the instances are tagged with a token of this process, and only those
+        still tagged with the token once the tags have settled are started (the processes of other hosts claiming
+        the same instances at the same time overwrite the tag, the last one wins). The claim is checked again after
+        the start: an instance claimed meanwhile by another process is left to that process.
+        """
+        if self.get_pool_sizes().get(node_type, 0) <= 0:
+            return []
+
+        import socket
+        import uuid
+        from ..cache import run_lock
+        token = f"{int(time.time())}:{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        # the processes creating nodes on this host do not claim the same instances
+        with run_lock(f"pool-{self.account_name}"):
+            pool = [instance for instance in self.get_pool_instances(node_type, states=['stopped'])
+                    if self.get_pool_claim(instance) is None][:len(node_names)]
+            if len(pool) == 0:
+                return []
+
+            for instance in pool:
+                instance.create_tags(Tags=[{ 'Key': pool_claim_tag, 'Value': token }])
+            time.sleep(pool_claim_settle)
+            pool = self.check_pool_claims(pool, token)
+            if len(pool) == 0:
+                return []
+
+            try:
+                for instance in pool:
+                    instance.modify_attribute(UserData={ 'Value': user_data })
+                self.ec2.meta.client.start_instances(InstanceIds=[instance.instance_id for instance in pool])
+            except Exception as e:
+                # e.g. no capacity for the instance type: the instances stay in the pool, new ones are launched
+                print(f"\nCannot start the instances of the warm pool: {e}")
+                self.release_pool_claims(pool, token)
+                return []
+
+            pool = self.check_pool_claims(pool, token)
+            for node_name, instance in zip(node_names, pool):
+                instance.create_tags(Tags=[{ 'Key': 'Name', 'Value': node_name }, { 'Key': 'User', 'Value': user_name }])
+                instance.delete_tags(Tags=[{ 'Key': pool_tag }, { 'Key': pool_claim_tag }])
+
+        print(f"{len(pool)} from the warm pool ...", end=" ")
+        return pool
+
+    def fill_pool(self, verbose=True):
+        """Member function: fill the warm pool
+        Launch the missing instances of each node type in account['warm_pool'] (they stop by themselves once booted),
+        and terminate the stopped instances beyond the number of the node type
+
+        Return: a list of [node type, pool size, instances before, launched, terminated]
+        """
+        sizes = self.get_pool_sizes()
+        settings = self.region_settings(self.region)
+
+        pool = {}
+        for instance in self.get_pool_instances():
+            pool.setdefault(self.get_pool_node_type(instance), []).append(instance)
+
+        summary = []
+        for node_type in sorted(set(sizes) | set(pool)):
+            size = sizes.get(node_type, 0)
+            instances = pool.get(node_type, [])
+            launched = 0
+            terminated = 0
+            if len(instances) < size:
+                launched = len(self.ec2.create_instances(
+                    ImageId          = settings['ami_id'],
+                    KeyName          = self.account['key_name'],
+                    SecurityGroupIds = settings['security_group'],
+                    InstanceType     = self.vendor['node-types'][node_type]['name'],
+                    MaxCount         = size - len(instances),
+                    MinCount         = 1,
+                    UserData         = pool_user_data,
+                    InstanceInitiatedShutdownBehavior = 'stop',
+                    TagSpecifications=[
+                        {
+                            'ResourceType' : 'instance',
+                            'Tags' : [
+                                 { 'Key' : 'Name', 'Value' : f"skyway-pool-{node_type}" },
+                                 { 'Key' : pool_tag, 'Value' : node_type }
+                            ]
+                        },
+                    ]))
+            elif len(instances) > size:
+                # only the stopped instances not being claimed, the others are still being prepared or started
+                extra = [instance for instance in instances
+                         if instance.state['Name'] == 'stopped' and self.get_pool_claim(instance) is None][:len(instances) - size]
+                for instance in extra:
+                    instance.terminate()
+                terminated = len(extra)
+            summary.append([node_type, size, len(instances), launched, terminated])
+
+        self.invalidate_listing()
+        if verbose == True:
+            print(tabulate(summary, headers=['Node Type', 'Pool Size', 'Instances', 'Launched', 'Terminated']))
+            print("")
+        return summary
 
     def connect_node(self, instance_ID, separate_terminal=True):
         """
@@ -261,34 +602,31 @@ class AWS(Cloud):
         It is important to create the node using the account's key-name.
         """
         print(f"Instance ID: {instance_ID}")
-        ip = self.get_host_ip(instance_ID)
-        print(f"Connecting to instance public IP address: {ip}")
+        instance = self.find_instance(instance_ID)
+        print(f"Connecting to instance public IP address: {instance.public_ip_address}")
 
         username = self.vendor['username']
-        region = self.account['region']
-        ip_converted = ip.replace('.','-')
+        host = self.get_host_name(instance)
 
         if separate_terminal == True:
             cmd = "gnome-terminal -q --title='Connecting to the node' -- bash -c "
-            cmd += f" 'ssh -i {self.my_ssh_private_key} -o StrictHostKeyChecking=accept-new {username}@ec2-{ip_converted}.{region}.compute.amazonaws.com' "
+            cmd += f" 'ssh -i {self.my_ssh_private_key} -o StrictHostKeyChecking=accept-new {username}@{host}' "
         else:
-            cmd = f"ssh -i {self.my_ssh_private_key} -o StrictHostKeyChecking=accept-new {username}@ec2-{ip_converted}.{region}.compute.amazonaws.com"
+            cmd = f"ssh -i {self.my_ssh_private_key} -o StrictHostKeyChecking=accept-new {username}@{host}"
         os.system(cmd)
 
         node_info = {
             'private_key' : self.my_ssh_private_key,
-            'login' : f"{username}@ec2-{ip_converted}.{region}.compute.amazonaws.com",
+            'login' : f"{username}@{host}",
         }
         return node_info
 
     def get_node_connection_info(self, instance_ID):
         username = self.vendor['username']
-        ip = self.get_host_ip(instance_ID)
-        ip_converted = ip.replace('.','-')
-        region = self.account['region']
+        host = self.get_host_name(self.find_instance(instance_ID))
         node_info = {
             'private_key' : self.my_ssh_private_key,
-            'login' : f"{username}@ec2-{ip_converted}.{region}.compute.amazonaws.com",
+            'login' : f"{username}@{host}",
         }
         return node_info
 
@@ -299,20 +637,18 @@ class AWS(Cloud):
            execute(node_name='your-node', binary="python", arg1="input.txt", arg2="output.txt")
            execute(node_name='your-node', binary="mpirun -np 4 my_app", arg1="input.txt", arg2="output.txt")
         '''
-        ip = self.get_host_ip(instance_ID)
+        host = self.get_host_name(self.find_instance(instance_ID))
 
         path = os.environ['SKYWAYROOT'] + '/etc/accounts/'
         pem_file_full_path = path + self.account['key_name'] + '.pem'
         username = self.vendor['username']
-        region = self.account['region']
-        ip_converted = ip.replace('.','-')
 
         command = ""
         for key, value in kwargs.items():
             command += value + " "
 
         cmd = "gnome-terminal -q --title='Connecting to the node' -- bash -c "
-        cmd += f" 'ssh -i {self.my_ssh_private_key} -o StrictHostKeyChecking=accept-new {username}@ec2-{ip_converted}.{region}.compute.amazonaws.com' -t '{command}' "
+        cmd += f" 'ssh -i {self.my_ssh_private_key} -o StrictHostKeyChecking=accept-new {username}@{host}' -t '{command}' "
         p = subprocess.run(cmd, shell=True, text=True, capture_output=True)
 
 
@@ -320,16 +656,14 @@ class AWS(Cloud):
         '''
         execute all the lines in a script on an instance
         '''
-        ip = self.get_host_ip(instance_ID)
+        host = self.get_host_name(self.find_instance(instance_ID))
 
         path = os.environ['SKYWAYROOT'] + '/etc/accounts/'
         pem_file_full_path = path + self.account['key_name'] + '.pem'
         username = self.vendor['username']
-        region = self.account['region']
-        ip_converted = ip.replace('.','-')
 
         script_cmd = utils.script2cmd(script_name)
-        cmd = f"ssh -i {self.my_ssh_private_key} -o StrictHostKeyChecking=accept-new {username}@ec2-{ip_converted}.{region}.compute.amazonaws.com -t 'eval {script_cmd}' "
+        cmd = f"ssh -i {self.my_ssh_private_key} -o StrictHostKeyChecking=accept-new {username}@{host} -t 'eval {script_cmd}' "
         p = subprocess.run(cmd, shell=True, text=True, capture_output=True)
 
 
@@ -350,6 +684,9 @@ class AWS(Cloud):
         if node_names is None and IDs is None:
             raise ValueError(f"node_names and IDs cannot be both empty.")
 
+        # one listing for all the nodes to destroy
+        inventory = self.inventory()
+
         instances = []
         if node_names is not None:
             if isinstance(node_names, str): node_names = [node_names]
@@ -357,19 +694,14 @@ class AWS(Cloud):
                 if name in self.account['protected_nodes']:
                     continue
                 
-                avail_instances = self.get_instances(filters = [{
-                    "Name" : "instance-state-name",
-                    "Values" : ["running", "stopped"]
-                }])
-                
-                instance = next((inst for inst in avail_instances if self.get_instance_name(inst) == name), None)
+                instance = inventory.find(name, states=['running', 'stopped'])
                 if instance is None:
                     raise ValueError(f"Instance '{name}' not found.")
 
                 running_time = datetime.now(timezone.utc) - instance.launch_time
                 instance_unit_cost = self.get_unit_price_instance(instance)
-                running_cost = running_time.seconds/3600.0 * instance_unit_cost
-                instance_user_name = self.get_instance_user_name(instance)
+                running_cost = running_time.total_seconds()/3600.0 * instance_unit_cost
+                instance_user_name = inventory.user_of(instance)
                 if instance_user_name != user_name:
                     print(f"Cannot destroy an instance {name} created by other users")
                     continue
@@ -384,66 +716,50 @@ class AWS(Cloud):
                 # record the running time and cost
                 running_time = datetime.now(timezone.utc) - instance.launch_time
                 instance_unit_cost = self.get_unit_price_instance(instance)
-                running_cost = running_time.seconds/3600.0 * instance_unit_cost
-                usage, remaining_balance = self.get_cost_and_usage_from_db(user_name=user_name)
-
-                # store the record into the database
-                data = [instance_user_name, instance.instance_id, instance.instance_type,
-                        instance.launch_time, datetime.now(timezone.utc), running_cost, remaining_balance]
-                if os.path.isfile(self.usage_history):
-                    df = pd.read_pickle(self.usage_history)
-                else:
-                    df = pd.DataFrame([], columns=['User','InstanceID','InstanceType','Start','End', 'Cost', 'Balance'])
-
-                df = pd.concat([pd.DataFrame([data], columns=df.columns), df], ignore_index=True)
-                df.to_pickle(self.usage_history)
+                running_cost = running_time.total_seconds()/3600.0 * instance_unit_cost
+                # store the record into the usage ledger
+                self.record_usage(instance_user_name, instance.instance_id, instance.instance_type,
+                                  instance.launch_time, datetime.now(timezone.utc), running_cost)
 
                 instances.append(instance)
         else:
             for ID in IDs:
-                instance = self.ec2.Instance(ID)
-                if self.get_instance_name(instance) in self.account['protected_nodes']:
+                instance = inventory.get(ID)
+                if instance is None:
+                    raise ValueError(f"Instance '{ID}' not found.")
+
+                if inventory.name_of(instance) in self.account['protected_nodes']:
                     continue
 
-                instance_user_name = self.get_instance_user_name(instance)
+                instance_user_name = inventory.user_of(instance)
                 if instance_user_name != user_name:
-                    print(f"Cannot destroy an instance {name} from other users")
+                    print(f"Cannot destroy an instance {ID} from other users")
                     continue
 
-                if instance is None:
-                    raise ValueError(f"Instance '{instance.name}' not found.")
-
                 running_time = datetime.now(timezone.utc) - instance.launch_time
                 instance_unit_cost = self.get_unit_price_instance(instance)
-                running_cost = running_time.seconds/3600.0 * instance_unit_cost
+                running_cost = running_time.total_seconds()/3600.0 * instance_unit_cost
 
-                response = input(f"Do you want to terminate the node {instance.instance_id} (running cost ${running_cost:0.5f})? (y/n) ")
-                if response != 'y':
-                    continue
+                if need_confirmation == True:
+                    response = input(f"Do you want to terminate the node {instance.instance_id} (running cost ${running_cost:0.5f})? (y/n) ")
+                    if response != 'y':
+                        continue
 
                 # record the running time and cost
                 running_time = datetime.now(timezone.utc) - instance.launch_time
                 instance_unit_cost = self.get_unit_price_instance(instance)
-                running_cost = running_time.seconds/3600.0 * instance_unit_cost
-                usage, remaining_balance = self.get_cost_and_usage_from_db(user_name=user_name)
-
-                # store the record into the database
-                data = [instance_user_name, instance.instance_id, instance.instance_type,
-                        instance.launch_time, datetime.now(timezone.utc), running_cost, remaining_balance]
-
-                if os.path.isfile(self.usage_history):
-                    df = pd.read_pickle(self.usage_history)
-                else:
-                    df = pd.DataFrame([], columns=['User','InstanceID','InstanceType','Start','End', 'Cost', 'Balance'])
-
-                df = pd.concat([pd.DataFrame([data], columns=df.columns), df], ignore_index=True)
-                df.to_pickle(self.usage_history)
+                running_cost = running_time.total_seconds()/3600.0 * instance_unit_cost
+                # store the record into the usage ledger
+                self.record_usage(instance_user_name, instance.instance_id, instance.instance_type,
+                                  instance.launch_time, datetime.now(timezone.utc), running_cost)
 
                 instance.terminate()
                 instances.append(instance)
 
         for instance in instances:
             instance.wait_until_terminated()
+        if len(instances) > 0:
+            self.invalidate_listing()
 
 
     def check_valid_user(self, user_name, verbose=False):
@@ -464,10 +780,11 @@ class AWS(Cloud):
         #   1) the current IAM role of the master account is not allowed to get a cost explorer client
         #   need to use direct access key and secret from the account's user in the admin group
         #   2) for resource-level cost info, user needs to opt-in for daily/hourly monitoring which costs $$
+        import boto3
         client = boto3.client('ce',
                               aws_access_key_id = self.account['access_key_id'],
                               aws_secret_access_key = self.account['secret_access_key'],
-                              region_name = self.account['region'])
+                              region_name = self.region)
     
         # Query the cost and usage data
         response = client.get_cost_and_usage_with_resources(
@@ -493,67 +810,15 @@ class AWS(Cloud):
             print(response['ResultsByTime'])
         return response
 
-    def get_cost_and_usage_from_db(self, user_name):
-        '''
-        compute the accumulating cost from the pkl database
-        and the remaining balance
-        '''
-        if user_name not in self.users:
-            raise Exception(f"{user_name} is not listed in the user group of this account.")
-                
-        user_budget = self.users[user_name]['budget']
-
-        if not os.path.isfile(self.usage_history):
-            print(f"Usage history {self.usage_history} is not available")
-            data = [user_name, "--", "--", "00:00:00", "00:00:00", "0.0", user_budget]
-            df = pd.DataFrame([], columns=['User','InstanceID','InstanceType','Start','End', 'Cost', 'Balance'])
-            #df = pd.DataFrame(columns=['User','InstanceID','InstanceType','Start','End', 'Cost', 'Balance'])
-            df = pd.concat([pd.DataFrame([data], columns=df.columns), df], ignore_index=True)
-            df.to_pickle(self.usage_history)
-            return 0, user_budget
-
-        df = pd.read_pickle(self.usage_history)
-        df_user = df.loc[df['User'] == user_name]
-        df_user = df_user.astype({"Cost": float})
-        accumulating_cost = df_user['Cost'].sum()
-        user_budget = self.get_budget(user_name=user_name, verbose=False)
-        remaining_balance = float(user_budget) - float(accumulating_cost)
-
-        return accumulating_cost, remaining_balance
-
-    def get_usage_history_from_db(self, user_name):
-        '''
-        compute the accumulating cost from the pkl database
-        and the remaining balance
-        '''
-        if user_name not in self.users:
-            raise Exception(f"{user_name} is not listed in the user group of this account.")
-                
-        user_budget = self.users[user_name]['budget']
-
-        if not os.path.isfile(self.usage_history):
-            print(f"Usage history {self.usage_history} is not available")
-            data = [user_name, "--", "--", "00:00:00", "00:00:00", "0.0", user_budget]
-            df = pd.DataFrame([], columns=['User','InstanceID','InstanceType','Start','End', 'Cost', 'Balance'])
-            #df = pd.DataFrame(columns=['User','InstanceID','InstanceType','Start','End', 'Cost', 'Balance'])
-            df = pd.concat([pd.DataFrame([data], columns=df.columns), df], ignore_index=True)
-            df.to_pickle(self.usage_history)
-            return 0, user_budget
-
-        df = pd.read_pickle(self.usage_history)
-        df_user = df.loc[df['User'] == user_name]
-        
-        history = df_user[['User','InstanceID','InstanceType','Start','End']]
-        return history
-
     def get_budget_api(self):
         '''
         get the budget from the cloud account
         '''
+        import boto3
         client = boto3.client('budgets',
                               aws_access_key_id = self.account['access_key_id'],
                               aws_secret_access_key = self.account['secret_access_key'],
-                              region_name = self.account['region'])
+                              region_name = self.region)
         response = client.describe_budgets(
             AccountId=self.account['account_id']
         )
@@ -625,15 +890,12 @@ class AWS(Cloud):
         Return identifiers of all running instances
         """
 
-        instances = self.get_instances(filters = [{
-            "Name" : "instance-state-name",
-            "Values" : ["running"]
-        }])
+        inventory = self.inventory()
         
         nodes = []
         
-        for instance in instances:
-            nodes.append([self.get_instance_name(instance),
+        for instance in inventory.in_states(['running']):
+            nodes.append([inventory.name_of(instance),
                               instance.state['Name'], 
                               instance.instance_type, 
                               instance.instance_id])
@@ -645,23 +907,44 @@ class AWS(Cloud):
 
         return nodes
 
-    def get_host_ip(self, instance_ID):
-        """Member function: get the IP address of an instance (node) 
-         - ID: instance identifier
+    def find_instance(self, instance_ID):
+        """Member function: get an instance (node) in any region of the account
+         - ID: instance identifier, or instance name
         """
         
+        inventory = self.inventory()
         if instance_ID[0:2] == 'i-':
-            instances = self.get_instances(filters = [{
-                "Name" : "instance-id",
-                "Values" : [instance_ID]
-            }])
+            instance = inventory.get(instance_ID)
         else:
-            instances = self.get_instances(filters = [{
-                "Name" : "tag:Name",
-                "Values" : [instance_ID]
-            }])
-        
-        return list(instances)[0].public_ip_address
+            instance = inventory.find(instance_ID, states=['running'])
+            if instance is None:
+                instance = inventory.find(instance_ID)
+        if instance is None:
+            raise ValueError(f"Instance '{instance_ID}' not found.")
+
+        return instance
+
+    def get_host_ip(self, instance_ID):
+        """Member function: get the IP address of an instance (node) 
+         - ID: instance identifier
+        """
+        return self.find_instance(instance_ID).public_ip_address
+
+    def get_host_name(self, instance):
+        """Member function: get the public DNS name of an instance (node) from its IP address and region
+         - instance: an instance self.ec2.Instance()
+        """
+        ip_converted = instance.public_ip_address.replace('.','-')
+        region = self.get_instance_region(instance)
+        if region == 'us-east-1':
+            return f"ec2-{ip_converted}.compute-1.amazonaws.com"
+        return f"ec2-{ip_converted}.{region}.compute.amazonaws.com"
+
+    def get_instance_region(self, instance):
+        """Member function: get the region of an instance (the region of the EC2 resource that listed or created it)
+         - instance: an instance self.ec2.Instance()
+        """
+        return instance.meta.client.meta.region_name
 
 
     def get_all_images(self, owners=['self']):
@@ -698,19 +981,10 @@ class AWS(Cloud):
         Note: AWS doesn't use unique name for instances, instead, name is an
         attribute stored in the tags.        
         """
-        running_instances = self.get_instances(filters = [{
-                    "Name" : "instance-state-name",
-                    "Values" : ["running"]
-        }])
-                
-        for instance in running_instances:
-            if instance.tags is None: continue
-
-            for tag in instance.tags:
-                if tag['Key'] == 'Name':
-                    if tag['Value'] == instance_name:
-                        return instance.instance_id
-        return ''
+        instance = self.inventory().find(instance_name, states=['running'])
+        if instance is None:
+            return ''
+        return instance.instance_id
 
     def get_instance_user_name(self, instance):
         """Member function: get_instance_user_name
@@ -730,31 +1004,140 @@ class AWS(Cloud):
 
     def get_instances(self, filters = []):
         """Member function: get_instances
-        Get a list of instance objects with give filters
+        Get a list of instance objects with give filters in all the regions of the account
+        (filtered by the API: unless filters has an instance-state-name filter, the terminated instances are left out)
         NOTE: if using libcloud then use self.driver.list_nodes()
         """
-        return self.ec2.instances.filter(Filters = filters)
+        if not any(f['Name'] == 'instance-state-name' for f in filters):
+            filters = filters + [{
+                "Name" : "instance-state-name",
+                "Values" : ["pending", "running", "shutting-down", "stopping", "stopped"]
+            }]
+        if len(self.regions) == 1:
+            return self.ec2.instances.filter(Filters = filters)
+
+        # the regions are listed at the same time, each with its own resource
+        # (created here beforehand: creating boto3 resources is not thread-safe)
+        resources = [(region, self.ec2_resource(region)) for region in self.regions]
+
+        def list_region(resource):
+            region, ec2 = resource
+            try:
+                return list(ec2.instances.filter(Filters = filters))
+            except Exception as e:
+                # do not hide the nodes (and their cost) of a region behind a partial listing
+                raise Exception(f"Cannot list the instances of account {self.account_name} in region {region}: {e}")
+
+        instances = []
+        with ThreadPoolExecutor(max_workers=len(resources)) as executor:
+            for region_instances in executor.map(list_region, resources):
+                instances += region_instances
+        return instances
+
+    def get_instance_keys(self, instance):
+        """
+        The (name, ID, user name, state) of an instance, used to index the inventory
+        """
+        return self.get_instance_name(instance), instance.instance_id, self.get_instance_user_name(instance), instance.state['Name']
 
     def get_unit_price_instance(self, instance):
         """
-        Get the per-hour price of an instance depending on its instance_type (e.g. t2.micro)
+        Get the per-hour price of an instance depending on its instance_type (e.g. t2.micro),
+        the current spot price in its availability zone for a spot instance
+        (so the recorded cost of a spot instance is an estimate, the spot price changes over its life)
         """
-        for node_type in self.vendor['node-types']:
-            if self.vendor['node-types'][node_type]['name'] == instance.instance_type:
-                unit_price = self.vendor['node-types'][node_type]['price']
-                return unit_price
-        return -1.0
+        if getattr(instance, 'instance_lifecycle', None) == 'spot':
+            zone = (instance.placement or {}).get('AvailabilityZone')
+            return self.get_spot_price(instance.instance_type, self.get_instance_region(instance), zone)
+        return self.catalog.price_of(instance.instance_type)
+
+    def get_spot_price(self, instance_type, region, zone=None):
+        """
+        Get the current per-hour spot price of an instance type in an availability zone
+        (the lowest of the availability zones of the region if zone is None) from the spot price history,
+        kept spot_price_ttl seconds; the spot-price entry of cloud.yaml if AWS does not give it
+        """
+        key = (region, zone, str(instance_type))
+        if key in self._spot_prices and time.time() - self._spot_prices[key][0] < spot_price_ttl:
+            return self._spot_prices[key][1]
+
+        params = dict(InstanceTypes = [str(instance_type)],
+                      ProductDescriptions = ['Linux/UNIX'],
+                      StartTime = datetime.now(timezone.utc))
+        if zone is not None:
+            params['AvailabilityZone'] = zone
+        try:
+            history = self.ec2_resource(region).meta.client.describe_spot_price_history(**params)['SpotPriceHistory']
+            price = min(float(entry['SpotPrice']) for entry in history)
+        except Exception as e:
+            # e.g. no permission on DescribeSpotPriceHistory, or no price for the instance type (kept as well)
+            print(f"Cannot get the spot price of {instance_type} in {zone or region}, using cloud.yaml: {e}")
+            price = self.catalog.spot_price_of(instance_type)
+
+        self._spot_prices[key] = (time.time(), price)
+        return price
+
+    def check_interruption(self, node_name):
+        """Member function: check whether the spot instance of a node name of the user was interrupted by AWS
+        An instance terminated by AWS (state reason Server.SpotInstanceTermination) is recorded into the usage ledger,
+        a running instance with an interruption notice (the two-minute warning, see spot_interruption_codes) is terminated.
+
+        Return: the reason of the interruption, None if the instance was not interrupted
+        """
+        user_name = os.environ['USER']
+        instances = list(self.get_instances(filters = [
+            { "Name" : "tag:Name", "Values" : [node_name] },
+            { "Name" : "tag:User", "Values" : [user_name] },
+            { "Name" : "instance-lifecycle", "Values" : ["spot"] },
+            { "Name" : "instance-state-name", "Values" : ["pending", "running", "shutting-down", "terminated", "stopping", "stopped"] },
+        ]))
+        if len(instances) == 0:
+            return None
+        # the latest instance of the node name
+        instance = max(instances, key=lambda instance: instance.launch_time)
+
+        if instance.state['Name'] in ['shutting-down', 'terminated']:
+            state_reason = instance.state_reason or {}
+            if state_reason.get('Code') != 'Server.SpotInstanceTermination':
+                return None
+            # the time of the termination is given by the state transition reason, e.g. "... (2024-06-05 12:00:00 GMT)"
+            end = datetime.now(timezone.utc)
+            match = re.search(r'\((\d{4}-\d\d-\d\d \d\d:\d\d:\d\d) GMT\)', instance.state_transition_reason or "")
+            if match is not None:
+                end = datetime.strptime(match.group(1), "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+            self.record_interrupted_usage(user_name, instance.instance_id, instance.instance_type,
+                                          instance.launch_time, end, self.get_unit_price_instance(instance))
+            self.invalidate_listing()
+            return state_reason.get('Message', 'Server.SpotInstanceTermination')
+
+        if instance.spot_instance_request_id is None:
+            return None
+        client = self.ec2_resource(self.get_instance_region(instance)).meta.client
+        requests = client.describe_spot_instance_requests(SpotInstanceRequestIds=[instance.spot_instance_request_id])['SpotInstanceRequests']
+        status = requests[0].get('Status', {}) if len(requests) > 0 else {}
+        if status.get('Code') not in spot_interruption_codes:
+            return None
+
+        # terminated (and recorded) now rather than by AWS in two minutes
+        self.inventory(refresh=True)
+        self.destroy_nodes(node_names=[node_name], need_confirmation=False)
+        return status.get('Message', status.get('Code'))
 
     def get_unit_price(self, node_type: str):
         """
         Get the per-hour price of an instance depending on its node type (e.g. t1)
         """
-        if node_type in self.vendor['node-types']:
-            return self.vendor['node-types'][node_type]['price']
-        return -1.0
+        return self.catalog.price(node_type)
 
-    def get_running_cost(self, verbose=True):
-        instances = self.get_instances()
+    def get_running_cost(self, verbose=True, user_name=None):
+        if user_name is None:
+            instances = self.inventory().in_states(['running'])
+        else:
+            # only the running instances of the user are listed
+            instances = self.get_instances(filters = [
+                { "Name" : "tag:User", "Values" : [user_name] },
+                { "Name" : "instance-state-name", "Values" : ["running"] },
+            ])
 
         nodes = []
         total_cost = 0.0
@@ -766,7 +1149,7 @@ class AWS(Cloud):
             if instance.state['Name'] == 'running':
                 running_time = datetime.now(timezone.utc) - instance.launch_time
                 instance_unit_cost = self.get_unit_price_instance(instance)
-                running_cost = running_time.seconds/3600.0 * instance_unit_cost
+                running_cost = running_time.total_seconds()/3600.0 * instance_unit_cost
                 total_cost = total_cost + running_cost
                 nodes.append([self.get_instance_name(instance),
                                     instance.state['Name'], 
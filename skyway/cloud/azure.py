@@ -6,27 +6,23 @@
 Documentation for Azure Class
 """
 
+import base64
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 import io
-import logging
 import os
 import subprocess
+import threading
 from tabulate import tabulate
 
+from .catalog import NodeTypeCatalog
 from .core import Cloud
 from .. import utils
 
 from colorama import Fore
-import pandas as pd
 
-from azure.identity import ClientSecretCredential
-from azure.mgmt.compute import ComputeManagementClient
-from azure.mgmt.network import NetworkManagementClient
-from azure.mgmt.resource import ResourceManagementClient
-
-from libcloud.compute.types import Provider
-from libcloud.compute.providers import get_driver
-from libcloud.compute.drivers.azure_arm import AzureImage, NodeAuthSSHKey
+# NOTE: the Azure SDKs, apache-libcloud and pandas are imported where they are first used,
+#       so that constructing the driver, or running commands that do not call the API, stays cheap
 
 class AZURE(Cloud):
 
@@ -40,9 +36,10 @@ class AZURE(Cloud):
 
         #super().__init__(vendor_cfg, kwargs)
 
-        # load [account].yaml under $SKYWAYROOT/etc/accounts
+        # load [account].yaml under $SKYWAYROOT/etc/accounts and the azure section of cloud.yaml under $SKYWAYROOT/etc/
+        # (validated and cached, see utils.load_account_config)
         account_path = os.environ['SKYWAYROOT'] + '/etc/accounts/'
-        account_cfg = utils.load_config(account, account_path)
+        account_cfg, vendor_cfg = utils.load_account_config(account)
         if account_cfg['cloud'] != 'azure' :
             raise Exception(f'Cloud vendor azure is not associated with this account.')
 
@@ -55,33 +52,98 @@ class AZURE(Cloud):
             self.public_key = content.strip()
 
         self.usage_history = f"{account_path}usage-{account}.pkl"
+        self.usage_ledger = f"{account_path}usage-{account}.db"
 
-        # load cloud.yaml under $SKYWAYROOT/etc/
-        cloud_path = os.environ['SKYWAYROOT'] + '/etc/'
-        vendor_cfg = utils.load_config('cloud', cloud_path)
-        if 'azure' not in vendor_cfg:
-            raise Exception(f'Service provider azure is undefined.')
-      
-        self.vendor = vendor_cfg['azure']
+        self.vendor = vendor_cfg
+        # instance type -> price, cores, memory and GPUs of the node types in cloud.yaml
+        self.catalog = NodeTypeCatalog(vendor_cfg['node-types'])
         self.account_name = account
         self.onpremises = False
 
-        self.credentials = ClientSecretCredential(client_id=self.account['client_id'],
-                                                  client_secret=self.account['client_secret'],
-                                                  tenant_id=self.account['tenant_id'])
+        # the credentials, the clients and the libcloud driver are created on first use, see the properties below
+        self._credentials = None
+        self._network_client = None
+        self._compute_client = None
+        self._driver = None
+        # the drivers of the threads creating nodes in parallel (libcloud connections are not thread-safe)
+        self._thread_drivers = threading.local()
+
+        # the location of the nodes
+        self.location_name = 'East US'  # Replace with your desired location
+        # the subnets (per user) looked up once per driver by create_nodes, the location and sizes are in the vendor metadata
+        self._subnets = {}
+        return
+
+    @property
+    def credentials(self):
+        """
+        The Azure client secret credential of the account, created on first use
+        """
+        if self._credentials is None:
+            from azure.identity import ClientSecretCredential
+            self._credentials = ClientSecretCredential(client_id=self.account['client_id'],
+                                                       client_secret=self.account['client_secret'],
+                                                       tenant_id=self.account['tenant_id'])
+        return self._credentials
+
+    @property
+    def network_client(self):
+        """
+        The Azure network management client of the account, created on first use (the Azure SDK clients are thread-safe)
+        """
+        if self._network_client is None:
+            from azure.mgmt.network import NetworkManagementClient
+            self._network_client = NetworkManagementClient(self.credentials, self.account['subscription_id'])
+        return self._network_client
+
+    @property
+    def compute_client(self):
+        """
+        The Azure compute management client of the account, created on first use (used for the Spot VMs, see create_spot_node)
+        """
+        if self._compute_client is None:
+            from azure.mgmt.compute import ComputeManagementClient
+            self._compute_client = ComputeManagementClient(self.credentials, self.account['subscription_id'])
+        return self._compute_client
+
+    @property
+    def driver(self):
+        """
+        The libcloud Azure ARM driver of the account, created on first use
+        """
+        if self._driver is not None:
+            return self._driver
 
+        self._driver = self._new_driver()
+        return self._driver
+
+    @property
+    def thread_driver(self):
+        """
+        A libcloud Azure ARM driver owned by the calling thread, created on first use
+        """
+        driver = getattr(self._thread_drivers, 'driver', None)
+        if driver is None:
+            driver = self._new_driver()
+            self._thread_drivers.driver = driver
+        return driver
+
+    def _new_driver(self):
+        from libcloud.compute.types import Provider
+        from libcloud.compute.providers import get_driver
+        driver = None
         try:
             Azure = get_driver(Provider.AZURE_ARM)
-            self.driver = Azure(tenant_id=self.credentials._tenant_id,
-                                subscription_id=self.account['subscription_id'],
-                                key=self.credentials._client_id,
-                                secret=self.account['client_secret'])
+            driver = Azure(tenant_id=self.account['tenant_id'],
+                           subscription_id=self.account['subscription_id'],
+                           key=self.account['client_id'],
+                           secret=self.account['client_secret'])
 
         except Exception as e:
             print(f"An error occurred: {e}")
        
-        assert(self.driver != False)
-        return
+        assert(driver is not None)
+        return driver
 
     def list_nodes(self, show_protected_nodes=False, verbose=False):
         """Member function: list_nodes
@@ -93,7 +155,7 @@ class AZURE(Cloud):
         """
         nodes = []
         current_time = datetime.now(timezone.utc)
-        for node in self.driver.list_nodes():
+        for node in self.inventory():
             
             # Get the creation time of the instance
             creation_time_str = node.extra.get('properties')['timeCreated']  # Azure
@@ -115,7 +177,7 @@ class AZURE(Cloud):
                 # get the node type
                 node_type = node.extra.get('properties')['hardwareProfile']['vmSize']
                 instance_unit_cost = self.get_unit_price_instance(node)
-                running_cost = running_time.seconds/3600.0 * instance_unit_cost
+                running_cost = running_time.total_seconds()/3600.0 * instance_unit_cost
              
                 nodes.append([node.name, node.state, node_type, node.id, "n/a", running_time, running_cost])
 
@@ -129,19 +191,27 @@ class AZURE(Cloud):
             print("", file=output_str)
         return nodes, output_str            
 
-    def create_nodes(self, node_type: str, node_names = [], interactive = False, need_confirmation = True, walltime = None):
+    def create_nodes(self, node_type: str, node_names = [], interactive = False, need_confirmation = True, walltime = None, spot = False):
+        '''
+        create the VMs of the node names with the size of the node type,
+        Spot VMs (at the spot-price of the node type in cloud.yaml) if spot is True, which Azure may evict
+        '''
         user_name = os.environ['USER']
         user_budget = self.get_budget(user_name=user_name, verbose=False)
         usage, remaining_balance = self.get_cost_and_usage_from_db(user_name=user_name)
-        running_cost = self.get_running_cost(verbose=False)
+        running_cost = self.get_running_cost(verbose=False, user_name=user_name)
         usage = usage + running_cost
         remaining_balance = user_budget - usage
         unit_price = self.vendor['node-types'][node_type]['price']
+        market = ""
+        if spot == True:
+            unit_price = self.catalog.spot_price(node_type)
+            market = "Spot "
         if need_confirmation == True:
             print(f"User budget: ${user_budget:.3f}")
             print(f"+ Usage    : ${usage:.3f}")
             print(f"+ Available: ${remaining_balance:.3f}")
-            response = input(f"Do you want to create an instance of type {node_type} (${unit_price}/hr)? (y/n) ")
+            response = input(f"Do you want to create a {market}instance of type {node_type} (${unit_price}/hr)? (y/n) ")
             if response == 'n':
                 return
 
@@ -152,33 +222,24 @@ class AZURE(Cloud):
         node_cfg = self.vendor['node-types'][node_type]
         size_name = node_cfg['name']           # e.g. "Standard_DS1_v2"
         
-        if walltime is None:
-            walltime_str = "00:05:00"
-        else:
-            walltime_str = walltime
+        # the shutdown after the walltime is scheduled by cloud-init while the node boots (custom data)
+        custom_data = self.get_post_boot_script(walltime)
 
-        # shutdown the instance after the walltime (in minutes)
-        pt = datetime.strptime(walltime_str, "%H:%M:%S")
-        walltime_in_minutes = int(pt.hour * 60 + pt.minute + pt.second/60)
+        # the location, sizes and resource group from the vendor metadata of the account (see fetch_metadata)
+        location_name = self.location_name
+        resource_group_name = self.account['resource_group']   #"rg_skyway"
+        metadata = self.get_metadata()
+        if metadata['location'].name != location_name or metadata['resource_group'] != resource_group_name:
+            metadata = self.get_metadata(refresh=True)
+        location = metadata['location']
 
-        location_name = 'East US'  # Replace with your desired location
-        locations = self.driver.list_locations()
-        location = next((loc for loc in locations if loc.name == location_name), None)
-        if location is None:
-            raise ValueError(f"Location '{location_name}' not found.")
+        from libcloud.compute.drivers.azure_arm import AzureImage, NodeAuthSSHKey
 
         # authentication with public key on this machine per-user (id_rsa_azure.pub)
         # need to read in from ~/.ssh/id_rsa_azure.pub from the account .yaml file
         auth = NodeAuthSSHKey(self.public_key)
 
-        # Initialize Azure management clients
-        subscription_id = self.account['subscription_id']
-        resource_client = ResourceManagementClient(self.credentials, subscription_id)
-        network_client = NetworkManagementClient(self.credentials, subscription_id)
-        compute_client = ComputeManagementClient(self.credentials, subscription_id)
-
-        sizes = self.driver.list_sizes(location=location)
-        size = next((s for s in sizes if s.name == size_name), None)
+        size = metadata['sizes'].get(size_name)
         if size is None:
             raise ValueError(f"Size '{size_name}' not found.")
 
@@ -189,81 +250,189 @@ class AZURE(Cloud):
         version = 'latest'
         image = AzureImage(version=version, publisher=publisher, sku=sku, offer=offer, driver=self.driver, location=location)
 
-        # Step 2: Create a resource group if it doesn't exist    
+        # Step 2: the resource group (created with the metadata if it doesn't exist)
         # resource group is already created on the subscription (could move to account)
-        resource_group_name = self.account['resource_group']   #"rg_skyway"
-        resource_client.resource_groups.create_or_update(resource_group_name, {"location": location_name})
 
-        # then for each node in the list
-        for node_name in node_names:
-            
-            # Step 3: Create Virtual Network and Subnet if they don't exist
-            vnet_name = "vnet-{}-{}".format(user_name, node_name)
-            subnet_name = "subnet-{}-{}".format(user_name, node_name)
-            vnet_params = {
-                "location": location_name,
-                "address_space": {"address_prefixes": ["10.0.0.0/16"]}
-            }
-            network_client.virtual_networks.begin_create_or_update(resource_group_name, vnet_name, vnet_params).result()
+        # Step 3: the virtual network and subnet of the user, shared by all the nodes of the user
+        subnet_id = self.get_user_subnet(user_name, resource_group_name, location_name)
 
-            subnet_params = {
-                "address_prefix": "10.0.0.0/24"
-            }
-            network_client.subnets.begin_create_or_update(resource_group_name, vnet_name, subnet_name, subnet_params).result()
-
-            # Step 4: Create a network interface
-            nic_name = "my-nic-{}".format(user_name, node_name)
-            public_ip = self.driver.ex_create_public_ip(name=f'my_public_ip-{user_name}-{node_name}',
-                                                        resource_group=resource_group_name,
-                                                        location=location)
-            ip_config = {
-                "name": "ipconfig1",
-                "subnet": {"id": 
-                               f"/subscriptions/{subscription_id}/resourceGroups/{resource_group_name}/providers/Microsoft.Network/virtualNetworks/{vnet_name}/subnets/{subnet_name}"
-                          },
-                'public_ip': public_ip
-            }
-        
-            nic_params = {
-                "location": location_name,
-                "ip_configurations": [ip_config]
-            }
-            network_interface = network_client.network_interfaces.begin_create_or_update(resource_group_name,
-                                                                                         nic_name,
-                                                                                         nic_params).result()
+        # then for each node in the list, at the same time:
+        # Step 4: a public IP and a network interface, Step 5: the instance as soon as its network interface is ready
+        network_client = self.network_client
 
-            # Step 5: Create the instance          
+        def create_node(node_name):
             try:
+                public_ip_params = {
+                    "location": location_name,
+                    "sku": {"name": "Standard"},
+                    "public_ip_allocation_method": "Static"
+                }
+                public_ip = network_client.public_ip_addresses.begin_create_or_update(resource_group_name,
+                                                                                      f'my_public_ip-{user_name}-{node_name}',
+                                                                                      public_ip_params).result()
+                ip_config = {
+                    "name": "ipconfig1",
+                    "subnet": {"id": subnet_id},
+                    "public_ip_address": {"id": public_ip.id}
+                }
+                nic_params = {
+                    "location": location_name,
+                    "ip_configurations": [ip_config]
+                }
+                nic_name = "my-nic-{}-{}".format(user_name, node_name)
+                network_interface = network_client.network_interfaces.begin_create_or_update(resource_group_name,
+                                                                                             nic_name,
+                                                                                             nic_params).result()
+
                 tags = { 'node_name': node_name, 'user': user_name }
-                node = self.driver.create_node(name=node_name,
-                                               size=size,
-                                               image=image,
-                                               auth=auth,
-                                               location=location,
-                                               ex_resource_group=resource_group_name,
-                                               ex_nic=network_interface,
-                                               ex_use_managed_disks=True,
-                                               ex_tags = tags)
+                if spot == True:
+                    return self.create_spot_node(node_name, size_name, image, location_name, resource_group_name,
+                                                 network_interface, custom_data, tags)
+                return self.thread_driver.create_node(name=node_name,
+                                                      size=size,
+                                                      image=image,
+                                                      auth=auth,
+                                                      location=location,
+                                                      ex_resource_group=resource_group_name,
+                                                      ex_nic=network_interface,
+                                                      ex_use_managed_disks=True,
+                                                      ex_customdata=custom_data,
+                                                      ex_tags = tags)
             except Exception as ex:
-                logging.info("Failed to create %s. Reason: %s" % (node_name, str(ex)))
+                print(f"Failed to create {node_name}. Reason: {ex}")
+                return None
 
+        # at most create-workers nodes (cloud.yaml, default 16) are provisioned at the same time
+        max_workers = max(1, min(count, int(self.vendor.get('create-workers', 16))))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            created = list(executor.map(create_node, node_names))
+
+        for node_name, node in zip(node_names, created):
+            if node is None:
+                continue
             node_type = node.extra.get('properties')['hardwareProfile']['vmSize']
             creation_time_str = node.extra.get('properties')['timeCreated']
             nodes[node_name] = [str(node.id), node_type, creation_time_str]
 
             print(f"\nCreated instance: {node_name}")
 
-            # ssh to the node and execute a shutdown command scheduled for walltime
-            '''
-            host = node.public_ips[0]
-            user_name = os.environ['USER']
-            print("Connecting to host: " + host)          
-            cmd = f"ssh -o StrictHostKeyChecking=accept-new {user_name}@{host} -t 'sudo shutdown -P {walltime_in_minutes}' "
-            os.system(cmd)
-            '''
-
+        self.invalidate_listing()
         return nodes
 
+    def create_spot_node(self, node_name, size_name, image, location_name, resource_group_name, network_interface, custom_data, tags):
+        """
+        Create a Spot VM with the Azure compute SDK (the libcloud driver does not set the priority of the VMs),
+        with the image, managed disk, SSH key and custom data of the VMs created by libcloud:
+        billed at most the on-demand price, deallocated when evicted (see check_interruption)
+
+        Return: the libcloud node of the VM
+        """
+        # the admin user and the authorized key of libcloud (ex_admin_user_id and NodeAuthSSHKey)
+        admin_user = "azureuser"
+        vm_params = {
+            "location": location_name,
+            "tags": tags,
+            "priority": "Spot",
+            "eviction_policy": "Deallocate",
+            "billing_profile": {"max_price": -1},
+            "hardware_profile": {"vm_size": size_name},
+            "storage_profile": {
+                "image_reference": {
+                    "publisher": image.publisher,
+                    "offer": image.offer,
+                    "sku": image.sku,
+                    "version": image.version
+                },
+                "os_disk": {
+                    "create_option": "FromImage",
+                    "managed_disk": {"storage_account_type": "Standard_LRS"},
+                    "delete_option": "Delete"
+                }
+            },
+            "os_profile": {
+                "computer_name": node_name,
+                "admin_username": admin_user,
+                "custom_data": base64.b64encode(custom_data.encode()).decode(),
+                "linux_configuration": {
+                    "disable_password_authentication": True,
+                    "ssh": {"public_keys": [{"path": f"/home/{admin_user}/.ssh/authorized_keys", "key_data": self.public_key}]}
+                }
+            },
+            "network_profile": {"network_interfaces": [{"id": network_interface.id}]}
+        }
+        vm = self.compute_client.virtual_machines.begin_create_or_update(resource_group_name, node_name, vm_params).result()
+        return self.thread_driver.ex_get_node(vm.id)
+
+    def check_interruption(self, node_name):
+        """
+        Check whether the Spot VM of a node name of the user was evicted by Azure: an evicted VM is deallocated
+        (a VM shut down after its walltime is stopped, not deallocated), it is destroyed and its usage recorded
+
+        Return: the reason of the interruption, None if the VM was not evicted
+        """
+        user_name = os.environ['USER']
+        node = self.inventory(refresh=True).find(node_name)
+        if node is None or self.get_instance_user_name(node) != user_name:
+            return None
+        if (node.extra.get('properties') or {}).get('priority') != 'Spot' or node.state != 'stopped':
+            return None
+
+        self.destroy_nodes([node_name], need_confirmation=False)
+        return "evicted (deallocated) by Azure"
+
+    def fetch_metadata(self):
+        """
+        The location of the nodes, the VM sizes (e.g. Standard_DS1_v2) of the node types in cloud.yaml in the location,
+        and the resource group of the account (created if it doesn't exist), used by create_nodes
+        """
+        location = next((loc for loc in self.driver.list_locations() if loc.name == self.location_name), None)
+        if location is None:
+            raise ValueError(f"Location '{self.location_name}' not found.")
+
+        size_names = set(node_cfg['name'] for node_cfg in self.vendor['node-types'].values())
+        sizes = { size.name: size for size in self.driver.list_sizes(location=location) if size.name in size_names }
+
+        resource_group_name = self.account['resource_group']
+        self.create_resource_group(resource_group_name, self.location_name)
+        return { 'location': location, 'sizes': sizes, 'resource_group': resource_group_name }
+
+    def create_resource_group(self, resource_group_name, location_name):
+        """
+        Create the resource group of the account if it doesn't exist
+        """
+        from azure.mgmt.resource import ResourceManagementClient
+        resource_client = ResourceManagementClient(self.credentials, self.account['subscription_id'])
+        resource_client.resource_groups.create_or_update(resource_group_name, {"location": location_name})
+
+    def get_user_subnet(self, user_name, resource_group_name, location_name):
+        """
+        The ID of the subnet of a user (vnet-[user]/subnet-[user]), shared by all the nodes of the user,
+        created with its virtual network if it doesn't exist
+        """
+        if user_name in self._subnets:
+            return self._subnets[user_name]
+
+        from azure.core.exceptions import ResourceNotFoundError
+        vnet_name = "vnet-{}".format(user_name)
+        subnet_name = "subnet-{}".format(user_name)
+        try:
+            subnet = self.network_client.subnets.get(resource_group_name, vnet_name, subnet_name)
+        except ResourceNotFoundError:
+            vnet_params = {
+                "location": location_name,
+                "address_space": {"address_prefixes": ["10.0.0.0/16"]}
+            }
+            self.network_client.virtual_networks.begin_create_or_update(resource_group_name, vnet_name, vnet_params).result()
+
+            # room for the nodes of the user (up to 4091 nodes)
+            subnet_params = {
+                "address_prefix": "10.0.0.0/20"
+            }
+            subnet = self.network_client.subnets.begin_create_or_update(resource_group_name, vnet_name, subnet_name, subnet_params).result()
+
+        self._subnets[user_name] = subnet.id
+        return subnet.id
+
     def execute(self, node_name: str, **kwargs):
         '''
         execute commands on a node
@@ -297,14 +466,15 @@ class AZURE(Cloud):
         if isinstance(node_names, str): node_names = [node_names]
         user_name = os.environ['USER']
 
-        nodes = self.driver.list_nodes()
+        # one listing for all the nodes to destroy
+        inventory = self.inventory()
         for name in node_names:
             #node = self.driver.ex_get_node(name)
-            node = next((nd for nd in nodes if nd.name == name), None)
+            node = inventory.find(name)
             if node is None:
                 raise ValueError(f"Node {name} not found.")
 
-            node_user_name = self.get_instance_user_name(node)
+            node_user_name = inventory.user_of(node)
             if  node_user_name != user_name:
                 print(f"Cannot destroy an instance {name} created by other users")
                 continue
@@ -322,7 +492,7 @@ class AZURE(Cloud):
             # get the node type
             node_type = node.extra.get('properties')['hardwareProfile']['vmSize']
             instance_unit_cost = self.get_unit_price_instance(node)
-            running_cost = running_time.seconds/3600.0 * instance_unit_cost
+            running_cost = running_time.total_seconds()/3600.0 * instance_unit_cost
 
             if need_confirmation == True:
                 response = input(f"Do you want to destroy {node.name} (running cost ${running_cost:0.5f})? (y/n) ")
@@ -330,31 +500,25 @@ class AZURE(Cloud):
                     continue
             # record the running time and cost
             running_time = datetime.now(timezone.utc) - creation_time
-            running_cost = running_time.seconds/3600.0 * instance_unit_cost
-            usage, remaining_balance = self.get_cost_and_usage_from_db(user_name=user_name)
-            
-            # store the record into the database
-            data = [node_user_name, node.id, node_type, 
-                    creation_time, datetime.now(timezone.utc), running_cost, remaining_balance]
-            
-            if os.path.isfile(self.usage_history):
-                df = pd.read_pickle(self.usage_history)
-            else:
-                df = pd.DataFrame([], columns=['User','InstanceID','InstanceType','Start','End', 'Cost','Balance'])
-
-            df = pd.concat([pd.DataFrame([data], columns=df.columns), df], ignore_index=True)
-            df.to_pickle(self.usage_history)
+            running_cost = running_time.total_seconds()/3600.0 * instance_unit_cost
+            # store the record into the usage ledger
+            self.record_usage(node_user_name, node.id, node_type,
+                              creation_time, datetime.now(timezone.utc), running_cost)
 
             # order to destroy: VM, IP, NIC, VNET
             self.driver.destroy_node(node)
+            self.invalidate_listing()
 
             # there might be resources leftover: IP, NIC and VNET
+            # (the virtual network of the user is shared by its nodes and kept, only the ones of the nodes
+            #  created before the shared virtual networks are deleted)
+            from azure.mgmt.resource import ResourceManagementClient
             subscription_id = self.account['subscription_id']
             resource_client = ResourceManagementClient(self.credentials, subscription_id)
 
             resource_group_name = self.account['resource_group']
             public_ip_name = "my_public_ip-{}-{}".format(user_name, name)
-            nic_name = "my-nic-{}".format(user_name, name)
+            nic_name = "my-nic-{}-{}".format(user_name, name)
             vnet_name = "vnet-{}-{}".format(user_name, name)
 
             # 2022-11-01 is the API version, may change
@@ -423,57 +587,6 @@ class AZURE(Cloud):
                 print(f"Total: ${total_budget}")
             return total_budget
 
-    def get_cost_and_usage_from_db(self, user_name):
-        '''
-        compute the accumulating cost from the pkl database
-        and the remaining balance
-        '''
-        if user_name not in self.users:
-            raise Exception(f"{user_name} is not listed in the user group of this account.")
-                
-        user_budget = self.users[user_name]['budget']
-
-        if not os.path.isfile(self.usage_history):
-            print(f"Usage history {self.usage_history} is not available")
-            data = [user_name, "--", "--", "00:00:00", "00:00:00", 0.0, user_budget]
-            df = pd.DataFrame([], columns=['User','InstanceID','InstanceType','Start','End','Cost','Balance'])
-            df = pd.concat([pd.DataFrame([data], columns=df.columns), df], ignore_index=True)
-            df.to_pickle(self.usage_history)
-            return 0, user_budget
-
-        df = pd.read_pickle(self.usage_history)
-        df_user = df.loc[df['User'] == user_name]
-        df_user = df_user.astype({"Cost": float})
-        accumulating_cost = df_user['Cost'].sum()
-        remaining_balance = user_budget - accumulating_cost
-
-        return accumulating_cost, remaining_balance
-
-    def get_usage_history_from_db(self, user_name):
-        '''
-        compute the accumulating cost from the pkl database
-        and the remaining balance
-        '''
-        if user_name not in self.users:
-            raise Exception(f"{user_name} is not listed in the user group of this account.")
-                
-        user_budget = self.users[user_name]['budget']
-
-        if not os.path.isfile(self.usage_history):
-            print(f"Usage history {self.usage_history} is not available")
-            data = [user_name, "--", "--", "00:00:00", "00:00:00", "0.0", user_budget]
-            df = pd.DataFrame([], columns=['User','InstanceID','InstanceType','Start','End', 'Cost', 'Balance'])
-            #df = pd.DataFrame(columns=['User','InstanceID','InstanceType','Start','End', 'Cost', 'Balance'])
-            df = pd.concat([pd.DataFrame([data], columns=df.columns), df], ignore_index=True)
-            df.to_pickle(self.usage_history)
-            return 0, user_budget
-
-        df = pd.read_pickle(self.usage_history)
-        df_user = df.loc[df['User'] == user_name]
-        
-        history = df_user[['User','InstanceID','InstanceType','Start','End']]
-        return history
-
     def get_node_types(self):
         """
         List all the node (instance) types provided by the vendor and their unit prices
@@ -516,7 +629,7 @@ class AZURE(Cloud):
         """
         nodes = []
         current_time = datetime.now(timezone.utc)
-        for node in self.driver.list_nodes():
+        for node in self.inventory().in_states(['running']):
             if node.state == "running":
                 # Get the creation time of the instance
                 creation_time_str = node.extra.get('properties')['timeCreated']  # Azure
@@ -545,20 +658,17 @@ class AZURE(Cloud):
         """
         Get the per-hour price of an instance depending on its instance_type (e.g. t2.micro) from the cloud.yaml file
         """
-        for node_type in self.vendor['node-types']:
-            vmtype = node.extra.get('properties')['hardwareProfile']['vmSize']
-            if self.vendor['node-types'][node_type]['name'] == vmtype:
-                instance_type = self.vendor['node-types'][node_type]['name']
-                unit_price = self.vendor['node-types'][node_type]['price']
-                return unit_price
+        vmtype = node.extra.get('properties')['hardwareProfile']['vmSize']
+        # the spot-price of the node type for a Spot VM
+        if node.extra.get('properties').get('priority') == 'Spot':
+            return self.catalog.spot_price_of(vmtype)
+        return self.catalog.price_of(vmtype)
 
     def get_unit_price(self, node_type: str):
         """
         Get the per-hour price of an instance depending on its instance_type (e.g. t1) from the cloud.yaml file
         """
-        if node_type in self.vendor['node-types']:
-            return self.vendor['node-types'][node_type]['price']
-        return -1.0
+        return self.catalog.price(node_type)
 
     def get_host_ip(self, node_name):
         pass
@@ -579,13 +689,27 @@ class AZURE(Cloud):
         '''
         return node.extra.get('tags', {}).get('user')
 
-    def get_running_cost(self, verbose=True):
+    def get_instances(self, filters = []):
+        '''
+        get the list of nodes in the resource group of the account
+        (the NICs are not fetched, one request less per node: the host IPs are not used)
+        '''
+        return self.driver.list_nodes(ex_resource_group=self.account['resource_group'], ex_fetch_nic=False)
+
+    def get_running_cost(self, verbose=True, user_name=None):
 
         current_time = datetime.now(timezone.utc)
 
+        # the VM list API does not filter by tag: the nodes of a user are selected from the inventory
+        inventory = self.inventory()
+        if user_name is None:
+            instances = inventory.in_states(['running'])
+        else:
+            instances = inventory.of_user(user_name, states=['running'])
+
         nodes = []
         total_cost = 0.0
-        for node in self.driver.list_nodes():
+        for node in instances:
             if self.get_instance_name(node) in self.account['protected_nodes']:
                 continue
             if node.state == "running":
@@ -607,7 +731,7 @@ class AZURE(Cloud):
                     node_type = node.extra.get('properties')['hardwareProfile']['vmSize']
 
                     instance_unit_cost = self.get_unit_price_instance(node)
-                    running_cost = running_time.seconds/3600.0 * instance_unit_cost
+                    running_cost = running_time.total_seconds()/3600.0 * instance_unit_cost
                     total_cost = total_cost + running_cost
 
                     nodes.append([node.name, node_type, running_time, running_cost])
@@ -0,0 +1,73 @@
+# Copyright (c) 2019-2024 The University of Chicago.
+# Part of skyway, released under the BSD 3-Clause License.
+
+# Maintainer: Trung Nguyen, Yuxing Peng
+
+"""@package docstring
+Node type catalog: the node types of a vendor in cloud.yaml, indexed by their skyway name (e.g. c1)
+and by the vendor instance type (e.g. c5.large, n1-standard-1, Standard_DS1_v2, VM.Standard.E4.Flex),
+so that the price of a listed instance is a dictionary lookup.
+
+The spot-price entry of a node type (optional) is the per-hour price of its spot/preemptible nodes
+(skyway alloc --spot), the on-demand price if not given.
+
+The drivers build the catalog once when they are created (see self.catalog).
+"""
+
+from collections import namedtuple
+
+NodeType = namedtuple('NodeType', ['node_type', 'name', 'price', 'cores', 'memgb', 'gpu', 'gpu_type', 'spot_price'])
+
+class NodeTypeCatalog():
+    """
+    The node types of a vendor, indexed by node type and by vendor instance type
+    """
+
+    def __init__(self, node_types):
+        self.by_type = {}
+        self.by_name = {}
+        for node_type, entry in (node_types or {}).items():
+            price = float(entry.get('price', -1.0))
+            info = NodeType(node_type, str(entry.get('name', node_type)), price,
+                            entry.get('cores'), entry.get('memgb'), entry.get('gpu', 0), entry.get('gpu-type'),
+                            float(entry.get('spot-price', price)))
+            self.by_type[node_type] = info
+            # several node types may share an instance type: the first one gives the price
+            self.by_name.setdefault(info.name, info)
+
+    def __len__(self):
+        return len(self.by_type)
+
+    def lookup(self, instance_type):
+        '''
+        the node type of a vendor instance type (e.g. t2.micro), None if not in cloud.yaml
+        '''
+        return self.by_name.get(str(instance_type))
+
+    def price_of(self, instance_type):
+        '''
+        the per-hour price of a vendor instance type, -1.0 if not in cloud.yaml
+        '''
+        info = self.by_name.get(str(instance_type))
+        return -1.0 if info is None else info.price
+
+    def price(self, node_type):
+        '''
+        the per-hour price of a node type (e.g. t1), -1.0 if not in cloud.yaml
+        '''
+        info = self.by_type.get(node_type)
+        return -1.0 if info is None else info.price
+
+    def spot_price_of(self, instance_type):
+        '''
+        the per-hour price of a spot/preemptible node of a vendor instance type, -1.0 if not in cloud.yaml
+        '''
+        info = self.by_name.get(str(instance_type))
+        return -1.0 if info is None else info.spot_price
+
+    def spot_price(self, node_type):
+        '''
+        the per-hour price of a spot/preemptible node of a node type (e.g. t1), -1.0 if not in cloud.yaml
+        '''
+        info = self.by_type.get(node_type)
+        return -1.0 if info is None else info.spot_price
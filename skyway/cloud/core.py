@@ -3,7 +3,10 @@
 
 # Maintainer: Yuxing Peng, Trung Nguyen
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import os
+import threading
+from datetime import timedelta
 from tabulate import tabulate
 from .. import utils
 
@@ -57,23 +60,130 @@ class Cloud():
         '''
         pass
 
+    @property
+    def ledger(self):
+        '''
+        the usage ledger of the account (usage-[account].db next to the account file), opened on first use
+        '''
+        if getattr(self, '_ledger', None) is None:
+            from ..ledger import UsageLedger
+            self._ledger = UsageLedger(self.usage_ledger, self.usage_history)
+        return self._ledger
+
     def get_cost_and_usage_from_db(self, user_name):
         '''
-        compute the accumulating cost from the pkl database
+        compute the accumulating cost from the usage ledger
         and the remaining balance
         '''
-        accumulating_cost = 0
-        remaining_balance = 0
+        if user_name not in self.users:
+            raise Exception(f"{user_name} is not listed in the user group of this account.")
+
+        user_budget = self.users[user_name]['budget']
+        accumulating_cost = self.ledger.user_cost(user_name)
+        remaining_balance = float(user_budget) - float(accumulating_cost)
         return accumulating_cost, remaining_balance
 
     def get_usage_history_from_db(self, user_name):
         '''
-        return the list of jobs/instances
+        return the list of jobs/instances of a user from the usage ledger
         '''
-        pass
+        if user_name not in self.users:
+            raise Exception(f"{user_name} is not listed in the user group of this account.")
+
+        return self.ledger.history(user_name)
+
+    def record_usage(self, user_name, instance_id, instance_type, start, end, cost):
+        '''
+        store the running time and cost of a terminated node into the usage ledger
+        '''
+        usage, remaining_balance = self.get_cost_and_usage_from_db(user_name=user_name)
+        self.ledger.append(user_name, instance_id, instance_type, start, end, cost, remaining_balance)
+
+    def record_interrupted_usage(self, user_name, instance_id, instance_type, start, end, unit_price):
+        '''
+        store the running time and cost of a node interrupted by the vendor (gone without destroy_nodes)
+        into the usage ledger, once per node
+        '''
+        if self.ledger.has_instance(instance_id):
+            return
+        running_cost = (end - start).total_seconds()/3600.0 * unit_price
+        self.record_usage(user_name, instance_id, instance_type, start, end, running_cost)
 
     # instance operations
 
+    def inventory(self, refresh=False):
+        '''
+        the instances of the account from one call to get_instances(), indexed by name, ID, user and state;
+        kept until refresh is True or invalidate_inventory() is called
+        '''
+        if refresh == True or getattr(self, '_inventory', None) is None:
+            from .inventory import Inventory
+            self._inventory = Inventory(self.get_instances(), self.get_instance_keys)
+        return self._inventory
+
+    def invalidate_inventory(self):
+        '''
+        drop the inventory, e.g. after nodes are created or destroyed
+        '''
+        self._inventory = None
+
+    @property
+    def call_lock(self):
+        '''
+        serialize the calls to the vendor API clients made from several threads
+        (skywayd requests, calls of the commands and the dashboard through skyway.daemon.create,
+        background refreshes of the listing cache)
+        '''
+        if getattr(self, '_call_lock', None) is None:
+            self._call_lock = threading.RLock()
+        return self._call_lock
+
+    def _listing_cache(self):
+        from ..cache import listing_cache
+        # squeue only lists the jobs of the current user: the on-premises listings are not shared
+        if self.onpremises == True:
+            return listing_cache(f"{self.account_name}-{os.environ['USER']}")
+        return listing_cache(self.account_name)
+
+    def list_nodes_cached(self, show_protected_nodes=False):
+        '''
+        the nodes given by list_nodes(), shared by the processes of the user for a few seconds (see skyway.cache),
+        with the elapsed time and running cost brought up to date
+        '''
+        if show_protected_nodes == True:
+            nodes, _ = self.list_nodes(show_protected_nodes=True, verbose=False)
+            return nodes
+
+        def compute():
+            with self.call_lock:
+                self.invalidate_inventory()
+                nodes, _ = self.list_nodes(verbose=False)
+                return nodes
+
+        nodes, age = self._listing_cache().get(compute, lock=self.call_lock)
+
+        # nodes = [..., elapsed time, running cost] as of age seconds ago
+        if age > 0:
+            for node in nodes:
+                running_time, running_cost = node[-2], node[-1]
+                if isinstance(running_time, timedelta) and running_time.total_seconds() > 0:
+                    node[-2] = running_time + timedelta(seconds=age)
+                    node[-1] = running_cost * (node[-2] / running_time)
+        return nodes
+
+    def invalidate_listing(self):
+        '''
+        drop the inventory and the shared list of nodes, after nodes are created or destroyed
+        '''
+        self.invalidate_inventory()
+        self._listing_cache().invalidate()
+
+    def get_instance_keys(self, node):
+        '''
+        the (name, ID, user name, state) of a node object, used to index the inventory
+        '''
+        return self.get_instance_name(node), node.id, self.get_instance_user_name(node), node.state
+
     def list_nodes(self, show_protected_nodes=False, verbose=False):
         '''
         list all the running/stopped nodes (aka instances)
@@ -86,6 +196,148 @@ class Cloud():
         '''
         pass
 
+    # spot/preemptible nodes (create_nodes with spot=True): cheaper nodes the vendor may take back at any time
+
+    def check_interruption(self, node_name):
+        '''
+        the reason why the spot node of a node name of the user was interrupted by the vendor (or is about to be),
+        None if it was not; the interrupted node is terminated (if still there) and its usage recorded
+        '''
+        return None
+
+    def get_fallback(self, node_type):
+        '''
+        the fallback entry of a node type in cloud.yaml: where (zones, regions) and with which equivalent node types
+        to launch the nodes when the vendor has no capacity for the node type, e.g.
+          g1: { name: ..., price: ..., fallback: { zones: [us-central1-a, us-central1-f], node-types: [g2] } }
+        '''
+        fallback = self.vendor['node-types'][node_type].get('fallback') or {}
+        for other in fallback.get('node-types', []):
+            if other not in self.vendor['node-types']:
+                raise ValueError(f"Node type {other} in the fallback of {node_type} is not in cloud.yaml.")
+        return fallback
+
+    def race_launches(self, launch, candidates, cancel):
+        '''
+        call launch(candidate) for all the candidates at the same time (at most create-workers in cloud.yaml),
+        return (candidate, result) of the first launch that succeeds; the launches that succeed later
+        are cancelled with cancel(candidate, result) as they complete.
+        Raise an exception with the errors if all the launches fail.
+        '''
+        max_workers = max(1, min(len(candidates), int(self.vendor.get('create-workers', 16))))
+
+        # set by the first launch that succeeds: the launches waiting for a worker are not started
+        # (a worker takes the next candidate before the winner is seen by this thread)
+        launched = threading.Event()
+        def attempt(candidate):
+            if launched.is_set():
+                raise Exception("not launched, another launch succeeded")
+            result = launch(candidate)
+            launched.set()
+            return result
+
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        futures = { executor.submit(attempt, candidate): candidate for candidate in candidates }
+
+        def cancel_when_done(future):
+            if future.cancelled() or future.exception() is not None:
+                return
+            try:
+                cancel(futures[future], future.result())
+            except Exception as e:
+                print(f"\nCannot cancel the launch in {futures[future]}: {e}")
+
+        winner = None
+        errors = []
+        try:
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append(f"{futures[future]}: {e}")
+                    continue
+                winner = future
+                break
+        finally:
+            # the launches not started are dropped, the others are cancelled once they complete
+            # (the worker threads are joined before the process exits)
+            for future in futures:
+                if future is not winner and not future.cancel():
+                    future.add_done_callback(cancel_when_done)
+            executor.shutdown(wait=False)
+
+        if winner is None:
+            raise Exception("All the launches failed:\n  " + "\n  ".join(errors))
+        return futures[winner], winner.result()
+
+    def get_post_boot_script(self, walltime=None, commands=[]):
+        '''
+        the script run as root by a node while it boots (passed as user-data, startup-script or custom-data by create_nodes):
+        schedule the shutdown of the node after the walltime (HH:MM:SS, default 00:05:00), then run the commands
+        '''
+        if walltime is None or walltime == "":
+            walltime = "00:05:00"
+        hours, minutes, seconds = [int(x) for x in walltime.split(':')]
+        walltime_in_minutes = int(hours * 60 + minutes + seconds/60)
+        lines = ["#!/bin/bash", f"shutdown -P +{walltime_in_minutes}"] + commands
+        return "\n".join(lines) + "\n"
+
+    # vendor metadata: the catalogs listed by create_nodes (e.g. locations, sizes, subnets, images), which change rarely
+
+    def fetch_metadata(self):
+        '''
+        list the vendor metadata used by create_nodes, as a dictionary (empty if the driver needs none)
+        '''
+        return {}
+
+    def get_metadata(self, refresh=False):
+        '''
+        the vendor metadata from fetch_metadata(), shared by the processes of the account through $SKYWAYROOT/var
+        for days (see skyway.cache), fetched again if refresh is True (skyway catalog --refresh)
+        '''
+        # read from the file at each call: a long-lived driver (skywayd) sees the refreshes made by other processes
+        from ..cache import metadata_cache
+        cache = metadata_cache(self.account_name)
+        if refresh == True:
+            cache.invalidate()
+
+        def compute():
+            with self.call_lock:
+                return _set_driver(self.fetch_metadata(), None)
+
+        metadata, _ = cache.get(compute)
+        return _set_driver(metadata, getattr(self, 'driver', None))
+
+    # warm pool: stopped instances per node type (account['warm_pool']), started by create_nodes instead of launching new ones
+
+    def get_pool_sizes(self):
+        '''
+        the number of stopped instances kept per node type (account['warm_pool']), empty if the account has no warm pool
+        '''
+        sizes = self.account.get('warm_pool') or {}
+        for node_type in sizes:
+            if node_type not in self.vendor['node-types']:
+                raise ValueError(f"Node type {node_type} of the warm pool of account {self.account_name} is not in cloud.yaml.")
+        return { node_type: int(count) for node_type, count in sizes.items() }
+
+    def get_pool_node_type(self, node):
+        '''
+        the node type of a node object of the warm pool, None if the node is not in the pool
+        '''
+        return None
+
+    def get_pool_instances(self, node_type=None):
+        '''
+        the instances of the warm pool (of a node type if given)
+        '''
+        return []
+
+    def fill_pool(self, verbose=True):
+        '''
+        launch (or terminate) instances so that the warm pool has the number of instances of account['warm_pool']
+        '''
+        raise Exception(f"Account {self.account_name} does not support a warm pool.")
+
     def connect_node(self, node_name, separate_terminal=True):
         '''
         connect to a node (aka instance) via SSH
@@ -144,16 +396,18 @@ class Cloud():
         '''
         return the user name that created the node
         '''
-        
+        pass
+
     def get_instances(self, filters = []):
         '''
         get the reference to the node (aka instance) object (from the vendor API)
         '''
         pass
 
-    def get_running_cost(self, verbose=True):
+    def get_running_cost(self, verbose=True, user_name=None):
         '''
-        get the running cost of all the nodes (aka instances) (from the vendor API for running time and the unit cost)
+        get the running cost of all the nodes (aka instances), or of the nodes of a user
+        (from the vendor API for running time and the unit cost)
         '''
         pass
 
@@ -172,3 +426,27 @@ class Cloud():
         module = import_module('skyway.cloud.' + vendor)
         cloud_class = getattr(module, vendor.upper())
         return cloud_class(vendor_cfg[vendor], kwargs)
+
+def _set_driver(value, driver, seen=None):
+    '''
+    set the driver of the libcloud objects (locations, sizes, images...) in the metadata, or drop it (driver None):
+    the objects refer to the driver that listed them, which cannot be stored
+    '''
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return value
+    if isinstance(value, dict):
+        items = list(value.values())
+    elif isinstance(value, (list, tuple, set)):
+        items = list(value)
+    elif hasattr(value, '__dict__') and not isinstance(value, type):
+        if 'driver' in vars(value):
+            value.driver = driver
+        items = [v for k, v in vars(value).items() if k != 'driver']
+    else:
+        return value
+    seen.add(id(value))
+    for item in items:
+        _set_driver(item, driver, seen)
+    return value
@@ -8,23 +8,25 @@
 Documentation for GCP Class
 """
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 import io
 import logging
 import os
-import subprocess
+import threading
 from tabulate import tabulate
 
+from .catalog import NodeTypeCatalog
 from .core import Cloud
 from .. import utils
 
 from colorama import Fore
-import pandas as pd
 
-# apache-libcloud
-from libcloud.compute.types import Provider
-from libcloud.compute.providers import get_driver
-import libcloud.common.google
+# NOTE: apache-libcloud and pandas are imported where they are first used,
+#       so that constructing the driver, or running commands that do not call the API, stays cheap
+
+# the error codes of the node creations for which another zone or machine type may have capacity
+capacity_errors = ['ZONE_RESOURCE_POOL_EXHAUSTED', 'ZONE_RESOURCE_POOL_EXHAUSTED_WITH_DETAILS', 'QUOTA_EXCEEDED']
 
 class GCP(Cloud):
     
@@ -38,9 +40,10 @@ class GCP(Cloud):
 
         #super().__init__(vendor_cfg, kwargs)
 
-        # load [account].yaml under $SKYWAYROOT/etc/accounts
+        # load [account].yaml under $SKYWAYROOT/etc/accounts and the gcp section of cloud.yaml under $SKYWAYROOT/etc/
+        # (validated and cached, see utils.load_account_config)
         account_path = os.environ['SKYWAYROOT'] + '/etc/accounts/'
-        account_cfg = utils.load_config(account, account_path)
+        account_cfg, vendor_cfg = utils.load_account_config(account)
         if account_cfg['cloud'] != 'gcp' :
             raise Exception(f'Service provider gcp is not associated with this account.')
 
@@ -52,27 +55,56 @@ class GCP(Cloud):
             raise Exception(f"PEM key {self.keyfile} is not found.")
 
         self.usage_history = f"{account_path}usage-{account}.pkl"
+        self.usage_ledger = f"{account_path}usage-{account}.db"
 
-        # load cloud.yaml under $SKYWAYROOT/etc/
-        cloud_path = os.environ['SKYWAYROOT'] + '/etc/'
-        vendor_cfg = utils.load_config('cloud', cloud_path)
-        if 'gcp' not in vendor_cfg:
-            raise Exception(f'Cloud vendor gcp is undefined.')
-      
-        self.vendor = vendor_cfg['gcp']
+        self.vendor = vendor_cfg
+        # instance type -> price, cores, memory and GPUs of the node types in cloud.yaml
+        self.catalog = NodeTypeCatalog(vendor_cfg['node-types'])
         self.account_name = account
         self.onpremises = False
 
+        # the libcloud GCE driver is created (and authenticated) on first use, see the driver property below
+        self._driver = None
+        # the drivers of the threads creating nodes in parallel (libcloud connections are not thread-safe)
+        self._thread_drivers = threading.local()
+        return
+
+    @property
+    def driver(self):
+        """
+        The libcloud GCE driver of the account, created on first use
+        """
+        if self._driver is not None:
+            return self._driver
+
+        self._driver = self._new_driver()
+        return self._driver
+
+    @property
+    def thread_driver(self):
+        """
+        A libcloud GCE driver owned by the calling thread, created on first use
+        """
+        driver = getattr(self._thread_drivers, 'driver', None)
+        if driver is None:
+            driver = self._new_driver()
+            self._thread_drivers.driver = driver
+        return driver
+
+    def _new_driver(self):
+        from libcloud.compute.types import Provider
+        from libcloud.compute.providers import get_driver
         ComputeEngine = get_driver(Provider.GCE)
+        driver = None
         try:
-            self.driver = ComputeEngine(self.account['service_account'],
-                                        self.keyfile,
-                                        project=self.account['project_id'])
+            driver = ComputeEngine(self.account['service_account'],
+                                   self.keyfile,
+                                   project=self.account['project_id'])
         except Exception as e:
             print(f"An error occurred: {e}")
         
-        assert(self.driver != False)
-        return
+        assert(driver is not None)
+        return driver
 
     def check_valid_user(self, user_name, verbose=False):
         if user_name not in self.users:
@@ -111,57 +143,6 @@ class GCP(Cloud):
                 print(f"Total: ${total_budget}")
             return total_budget
 
-    def get_cost_and_usage_from_db(self, user_name):
-        '''
-        compute the accumulating cost from the pkl database
-        and the remaining balance
-        '''
-        if user_name not in self.users:
-            raise Exception(f"{user_name} is not listed in the user group of this account.")
-                
-        user_budget = self.users[user_name]['budget']
-
-        if not os.path.isfile(self.usage_history):
-            print(f"Usage history {self.usage_history} is not available")
-            data = [user_name, "--", "--", "00:00:00", "00:00:00", 0.0, user_budget]
-            df = pd.DataFrame([], columns=['User','InstanceID','InstanceType','Start','End', 'Cost', 'Balance'])
-            df = pd.concat([pd.DataFrame([data], columns=df.columns), df], ignore_index=True)
-            df.to_pickle(self.usage_history)
-            return 0, user_budget
-
-        df = pd.read_pickle(self.usage_history)
-        df_user = df.loc[df['User'] == user_name]
-        df_user = df_user.astype({"Cost": float})
-        accumulating_cost = df_user['Cost'].sum()
-        remaining_balance = user_budget - accumulating_cost
-
-        return accumulating_cost, remaining_balance
-
-    def get_usage_history_from_db(self, user_name):
-        '''
-        compute the accumulating cost from the pkl database
-        and the remaining balance
-        '''
-        if user_name not in self.users:
-            raise Exception(f"{user_name} is not listed in the user group of this account.")
-                
-        user_budget = self.users[user_name]['budget']
-
-        if not os.path.isfile(self.usage_history):
-            print(f"Usage history {self.usage_history} is not available")
-            data = [user_name, "--", "--", "00:00:00", "00:00:00", "0.0", user_budget]
-            df = pd.DataFrame([], columns=['User','InstanceID','InstanceType','Start','End', 'Cost', 'Balance'])
-            #df = pd.DataFrame(columns=['User','InstanceID','InstanceType','Start','End', 'Cost', 'Balance'])
-            df = pd.concat([pd.DataFrame([data], columns=df.columns), df], ignore_index=True)
-            df.to_pickle(self.usage_history)
-            return 0, user_budget
-
-        df = pd.read_pickle(self.usage_history)
-        df_user = df.loc[df['User'] == user_name]
-        
-        history = df_user[['User','InstanceID','InstanceType','Start','End']]
-        return history
-
     def get_node_types(self):
         """
         List all the node (instance) types provided by the vendor and their unit prices
@@ -204,10 +185,8 @@ class GCP(Cloud):
         """
         nodes = []
         current_time = datetime.now(timezone.utc)
-        for node in self.driver.list_nodes():
-            if node.state != 'running':
-                continue
-
+        inventory = self.inventory()
+        for node in inventory.in_states(['running']):
             # Get the creation time of the instance
             creation_time_str = node.extra.get('creationTimestamp')  # GCP
             if creation_time_str:
@@ -219,9 +198,9 @@ class GCP(Cloud):
 
                 # Calculate the running cost
                 instance_unit_cost = self.get_unit_price_instance(node)
-                running_cost = running_time.seconds/3600.0 * instance_unit_cost
+                running_cost = running_time.total_seconds()/3600.0 * instance_unit_cost
 
-                node_user_name = self.get_instance_user_name(node)
+                node_user_name = inventory.user_of(node)
 
                 nodes.append([node.name, node_user_name, node.state, node.size, node.id, node.public_ips[0], running_time, running_cost])
 
@@ -235,29 +214,34 @@ class GCP(Cloud):
             print("", file=output_str)
         return nodes, output_str
     
-    def create_nodes(self, node_type: str, node_names = [], interactive = False, need_confirmation = True, walltime = None, image_id = ""):
+    def create_nodes(self, node_type: str, node_names = [], interactive = False, need_confirmation = True, walltime = None, image_id = "", spot = False):
         """Member function: create_compute
         Create a group of compute instances(nodes, servers, virtual-machines 
         ...) with the given type.
         
          - node_type: instance type information from the Skyway definitions
          - node_names: a list of names for the nodes, to get the number of nodes
+         - spot: create preemptible nodes (at the spot-price of the node type in cloud.yaml), which Compute Engine may preempt
 
         Return: a dictionary of instance ID (i.e., names) for created instances.
         """
         user_name = os.environ['USER']
         user_budget = self.get_budget(user_name=user_name, verbose=False)
         usage, remaining_balance = self.get_cost_and_usage_from_db(user_name=user_name)
-        running_cost = self.get_running_cost(verbose=False)
+        running_cost = self.get_running_cost(verbose=False, user_name=user_name)
         usage = usage + running_cost
         remaining_balance = user_budget - usage
         unit_price = self.vendor['node-types'][node_type]['price']
+        market = ""
+        if spot == True:
+            unit_price = self.catalog.spot_price(node_type)
+            market = "preemptible "
         if need_confirmation == True:
             print(f"User budget: ${user_budget:.3f}")
             print(f"+ Usage    : ${usage:.3f}")
             print(f"+ Available: ${remaining_balance:.3f}")
         
-            response = input(f"Do you want to create an instance of type {node_type} (${unit_price}/hr)? (y/n) ")
+            response = input(f"Do you want to create a {market}instance of type {node_type} (${unit_price}/hr)? (y/n) ")
             if response == 'n':
                 return
 
@@ -267,16 +251,14 @@ class GCP(Cloud):
 
         print(Fore.BLUE + f"Allocating {count} instance ...", end=" ")
 
+        # the zone, subnetwork, sizes and image from the vendor metadata of the account (see fetch_metadata)
         location_name = self.vendor['location'] + '-c'
-        locations = self.driver.list_locations()
-        location = next((loc for loc in locations if loc.name == location_name), None)
-        if location is None:
-            raise ValueError(f"Location '{location_name}' not found.")
+        metadata = self.get_metadata()
+        if metadata['location'].name != location_name or 'zones' not in metadata:
+            metadata = self.get_metadata(refresh=True)
+        location = metadata['location']
         
         nodes = {}
-        node_cfg = self.vendor['node-types'][node_type]
-        #print(f"node_type = {node_type}: {node_cfg}")
-        preemptible = node_cfg['preemptible'] if 'preemptible' in node_cfg else False
 
         scopes = [
             'https://www.googleapis.com/auth/devstorage.read_only',
@@ -287,78 +269,134 @@ class GCP(Cloud):
             'https://www.googleapis.com/auth/trace.append'
         ]
         network = 'vpc1'      # get this from ex_list_networks()
-        subnets = self.driver.ex_list_subnetworks()
-        subnet = next((sub for sub in subnets if sub.name == location_name), None)
-
-        if walltime is None:
-            walltime_str = "00:05:00"
-        else:
-            walltime_str = walltime
 
-        # shutdown the instance after the walltime (in minutes)
-        pt = datetime.strptime(walltime_str, "%H:%M:%S")
-        walltime_in_minutes = int(pt.hour * 60 + pt.minute + pt.second/60)
+        # the shutdown after the walltime is scheduled by the startup script while the node boots
+        startup_script = self.get_post_boot_script(walltime)
+
+        # instead of tags, we add user and node name to labels when creating nodes
+        vm_image = self.account['image_name']
+        if image_id != "":
+            vm_image = image_id
+        image = metadata['images'].get(vm_image) or vm_image
+
+        def create_node_in(node_name, candidate):
+            # a node of a node type in a zone, the zones, subnetworks and sizes not in the metadata are looked up by libcloud
+            zone, launch_type = candidate
+            launch_cfg = self.vendor['node-types'][launch_type]
+            if zone == location_name:
+                zone_location, subnet, sizes = location, metadata['subnet'], metadata['sizes']
+            else:
+                zone_location, subnet, sizes = metadata.get('zones', {}).get(zone, zone), metadata.get('subnets', {}).get(zone), {}
+            preemptible = launch_cfg['preemptible'] if 'preemptible' in launch_cfg else False
+            if spot == True:
+                preemptible = True
 
-        for node_name in node_names:
             gpu_type = None
-            gpu_count = None           
-            if 'gpu' in node_cfg:
-                gpu_type = node_cfg['gpu-type']
-                gpu_count = node_cfg['gpu']
-
+            gpu_count = None
+            if 'gpu' in launch_cfg:
+                gpu_type = launch_cfg['gpu-type']
+                gpu_count = launch_cfg['gpu']
+
+            # google-cloud-compute changed at some point, making tags empty when query the list of nodes with libcloud
+            tags = [{ 'node_name': node_name, 'user': user_name }]
+            return self.thread_driver.create_node(node_name,
+                                            size = sizes.get(launch_cfg['name'], launch_cfg['name']),
+                                            image = image, 
+                                            location = zone_location,
+                                            ex_network=network,
+                                            ex_subnetwork=subnet,
+                                            ex_service_accounts=[{
+                                                'email': self.account['service_account'],
+                                                'scopes': scopes
+                                            }],
+                                            ex_labels={'goog-ec-src': 'vm_add-gcloud', 'node_name': node_name, 'user': user_name},
+                                            ex_preemptible = preemptible,
+                                            ex_accelerator_type = gpu_type,
+                                            ex_accelerator_count = gpu_count,
+                                            ex_on_host_maintenance = 'TERMINATE',
+                                            ex_tags = tags,
+                                            ex_metadata = {'startup-script': startup_script},)
+
+        # the candidates: (zone, node type), the first one being the requested node type in location-c,
+        # the others from the fallback entry of the node type in cloud.yaml (see Cloud.get_fallback)
+        fallback = self.get_fallback(node_type)
+        candidates = []
+        for launch_type in [node_type] + fallback.get('node-types', []):
+            candidates += [(zone, launch_type) for zone in [location_name] + fallback.get('zones', [])]
+        candidates = list(dict.fromkeys(candidates))
+
+        import libcloud.common.google
+        def create_node(node_name):
             try:
-                # google-cloud-compute changed at some point, making tags empty when query the list of nodes with libcloud
-                tags = [{ 'node_name': node_name, 'user': user_name }]
-                # instead, we add user and node name to labels when creating nodes
-                vm_image = self.account['image_name']
-                if image_id != "":
-                    vm_image = image_id
-
-                node = self.driver.create_node(node_name,
-                                                size = node_cfg['name'],
-                                                image = vm_image, 
-                                                location = location,
-                                                ex_network=network,
-                                                ex_subnetwork=subnet,
-                                                ex_service_accounts=[{
-                                                    'email': self.account['service_account'],
-                                                    'scopes': scopes
-                                                }],
-                                                ex_labels={'goog-ec-src': 'vm_add-gcloud', 'node_name': node_name, 'user': user_name},
-                                                ex_preemptible = preemptible,
-                                                ex_accelerator_type = gpu_type,
-                                                ex_accelerator_count = gpu_count,
-                                                ex_on_host_maintenance = 'TERMINATE',
-                                                ex_tags = tags,)
+                try:
+                    return create_node_in(node_name, candidates[0])
+                except libcloud.common.google.GoogleBaseError as e:
+                    # when the zone has no capacity for the node type, the launch is raced across the other candidates,
+                    # the first node created is kept, the others are destroyed
+                    if getattr(e, 'code', None) not in capacity_errors or len(candidates) == 1:
+                        raise
+                    print(f"\nNo capacity for {node_name} in {location_name} ({e.code}), trying {len(candidates) - 1} other launches ...", end=" ")
+                    candidate, node = self.race_launches(lambda candidate: create_node_in(node_name, candidate), candidates[1:],
+                                                         lambda candidate, node: self.thread_driver.destroy_node(node))
+                    print(f"\nCreated {node_name} of type {candidate[1]} in {candidate[0]}", end=" ")
+                    return node
             except libcloud.common.google.ResourceNotFoundError as e:
                 print(f'Error: Resource not found. Details: {e}')
             except libcloud.common.google.GoogleBaseError as e:
                 print(f'Google Cloud error occurred: {e}')
             except Exception as e:
                 print(f"Failed to create %s. Reason: %s" % (node_name, str(e)))
+            return None
 
-            self.driver.wait_until_running([node])
+        # the nodes are created at the same time, by at most create-workers threads (cloud.yaml, default 16)
+        max_workers = min(count, int(self.vendor.get('create-workers', 16)))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            created = [node for node in executor.map(create_node, node_names) if node is not None]
 
-            # record node_type, creation time
-            creation_time_str = node.extra.get('creationTimestamp') 
-            node_type = node_cfg['name']
-            nodes[node_name] = [node_type, creation_time_str, node.public_ips[0]]
+        if len(created) == 0:
+            self.invalidate_listing()
+            return nodes
 
-            print(f'\nCreated instance: {node.name}')
+        # one wait for all the nodes
+        created = [node for node, ips in self.driver.wait_until_running(created)]
+        for node in created:
+            # record node_type (the size of the node: another node type may have been created, see create_node), creation time
+            creation_time_str = node.extra.get('creationTimestamp') 
+            nodes[node.name] = [node.size, creation_time_str, node.public_ips[0]]
 
-            # ssh to the node and execute a shutdown command scheduled for walltime
+        for node in created:
             host = node.public_ips[0]
-            user_name = os.environ['USER']
-            #print("Connecting to host: " + host)
-
-            cmd = f"ssh -o StrictHostKeyChecking=accept-new {user_name}@{host} -t 'sudo shutdown -P {walltime_in_minutes}' "
-            p = subprocess.run(cmd, shell=True, text=True, capture_output=True)
+            print(f'\nCreated instance: {node.name}')
             print("To connect to the instance, run:")
             print(f"  ssh -o StrictHostKeyChecking=accept-new {user_name}@{host} or")
             print(f"  skyway_connect --account={self.account_name} -J {node.name}")
         
+        self.invalidate_listing()
         return nodes
 
+    def fetch_metadata(self):
+        """
+        The zone (location-c in cloud.yaml), its subnetwork, the sizes of the node types in cloud.yaml
+        and the image of the account, used by create_nodes, with the zones and subnetworks of the fallback entries
+        """
+        location_name = self.vendor['location'] + '-c'
+        # the other zones of the fallback entries of the node types (see create_nodes)
+        zone_names = set([location_name])
+        for node_type in self.vendor['node-types']:
+            zone_names.update(self.get_fallback(node_type).get('zones', []))
+
+        zones = { loc.name: loc for loc in self.driver.list_locations() if loc.name in zone_names }
+        if location_name not in zones:
+            raise ValueError(f"Location '{location_name}' not found.")
+        location = zones[location_name]
+
+        subnets = { sub.name: sub for sub in self.driver.ex_list_subnetworks() if sub.name in zone_names }
+        size_names = set(node_cfg['name'] for node_cfg in self.vendor['node-types'].values())
+        sizes = { size.name: size for size in self.driver.list_sizes(location) if size.name in size_names }
+        images = { self.account['image_name']: self.driver.ex_get_image(self.account['image_name']) }
+        return { 'location': location, 'subnet': subnets.get(location_name), 'sizes': sizes, 'images': images,
+                 'zones': zones, 'subnets': subnets }
+
     def connect_node(self, node_id, separate_terminal=True):
         """
         Connect to an instance using account's pem file
@@ -375,11 +413,7 @@ class GCP(Cloud):
         """
         #node = self.driver.ex_get_node(node_name)
         
-        node = None
-        for node in self.driver.list_nodes():
-            if node.state == "running":
-                if node.id == node_id:
-                    break
+        node = self.inventory().get(node_id, states=['running'])
         if node is not None:
             public_ip = node.public_ips[0]
             username = os.environ['USER']
@@ -394,6 +428,7 @@ class GCP(Cloud):
             os.system(cmd)
         else:
             print(f"Node {node_id} does not exist.")
+            return None
 
         node_info = {
             'private_key' : "",
@@ -402,13 +437,10 @@ class GCP(Cloud):
         return node_info
 
     def get_node_connection_info(self, node_id):
-        node = None
-        for node in self.driver.list_nodes():
-            if node.state == "running":
-                if node.id == node_id:
-                    break
-        if node is not None:                
-            public_ip = node.public_ips[0]
+        node = self.inventory().get(node_id, states=['running'])
+        if node is None:
+            raise ValueError(f"Node {node_id} not found.")
+        public_ip = node.public_ips[0]
         
         username = self.vendor['username']
         node_info = {
@@ -424,11 +456,7 @@ class GCP(Cloud):
            execute(node_name='your-node', binary="python", arg1="input.txt", arg2="output.txt")
            execute(node_name='your-node', binary="mpirun -np 4 my_app", arg1="input.txt", arg2="output.txt")
         '''
-        node = None
-        for node in self.driver.list_nodes():
-            if node.state == "running":
-                if node.id == node_id:
-                    break
+        node = self.inventory().get(node_id, states=['running'])
         if node is not None:
             host = node.public_ips[0]
             user_name = os.environ['USER']
@@ -448,11 +476,7 @@ class GCP(Cloud):
         '''
         execute all the lines in a script on a compute node
         '''
-        node = None
-        for node in self.driver.list_nodes():
-            if node.state == "running":
-                if node.id == node_id:
-                    break
+        node = self.inventory().get(node_id, states=['running'])
         if node is not None:
             host = node.public_ips[0]
             user_name = os.environ['USER']
@@ -474,49 +498,46 @@ class GCP(Cloud):
 
         user_name = os.environ['USER']
 
-        for node in self.driver.list_nodes():
-            if node.state != "running":
-                continue
-
-            for name in node_names:
-                if node.name == name:
-                    node_user_name = self.get_instance_user_name(node)
-                    if  node_user_name != user_name:
-                        print(f"Cannot destroy an instance {name} created by other users")
-                        continue
-
-                    creation_time_str = node.extra.get('creationTimestamp')  # GCP
-                    # Convert the creation time from string to datetime object
-                    creation_time = datetime.strptime(creation_time_str, '%Y-%m-%dT%H:%M:%S.%f%z')
-                    current_time = datetime.now(timezone.utc)
-                    running_time = current_time - creation_time
-                    instance_unit_cost = self.get_unit_price_instance(node)
-                    running_cost = running_time.seconds/3600.0 * instance_unit_cost
-
-                    if need_confirmation == True:
-                        response = input(f"Do you want to destroy {node.name} (running cost ${running_cost})? (y/n) ")
-                        if response != 'y':
-                            continue
-
-                    self.driver.destroy_node(node)
-
-                    # record the running time and cost
-                    running_time = current_time - creation_time
-                    instance_unit_cost = self.get_unit_price_instance(node)
-                    running_cost = running_time.seconds/3600.0 * instance_unit_cost
-                    usage, remaining_balance = self.get_cost_and_usage_from_db(user_name=user_name)
+        # one listing for all the nodes to destroy
+        inventory = self.inventory()
+        destroyed = False
 
-                    # store the record into the database
-                    data = [node_user_name, node.id, node.size, creation_time, current_time, running_cost, remaining_balance]
+        for name in node_names:
+            node = inventory.find(name, states=['running'])
+            if node is None:
+                continue
 
-                    if os.path.isfile(self.usage_history):
-                        df = pd.read_pickle(self.usage_history)
-                    else:
-                        df = pd.DataFrame([], columns=['User','InstanceID','InstanceType','Start','End', 'Cost', 'Balance'])
+            node_user_name = inventory.user_of(node)
+            if  node_user_name != user_name:
+                print(f"Cannot destroy an instance {name} created by other users")
+                continue
 
-                    df = pd.concat([pd.DataFrame([data], columns=df.columns), df], ignore_index=True)
-                    df.to_pickle(self.usage_history)
-            
+            creation_time_str = node.extra.get('creationTimestamp')  # GCP
+            # Convert the creation time from string to datetime object
+            creation_time = datetime.strptime(creation_time_str, '%Y-%m-%dT%H:%M:%S.%f%z')
+            current_time = datetime.now(timezone.utc)
+            running_time = current_time - creation_time
+            instance_unit_cost = self.get_unit_price_instance(node)
+            running_cost = running_time.total_seconds()/3600.0 * instance_unit_cost
+
+            if need_confirmation == True:
+                response = input(f"Do you want to destroy {node.name} (running cost ${running_cost})? (y/n) ")
+                if response != 'y':
+                    continue
+
+            self.driver.destroy_node(node)
+            destroyed = True
+
+            # record the running time and cost
+            running_time = current_time - creation_time
+            instance_unit_cost = self.get_unit_price_instance(node)
+            running_cost = running_time.total_seconds()/3600.0 * instance_unit_cost
+            # store the record into the usage ledger
+            self.record_usage(node_user_name, node.id, node.size,
+                              creation_time, current_time, running_cost)
+
+        if destroyed == True:
+            self.invalidate_listing()
         return
    
     def get_running_nodes(self, verbose=False):
@@ -527,7 +548,7 @@ class GCP(Cloud):
         
         current_time = datetime.now(timezone.utc)
 
-        for node in self.driver.list_nodes():
+        for node in self.inventory().in_states(['running']):
             if node.state == "running":
                 # Get the creation time of the instance
                 creation_time_str = node.extra.get('creationTimestamp')  # GCP
@@ -550,24 +571,51 @@ class GCP(Cloud):
         """
         Get the per-hour price of an instance depending on its instance_type (e.g. n1-standard-1)
         For GCE, node.size is the instance type.
+        The spot-price of the node type in cloud.yaml for a preemptible node.
         """
+        if (node.extra.get('scheduling') or {}).get('preemptible') == True:
+            return self.catalog.spot_price_of(node.size)
+        return self.catalog.price_of(node.size)
 
-        for node_type in self.vendor['node-types']:
-            if self.vendor['node-types'][node_type]['name'] == node.size:
-                unit_price = self.vendor['node-types'][node_type]['price']
-                return unit_price
-        return -1.0
+    def check_interruption(self, node_name):
+        """
+        Check whether the preemptible node of a node name of the user was preempted by Compute Engine
+        (a compute.instances.preempted operation on the node): the node, stopped by the preemption,
+        is recorded into the usage ledger until the preemption and deleted
+
+        Return: the reason of the interruption, None if the node was not preempted
+        """
+        user_name = os.environ['USER']
+        nodes = self.get_instances(filters = [f'name = "{node_name}"', f'labels.user = "{user_name}"', 'scheduling.preemptible = true'])
+        if len(nodes) == 0:
+            return None
+        node = nodes[0]
+
+        # libcloud does not list the operations: request the operations of the zone of the node
+        zone = node.extra['zone'].name
+        params = { 'filter': f'(operationType = "compute.instances.preempted") AND (targetId = "{node.id}")' }
+        operations = self.driver.connection.request(f'/zones/{zone}/operations', method='GET', params=params).object.get('items', [])
+        if len(operations) == 0:
+            return None
+
+        creation_time = datetime.strptime(node.extra.get('creationTimestamp'), '%Y-%m-%dT%H:%M:%S.%f%z')
+        preemption_time = datetime.fromisoformat(operations[0]['insertTime'])
+        self.record_interrupted_usage(user_name, node.id, node.size, creation_time, preemption_time, self.get_unit_price_instance(node))
+        self.driver.destroy_node(node)
+        self.invalidate_listing()
+        return f"preempted at {operations[0]['insertTime']}"
 
     def get_unit_price(self, node_type: str):
         """
         Get the per-hour price of an instance depending on its instance_type (e.g. t1)
         """
-        if node_type in self.vendor['node-types']:
-            return self.vendor['node-types'][node_type]['price']
-        return -1.0
+        return self.catalog.price(node_type)
 
     def get_host_ip(self, node_name):
-        return self.driver.ex_get_node(node_name).public_ips[0]
+        node = self.inventory().find(node_name, states=['running'])
+        if node is None:
+            raise ValueError(f"Node {node_name} not found.")
+        return node.public_ips[0]
 
     def get_instance_user_name(self, node):
         '''
@@ -593,26 +641,63 @@ class GCP(Cloud):
         """Member function: get_instance_ID
 
         """
-        for node in self.driver.list_nodes():
-            if node.state == "running":
-                if node.name == instance_name:
-                    return node.id
-        return ''
+        node = self.inventory().find(instance_name, states=['running'])
+        if node is None:
+            return ''
+        return node.id
 
 
     def get_instances(self, filters = []):
         """Member function: get_instances
-        Get a list of instance objects with give filters
+        Get a list of instance objects with give filters,
+        Compute Engine filter expressions on the fields of the instances, e.g. ['labels.user = "user1"', 'status = RUNNING']
         """
-        return self.driver.list_nodes()
+        nodes = self.driver.list_nodes()
+        if len(filters) == 0:
+            return nodes
 
-    def get_running_cost(self, verbose=True):
+        # libcloud list_nodes() does not take filters (and ex_list().filter() does not apply to its aggregated request):
+        # the filters are evaluated on the nodes
+        return [node for node in nodes if self._node_matches(node, filters)]
+
+    def _node_matches(self, node, filters):
+        """
+        Evaluate the filters ('field = value' or 'field != value', the field being a path in the API resource,
+        e.g. labels.user) on a node, its extra dictionary holding the fields of the API resource
+        """
+        for f in filters:
+            op = '!=' if '!=' in f else '='
+            field, value = [x.strip() for x in f.split(op, 1)]
+            value = value.strip('"')
+            actual = node.extra
+            for key in field.split('.'):
+                actual = actual.get(key) if isinstance(actual, dict) else None
+            if isinstance(actual, bool):
+                actual = 'true' if actual else 'false'
+            if (str(actual) == value) != (op == '='):
+                return False
+        return True
+
+    def get_instance_keys(self, node):
+        """
+        The (name, ID, user name, state) of a node, used to index the inventory
+        """
+        labels = node.extra.get('labels') or {}
+        return node.name, node.id, labels.get('user'), node.state
+
+    def get_running_cost(self, verbose=True, user_name=None):
 
         current_time = datetime.now(timezone.utc)
 
+        if user_name is None:
+            instances = self.inventory().in_states(['running'])
+        else:
+            # only the running instances of the user (labeled by create_nodes) are listed
+            instances = self.get_instances(filters = [f'labels.user = "{user_name}"', 'status = RUNNING'])
+
         nodes = []
         total_cost = 0.0
-        for node in self.driver.list_nodes():
+        for node in instances:
             if self.get_instance_name(node) in self.account['protected_nodes']:
                 continue
             if node.state == "running":
@@ -626,7 +711,7 @@ class GCP(Cloud):
                     running_time = current_time - creation_time
 
                     instance_unit_cost = self.get_unit_price_instance(node)
-                    running_cost = running_time.seconds/3600.0 * instance_unit_cost
+                    running_cost = running_time.total_seconds()/3600.0 * instance_unit_cost
                     total_cost = total_cost + running_cost
 
                     nodes.append([node.name, node.size, node.id, node.public_ips[0], running_time, running_cost])
@@ -0,0 +1,96 @@
+# Copyright (c) 2019-2024 The University of Chicago.
+# Part of skyway, released under the BSD 3-Clause License.
+
+# Maintainer: Trung Nguyen, Yuxing Peng
+
+"""@package docstring
+Inventory: a snapshot of the instances of an account taken with one listing call,
+indexed by name, ID, user name and state.
+
+A driver keeps the inventory for the duration of a command (see Cloud.inventory()),
+so that destroying several nodes, or looking up the host IP and the instance ID of a node,
+costs one call to the vendor API instead of one per node. The inventory is dropped
+when nodes are created or destroyed, and by skywayd before serving each request.
+"""
+
+class Inventory():
+    """
+    The instances of an account, as returned by the driver's get_instances(),
+    indexed with the (name, ID, user name, state) given by keys(instance)
+    """
+
+    def __init__(self, instances, keys):
+        self.instances = []
+        self.by_name = {}
+        self.by_id = {}
+        self.by_user = {}
+        self.by_state = {}
+        self._keys = {}
+
+        for instance in instances:
+            name, ID, user_name, state = keys(instance)
+            self.instances.append(instance)
+            # names are not unique (e.g. AWS Name tags, terminated instances still listed)
+            self.by_name.setdefault(name, []).append(instance)
+            self.by_id[ID] = instance
+            self.by_user.setdefault(user_name, []).append(instance)
+            self.by_state.setdefault(state, []).append(instance)
+            self._keys[id(instance)] = (name, ID, user_name, state)
+
+    def __len__(self):
+        return len(self.instances)
+
+    def __iter__(self):
+        return iter(self.instances)
+
+    def keys_of(self, instance):
+        '''
+        the (name, ID, user name, state) of an instance of the inventory
+        '''
+        return self._keys[id(instance)]
+
+    def name_of(self, instance):
+        return self._keys[id(instance)][0]
+
+    def id_of(self, instance):
+        return self._keys[id(instance)][1]
+
+    def user_of(self, instance):
+        return self._keys[id(instance)][2]
+
+    def state_of(self, instance):
+        return self._keys[id(instance)][3]
+
+    def get(self, ID, states=None):
+        '''
+        the instance with the given ID (in one of the given states), None if not found
+        '''
+        instance = self.by_id.get(ID)
+        if instance is not None and states is not None and self.state_of(instance) not in states:
+            return None
+        return instance
+
+    def find(self, name, states=None):
+        '''
+        the first instance with the given name (in one of the given states), None if not found
+        '''
+        for instance in self.by_name.get(name, []):
+            if states is None or self.state_of(instance) in states:
+                return instance
+        return None
+
+    def of_user(self, user_name, states=None):
+        '''
+        the instances created by a user (in one of the given states)
+        '''
+        return [instance for instance in self.by_user.get(user_name, [])
+                if states is None or self.state_of(instance) in states]
+
+    def in_states(self, states):
+        '''
+        the instances in one of the given states
+        '''
+        instances = []
+        for state in states:
+            instances += self.by_state.get(state, [])
+        return instances
@@ -7,21 +7,25 @@
 Documentation for OCI Class
 """
 
+import base64
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 import io
 import logging
 import os
 import subprocess
+import threading
+import time
 from tabulate import tabulate
 
+from .catalog import NodeTypeCatalog
 from .core import Cloud
 from .. import utils
 
 from colorama import Fore
-import pandas as pd
 
-# Oracle Cloud Infrastructure (OCI) Python SDK
-import oci
+# NOTE: the Oracle Cloud Infrastructure (OCI) Python SDK and pandas are imported where they are first used,
+#       so that constructing the driver, or running commands that do not call the API, stays cheap
 
 class OCI(Cloud):
     """Documentation for AWS Class
@@ -38,9 +42,10 @@ class OCI(Cloud):
 
         #super().__init__(vendor_cfg, kwargs)
 
-        # load [account].yaml under $SKYWAYROOT/etc/accounts
+        # load [account].yaml under $SKYWAYROOT/etc/accounts and the oci section of cloud.yaml under $SKYWAYROOT/etc/
+        # (validated and cached, see utils.load_account_config)
         account_path = os.environ['SKYWAYROOT'] + '/etc/accounts/'
-        account_cfg = utils.load_config(account, account_path)
+        account_cfg, vendor_cfg = utils.load_account_config(account)
         if account_cfg['cloud'] != 'oci' :
             raise Exception(f'Service provider oci is not associated with this account.')
 
@@ -61,19 +66,20 @@ class OCI(Cloud):
             "region": self.account['region']
         }
 
-        self.identity_client = oci.identity.IdentityClient(self.config)
-        self.compute_client = oci.core.ComputeClient(self.config)
-        self.compute_client_composite_operations = oci.core.ComputeClientCompositeOperations(self.compute_client)
+        # the OCI clients are created on first use, see the properties below
+        self._identity_client = None
+        self._compute_client = None
+        self._compute_client_composite_operations = None
+        self._virtual_network_client = None
+        # the compute clients of the threads launching instances in parallel
+        self._thread_clients = threading.local()
 
         self.usage_history = f"{account_path}usage-{account}.pkl"
+        self.usage_ledger = f"{account_path}usage-{account}.db"
 
-        # load cloud.yaml under $SKYWAYROOT/etc/
-        cloud_path = os.environ['SKYWAYROOT'] + '/etc/'
-        vendor_cfg = utils.load_config('cloud', cloud_path)
-        if 'oci' not in vendor_cfg:
-            raise Exception(f'Cloud vendor oci is undefined.')
-
-        self.vendor = vendor_cfg['oci']
+        self.vendor = vendor_cfg
+        # instance type -> price, cores, memory and GPUs of the node types in cloud.yaml
+        self.catalog = NodeTypeCatalog(vendor_cfg['node-types'])
         self.account_name = account
         self.onpremises = False
 
@@ -83,6 +89,58 @@ class OCI(Cloud):
         cmd = f"cp {pem_file_full_path} {self.my_ssh_private_key}; chmod 400 {self.my_ssh_private_key}"
         p = subprocess.run(cmd, shell=True, text=True, capture_output=True)
 
+    @property
+    def identity_client(self):
+        """
+        The OCI identity client of the account, created on first use
+        """
+        if self._identity_client is None:
+            import oci
+            self._identity_client = oci.identity.IdentityClient(self.config)
+        return self._identity_client
+
+    @property
+    def compute_client(self):
+        """
+        The OCI compute client of the account, created on first use
+        """
+        if self._compute_client is None:
+            import oci
+            self._compute_client = oci.core.ComputeClient(self.config)
+        return self._compute_client
+
+    @property
+    def thread_compute_client(self):
+        """
+        An OCI compute client owned by the calling thread, created on first use
+        """
+        client = getattr(self._thread_clients, 'compute_client', None)
+        if client is None:
+            import oci
+            client = oci.core.ComputeClient(self.config)
+            self._thread_clients.compute_client = client
+        return client
+
+    @property
+    def compute_client_composite_operations(self):
+        """
+        The OCI compute composite operations (launch/terminate and wait), created on first use
+        """
+        if self._compute_client_composite_operations is None:
+            import oci
+            self._compute_client_composite_operations = oci.core.ComputeClientCompositeOperations(self.compute_client)
+        return self._compute_client_composite_operations
+
+    @property
+    def virtual_network_client(self):
+        """
+        The OCI virtual network client of the account (VNICs and their public IPs), created on first use
+        """
+        if self._virtual_network_client is None:
+            import oci
+            self._virtual_network_client = oci.core.VirtualNetworkClient(self.config)
+        return self._virtual_network_client
+
     def list_nodes(self, show_protected_nodes=False, verbose=False):
         """Member function: list_nodes
         Get a list of all existed instances
@@ -92,11 +150,14 @@ class OCI(Cloud):
         """
         
         
-        instances = self.get_instances()
+        inventory = self.inventory()
         nodes = []
 
-        for instance in instances:
-            node_name = self.get_instance_name(instance)
+        # the public IPs of all the instances from one listing of the VNIC attachments
+        public_ips = self.get_host_ips(inventory.instances)
+
+        for instance in inventory:
+            node_name = inventory.name_of(instance)
             if show_protected_nodes == False and node_name in self.account['protected_nodes']:
                 continue
 
@@ -106,7 +167,7 @@ class OCI(Cloud):
                 instance_unit_cost = self.get_unit_price_instance(instance)
                 running_cost = running_time.total_seconds()/3600.0 * instance_unit_cost
 
-                public_ip_address = self.get_host_ip(instance)
+                public_ip_address = public_ips.get(instance.id, "")
                 instance_type = instance.shape
                 nodes.append([instance.display_name,
                               instance.lifecycle_state,
@@ -126,81 +187,119 @@ class OCI(Cloud):
             print("", file=output_str)
         return nodes, output_str
 
-    def create_nodes(self, node_type: str, node_names = [], interactive = False, need_confirmation = True, walltime = None, image_id = ""):
+    def create_nodes(self, node_type: str, node_names = [], interactive = False, need_confirmation = True, walltime = None, image_id = "", spot = False):
         """Member function: create_compute
         Create a group of compute instances(nodes, servers, virtual-machines 
         ...) with the given type.
         
          - node_type: instance type information from the Skyway definitions
          - node_names: a list of names for the nodes, to get the number of nodes
+         - spot: create preemptible instances (at the spot-price of the node type in cloud.yaml), which OCI may reclaim
         
         Return: a dictionary of instance ID (i.e., names) for created instances.
         """
         user_name = os.environ['USER']
         user_budget = self.get_budget(user_name=user_name, verbose=False)
         usage, remaining_balance = self.get_cost_and_usage_from_db(user_name=user_name)
-        running_cost = self.get_running_cost(verbose=False)
+        running_cost = self.get_running_cost(verbose=False, user_name=user_name)
         usage = usage + running_cost
         remaining_balance = user_budget - usage
         unit_price = self.vendor['node-types'][node_type]['price']
+        market = ""
+        if spot == True:
+            unit_price = self.catalog.spot_price(node_type)
+            market = "preemptible "
         if need_confirmation == True:
             print(f"User budget: ${user_budget:.3f}")
             print(f"+ Usage    : ${usage:.3f}")
             print(f"+ Available: ${remaining_balance:.3f}")
-            response = input(f"Do you want to create an instance of type {node_type} (${unit_price}/hr)? (y/n) ")
+            response = input(f"Do you want to create a {market}instance of type {node_type} (${unit_price}/hr)? (y/n) ")
             if response == 'n':
                 return
 
-        count = len(node_names)      
-        node_name = node_names[0]
+        count = len(node_names)
+        if count <= 0:
+            raise Exception(f'List of node names is empty.')
         print(Fore.BLUE + f"Allocating {count} instance ...", end=" ")
 
         # ImageID and KeyName provided by the account then user can connect to the running node
         #   if ImageID is from the vendor, KeyName from the account, ssh connection is denied
-
-        vnic_details = oci.core.models.CreateVnicDetails(
-            subnet_id=self.account['subnet_id'],
-            assign_public_ip=True,
-            display_name='my_instance_vnic',
-            hostname_label='my-instance'
-        )
+        import oci
 
         public_key_file = self.account_path + "/" + self.account['public_key']
         ssh_pub_key = open(public_key_file).read()
 
-       
-        list_availability_domains_response = oci.pagination.list_call_get_all_results(
-            self.identity_client.list_availability_domains,
-            self.account['compartment_id']
-        )
-        availability_domain = list_availability_domains_response.data[0]
+
+        # the availability domain from the vendor metadata of the account (see fetch_metadata)
+        availability_domain = self.get_metadata()['availability_domain']
 
         vm_image = self.account['image_id']
         if image_id != "":
             vm_image = image_id
 
-        instance_details = oci.core.models.LaunchInstanceDetails(
-            compartment_id = self.account['compartment_id'],
-            availability_domain = availability_domain.name,
-            shape = self.vendor['node-types'][node_type]['name'],
-            shape_config = oci.core.models.LaunchInstanceShapeConfigDetails(ocpus=1, memory_in_gbs=1),
-            display_name = 'my_instance',
-            create_vnic_details = vnic_details,
-            image_id = vm_image,
-            metadata = {
-                'ssh_authorized_keys': ssh_pub_key,
-                'Name': node_name,
-                'User': user_name,
-                'node_type': self.vendor['node-types'][node_type]['name'],
-            }
-        )
-
-        # Launch the instance
-        launch_instance_response = self.compute_client_composite_operations.launch_instance_and_wait_for_state(
-            instance_details,
-            wait_for_states=[oci.core.models.Instance.LIFECYCLE_STATE_RUNNING]
-        )
-        instance = launch_instance_response.data
+        # flexible shapes (e.g. VM.Standard.E4.Flex) take the OCPUs (ocpus, or cores) and memory of the node type,
+        # the fixed shapes do not accept a shape config
+        node_cfg = self.vendor['node-types'][node_type]
+        node_info = self.catalog.by_type[node_type]
+        shape_config = None
+        if node_info.name.endswith('.Flex'):
+            shape_config = oci.core.models.LaunchInstanceShapeConfigDetails(
+                ocpus = float(node_cfg.get('ocpus', node_info.cores)),
+                memory_in_gbs = float(node_info.memgb))
+
+        # post boot tasks run by cloud-init while the instance boots (base64-encoded user data)
+        #   + shut down the instance after the walltime
+        #   + mounting storage (/software) from io-server 172.31.47.245 (private IP of the rcc-io node)
+        #     (need to install nfs-utils on the VM, or having an image that has nfs-utils installed)
+        #io_server = "172.31.47.245"
+        #post_boot_script = self.get_post_boot_script(walltime, ["mkdir -p /software", f"mount -t nfs {io_server}:/software /software"])
+        post_boot_script = self.get_post_boot_script(walltime)
+        user_data = base64.b64encode(post_boot_script.encode()).decode()
+
+        # the preemptible instances are terminated (with their boot volume) when OCI reclaims the capacity
+        preemptible_config = None
+        if spot == True:
+            preemptible_config = oci.core.models.PreemptibleInstanceConfigDetails(
+                preemption_action = oci.core.models.TerminatePreemptionAction(
+                    type = 'TERMINATE',
+                    preserve_boot_volume = False))
+
+        def launch_instance(node_name):
+            # the host name is derived from the display name by OCI
+            vnic_details = oci.core.models.CreateVnicDetails(
+                subnet_id=self.account['subnet_id'],
+                assign_public_ip=True,
+                display_name=f'{node_name}_vnic'
+            )
+            instance_details = oci.core.models.LaunchInstanceDetails(
+                compartment_id = self.account['compartment_id'],
+                availability_domain = availability_domain,
+                shape = node_info.name,
+                shape_config = shape_config,
+                display_name = node_name,
+                create_vnic_details = vnic_details,
+                image_id = vm_image,
+                preemptible_instance_config = preemptible_config,
+                metadata = {
+                    'ssh_authorized_keys': ssh_pub_key,
+                    'user_data': user_data,
+                    'Name': node_name,
+                    'User': user_name,
+                    'node_type': node_info.name,
+                }
+            )
+            try:
+                return self.thread_compute_client.launch_instance(instance_details).data
+            except oci.exceptions.ServiceError as e:
+                print(f"Failed to create {node_name}. Reason: {e.message}")
+                return None
+
+        # Launch the instances at the same time (create-workers in cloud.yaml, default 16),
+        # then wait for all of them to be running
+        max_workers = max(1, min(count, int(self.vendor.get('create-workers', 16))))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            launched = [instance for instance in executor.map(launch_instance, node_names) if instance is not None]
+        instances = self.wait_until_running(launched)
 
         nodes = {}
         # .pem file is the private key of the local machine that has a correponding public key listed
@@ -208,43 +307,57 @@ class OCI(Cloud):
         path = os.environ['SKYWAYROOT'] + '/etc/accounts/'
         pem_file_full_path = path + self.account['private_key']
         username = self.vendor['username']
-        public_ip = self.get_host_ip(instance)
-
-        if walltime is None:
-            walltime_str = "00:05:00"
-        else:
-            walltime_str = walltime
-
-        # shutdown the instance after the walltime (in minutes)
-        pt = datetime.strptime(walltime_str, "%H:%M:%S")
-        walltime_in_minutes = int(pt.hour * 60 + pt.minute + pt.second/60)
+        # the public IPs of all the instances from one listing of the VNIC attachments
+        public_ips = self.get_host_ips(instances)
 
         # record node_type, launch time
-        instance_type = str(self.vendor['node-types'][node_type]['name'])
-        launch_time = instance.time_created.strftime("%Y-%m-%dT%H:%M:%S.%f%z")
-        nodes[node_names[0]] = [instance_type, launch_time, str(public_ip)]
-
-        # perform post boot tasks on each node
-        #   + mounting storage (/home, /software) from io-server 172.31.47.245 (private IP of the rcc-io node) (rcc-aws, not using a trusted agent)
-        #   + executing some custom scripts
-        #   + shut down the instance after the walltime
-        #io_server = "172.31.47.245"
-        
-        #ip_converted = ip.replace('.','-')
-
-        print(f"\nCreated instance: {instance.display_name}")
+        instance_type = str(node_info.name)
+        for instance in instances:
+            launch_time = instance.time_created.strftime("%Y-%m-%dT%H:%M:%S.%f%z")
+            nodes[instance.display_name] = [instance_type, launch_time, str(public_ips[instance.id])]
 
-        # need to install nfs-utils on the VM (or having an image that has nfs-utils installed)
-        print(f"To connect to the instance, run:")
-        cmd = f"  ssh -i {self.my_ssh_private_key} -o StrictHostKeyChecking=accept-new {username}@{public_ip} or"
-        print(f"  skyway_connect --account={self.account_name} -J {instance.display_name}")
-        print(f"{cmd}")
-        cmd += f" -t 'sudo shutdown -P {walltime_in_minutes}'; bash "
-        #cmd += f"-t 'sudo shutdown -P {walltime_in_minutes}; sudo mount -t nfs {io_server}:/software /software' "
-        p = subprocess.run(cmd, shell=True, text=True, capture_output=True)
+        for instance in instances:
+            public_ip = public_ips[instance.id]
+            print(f"\nCreated instance: {instance.display_name}")
+            print(f"To connect to the instance, run:")
+            print(f"  ssh -i {self.my_ssh_private_key} -o StrictHostKeyChecking=accept-new {username}@{public_ip} or")
+            print(f"  skyway_connect --account={self.account_name} -J {instance.display_name}")
 
+        self.invalidate_listing()
         return nodes
 
+    def wait_until_running(self, instances, timeout=1200, poll_interval=5):
+        """Member function: wait for several launched instances to be running
+        Return: the running instances (the instances that failed to start are reported and left out)
+        The instances of the compartment are listed once per poll, however many instances are waited for.
+        """
+        import oci
+        pending = set(instance.id for instance in instances)
+        running = {}
+        deadline = time.time() + timeout
+        while len(pending) > 0:
+            listed = oci.pagination.list_call_get_all_results(
+                self.compute_client.list_instances, self.account['compartment_id']
+            ).data
+            for instance in listed:
+                if instance.id not in pending:
+                    continue
+                if instance.lifecycle_state == 'RUNNING':
+                    running[instance.id] = instance
+                    pending.discard(instance.id)
+                elif instance.lifecycle_state in ['TERMINATING', 'TERMINATED']:
+                    print(f"Instance {instance.display_name} failed to start ({instance.lifecycle_state}).")
+                    pending.discard(instance.id)
+            if len(pending) == 0:
+                break
+            if time.time() > deadline:
+                print(f"Timed out waiting for {len(pending)} instance(s) to be running.")
+                break
+            time.sleep(poll_interval)
+
+        # in the launch order
+        return [running[instance.id] for instance in instances if instance.id in running]
+
     def connect_node(self, instance, separate_terminal=True):
         """
         Connect to an instance using account's pem file
@@ -321,23 +434,58 @@ class OCI(Cloud):
         if node_names is None and IDs is None:
             raise ValueError(f"node_names and IDs cannot be both empty.")
 
-        # List all instances in the compartment
-        instance_list = oci.pagination.list_call_get_all_results(
-            self.compute_client.list_instances,
-            self.account['compartment_id']
-        ).data
+        import oci
+        # one listing for all the nodes to destroy
+        inventory = self.inventory()
 
-        # Filter the instances to get only the running ones
-        running_instances = [instance for instance in instance_list if instance.lifecycle_state == 'RUNNING']
+        instances = []
+        if node_names is not None:
+            if isinstance(node_names, str): node_names = [node_names]
+            for node in node_names:
+                instances += [instance for instance in inventory.by_name.get(node, [])
+                              if inventory.state_of(instance) == 'RUNNING']
+        else:
+            for ID in IDs:
+                instance = inventory.get(ID, states=['RUNNING'])
+                if instance is not None:
+                    instances.append(instance)
 
         # Terminate instances with the given names
-        for node in node_names:
-            for instance in running_instances:
-                if instance.display_name == node:
-                    self.compute_client_composite_operations.terminate_instance_and_wait_for_state(
-                        instance.id,
-                        wait_for_states=[oci.core.models.Instance.LIFECYCLE_STATE_TERMINATED]
-                    )
+        destroyed = False
+        for instance in instances:
+            name = inventory.name_of(instance)
+            if name in self.account['protected_nodes']:
+                continue
+
+            # only the instances created by the user (including untagged instances, which have no user)
+            if inventory.user_of(instance) != user_name:
+                print(f"Cannot destroy an instance {name} created by other users")
+                continue
+
+            running_time = datetime.now(timezone.utc) - instance.time_created
+            instance_unit_cost = self.get_unit_price_instance(instance)
+            running_cost = running_time.total_seconds()/3600.0 * instance_unit_cost
+
+            if need_confirmation == True:
+                response = input(f"Do you want to destroy {name} (running cost ${running_cost:0.5f})? (y/n) ")
+                if response != 'y':
+                    continue
+
+            self.compute_client_composite_operations.terminate_instance_and_wait_for_state(
+                instance.id,
+                wait_for_states=[oci.core.models.Instance.LIFECYCLE_STATE_TERMINATED]
+            )
+            destroyed = True
+
+            # record the running time and cost into the usage ledger
+            # (also telling the instances terminated here from the preemptible instances reclaimed by OCI, see check_interruption)
+            if user_name in self.users:
+                current_time = datetime.now(timezone.utc)
+                running_cost = (current_time - instance.time_created).total_seconds()/3600.0 * instance_unit_cost
+                self.record_usage(user_name, instance.id, instance.shape,
+                                  instance.time_created, current_time, running_cost)
+        if destroyed:
+            self.invalidate_listing()
 
 
     def check_valid_user(self, user_name, verbose=False):
@@ -356,59 +504,6 @@ class OCI(Cloud):
     def get_cost_and_usage(self, start_date, end_date, verbose=True):
         pass
 
-    def get_cost_and_usage_from_db(self, user_name):
-        '''
-        compute the accumulating cost from the pkl database
-        and the remaining balance
-        '''
-        if user_name not in self.users:
-            raise Exception(f"{user_name} is not listed in the user group of this account.")
-                
-        user_budget = self.users[user_name]['budget']
-
-        if not os.path.isfile(self.usage_history):
-            print(f"Usage history {self.usage_history} is not available")
-            data = [user_name, "--", "--", "00:00:00", "00:00:00", "0.0", user_budget]
-            df = pd.DataFrame([], columns=['User','InstanceID','InstanceType','Start','End', 'Cost', 'Balance'])
-            #df = pd.DataFrame(columns=['User','InstanceID','InstanceType','Start','End', 'Cost', 'Balance'])
-            df = pd.concat([pd.DataFrame([data], columns=df.columns), df], ignore_index=True)
-            df.to_pickle(self.usage_history)
-            return 0, user_budget
-
-        df = pd.read_pickle(self.usage_history)
-        df_user = df.loc[df['User'] == user_name]
-        df_user = df_user.astype({"Cost": float})
-        accumulating_cost = df_user['Cost'].sum()
-        user_budget = self.get_budget(user_name=user_name, verbose=False)
-        remaining_balance = float(user_budget) - float(accumulating_cost)
-
-        return accumulating_cost, remaining_balance
-
-    def get_usage_history_from_db(self, user_name):
-        '''
-        compute the accumulating cost from the pkl database
-        and the remaining balance
-        '''
-        if user_name not in self.users:
-            raise Exception(f"{user_name} is not listed in the user group of this account.")
-                
-        user_budget = self.users[user_name]['budget']
-
-        if not os.path.isfile(self.usage_history):
-            print(f"Usage history {self.usage_history} is not available")
-            data = [user_name, "--", "--", "00:00:00", "00:00:00", "0.0", user_budget]
-            df = pd.DataFrame([], columns=['User','InstanceID','InstanceType','Start','End', 'Cost', 'Balance'])
-            #df = pd.DataFrame(columns=['User','InstanceID','InstanceType','Start','End', 'Cost', 'Balance'])
-            df = pd.concat([pd.DataFrame([data], columns=df.columns), df], ignore_index=True)
-            df.to_pickle(self.usage_history)
-            return 0, user_budget
-
-        df = pd.read_pickle(self.usage_history)
-        df_user = df.loc[df['User'] == user_name]
-        
-        history = df_user[['User','InstanceID','InstanceType','Start','End']]
-        return history
-
     def get_budget_api(self):
         '''
         get the budget from the cloud account
@@ -479,18 +574,15 @@ class OCI(Cloud):
         Return identifiers of all running instances
         """
 
-        instances = self.get_instances(filters = [{
-            "Name" : "instance-state-name",
-            "Values" : ["running"]
-        }])
+        inventory = self.inventory()
         
         nodes = []
         
-        for instance in instances:
-            nodes.append([self.get_instance_name(instance),
-                              instance.state['Name'], 
-                              instance.instance_type, 
-                              instance.instance_id])
+        for instance in inventory.in_states(['RUNNING']):
+            nodes.append([inventory.name_of(instance),
+                              instance.lifecycle_state, 
+                              instance.shape, 
+                              instance.id])
         
         if verbose == True:
             print(tabulate(nodes, headers=['Name', 'Status', 'Type', 'Instance ID', 'Host IP']))
@@ -501,10 +593,18 @@ class OCI(Cloud):
 
     def get_host_ip(self, instance):
         """Member function: get the IP address of an instance (node) 
-         - ID: instance identifier
+         - instance: an instance object, or its identifier or name
         """
+        if isinstance(instance, str):
+            inventory = self.inventory()
+            ID = instance
+            instance = inventory.get(ID)
+            if instance is None:
+                instance = inventory.find(ID)
+            if instance is None:
+                raise ValueError(f"Instance '{ID}' not found.")
+
         public_ip = ""
-        vn_client = oci.core.VirtualNetworkClient(self.config)
 
         vnic_attachments = self.compute_client.list_vnic_attachments(
             compartment_id=instance.compartment_id,
@@ -515,7 +615,7 @@ class OCI(Cloud):
             vnic_id = vnic_attachments[0].vnic_id
 
             # Get the VNIC details
-            vnic = vn_client.get_vnic(vnic_id).data
+            vnic = self.virtual_network_client.get_vnic(vnic_id).data
             
             # Retrieve the public IP address
             public_ip = vnic.public_ip
@@ -526,7 +626,57 @@ class OCI(Cloud):
         return public_ip
 
 
+    def get_host_ips(self, instances, max_workers=8):
+        """Member function: get the public IP addresses of several instances
+        Return: a dictionary of public IP addresses keyed by instance ID ("" if an instance has no public IP)
+        The VNIC attachments of the compartment are listed in one paginated call,
+        then the VNICs are fetched concurrently with the same client.
+        """
+        import oci
+        from concurrent.futures import ThreadPoolExecutor
+
+        instance_ids = set(instance.id for instance in instances)
+        if len(instance_ids) == 0:
+            return {}
+
+        attachments = oci.pagination.list_call_get_all_results(
+            self.compute_client.list_vnic_attachments,
+            compartment_id=self.account['compartment_id']
+        ).data
+
+        # the first attached VNIC of each instance
+        vnic_ids = {}
+        for attachment in attachments:
+            if attachment.instance_id in instance_ids and attachment.lifecycle_state == 'ATTACHED':
+                vnic_ids.setdefault(attachment.instance_id, attachment.vnic_id)
+
+        def get_public_ip(vnic_id):
+            try:
+                return self.virtual_network_client.get_vnic(vnic_id).data.public_ip or ""
+            except oci.exceptions.ServiceError:
+                # the VNIC may be detached since the listing
+                return ""
+
+        public_ips = dict.fromkeys(instance_ids, "")
+        items = list(vnic_ids.items())
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for (instance_id, vnic_id), public_ip in zip(items, executor.map(get_public_ip, [v for _, v in items])):
+                public_ips[instance_id] = public_ip
+        return public_ips
+
+    def fetch_metadata(self):
+        """
+        The availability domain of the compartment of the account (the first one), used by create_nodes
+        """
+        import oci
+        list_availability_domains_response = oci.pagination.list_call_get_all_results(
+            self.identity_client.list_availability_domains,
+            self.account['compartment_id']
+        )
+        return { 'availability_domain': list_availability_domains_response.data[0].name }
+
     def get_all_images(self, owners=['self']):
+        import oci
         try:
             list_images_response = oci.pagination.list_call_get_all_results(
                 self.compute.list_images,
@@ -557,16 +707,10 @@ class OCI(Cloud):
         Note: AWS doesn't use unique name for instances, instead, name is an
         attribute stored in the tags.        
         """
-        running_instances = self.get_instances()
-                
-        for instance in running_instances:
-            if instance.tags is None: continue
-
-            for tag in instance.tags:
-                if tag['Key'] == 'Name':
-                    if tag['Value'] == instance_name:
-                        return instance.id
-        return ''
+        instance = self.inventory().find(instance_name, states=['RUNNING'])
+        if instance is None:
+            return ''
+        return instance.id
 
     def get_instance_user_name(self, instance):
         """Member function: get_instance_user_name
@@ -574,14 +718,9 @@ class OCI(Cloud):
         
          - instance:
         """
-        
-        if instance.tags is None: return ''
-
-        for tag in instance.tags:
-            if tag['Key'] == 'User':
-                return tag['Value']
-        
-        return ''
+        # the user name is stored in the instance metadata by create_nodes()
+        metadata = instance.metadata or {}
+        return metadata.get('User', '')
 
 
     def get_instances(self, filters = []):
@@ -589,51 +728,88 @@ class OCI(Cloud):
         Get a list of instance objects with give filters
         NOTE: if using libcloud then use self.driver.list_nodes()
         """
-        instance_list = oci.pagination.list_call_get_all_results(
-            self.compute_client.list_instances, self.account['compartment_id']
+        import oci
+        # only the running instances are listed (filtered by the API)
+        instances = oci.pagination.list_call_get_all_results(
+            self.compute_client.list_instances, self.account['compartment_id'],
+            lifecycle_state='RUNNING'
         ).data
-
-        # Filter the instances to get only the running ones
-        instances = [instance for instance in instance_list if instance.lifecycle_state == 'RUNNING']
         return instances
 
+    def get_instance_keys(self, instance):
+        """
+        The (name, ID, user name, state) of an instance, used to index the inventory
+        """
+        return instance.display_name, instance.id, self.get_instance_user_name(instance), instance.lifecycle_state
+
     def get_unit_price_instance(self, instance):
         """
-        Get the per-hour price of an instance depending on its instance_type (e.g. t2.micro)
+        Get the per-hour price of an instance depending on its instance_type (e.g. t2.micro),
+        the spot-price of the node type in cloud.yaml for a preemptible instance
         """
-        for node_type in self.vendor['node-types']:
-            if self.vendor['node-types'][node_type]['name'] == instance.shape:
-                unit_price = self.vendor['node-types'][node_type]['price']
-                return unit_price
-        return -1.0
+        if getattr(instance, 'preemptible_instance_config', None) is not None:
+            return self.catalog.spot_price_of(instance.shape)
+        return self.catalog.price_of(instance.shape)
+
+    def check_interruption(self, node_name):
+        """Member function: check whether the preemptible instance of a node name of the user was reclaimed by OCI
+        A reclaimed instance is terminated by OCI (see create_nodes), its usage is recorded into the usage ledger.
+
+        Return: the reason of the interruption, None if the instance was not reclaimed
+        """
+        import oci
+        user_name = os.environ['USER']
+        # the instances of the node name in all the states (get_instances only lists the running instances)
+        instances = oci.pagination.list_call_get_all_results(
+            self.compute_client.list_instances, self.account['compartment_id'],
+            display_name=node_name
+        ).data
+        instances = [instance for instance in instances if self.get_instance_user_name(instance) == user_name]
+        if len(instances) == 0:
+            return None
+        # the latest instance of the node name
+        instance = max(instances, key=lambda instance: instance.time_created)
+        if instance.preemptible_instance_config is None or instance.lifecycle_state not in ['TERMINATING', 'TERMINATED']:
+            return None
+        # terminated by destroy_nodes
+        if self.ledger.has_instance(instance.id):
+            return None
+
+        self.record_interrupted_usage(user_name, instance.id, instance.shape,
+                                      instance.time_created, datetime.now(timezone.utc), self.get_unit_price_instance(instance))
+        self.invalidate_listing()
+        return f"preempted by OCI (instance {instance.lifecycle_state.lower()})"
 
     def get_unit_price(self, node_type: str):
         """
         Get the per-hour price of an instance depending on its node type (e.g. t1)
         """
-        if node_type in self.vendor['node-types']:
-            return self.vendor['node-types'][node_type]['price']
-        return -1.0
+        return self.catalog.price(node_type)
 
-    def get_running_cost(self, verbose=True):
-        instances = self.get_instances()
+    def get_running_cost(self, verbose=True, user_name=None):
+        # list_instances does not filter by metadata: the instances of a user are selected from the inventory
+        inventory = self.inventory()
+        if user_name is None:
+            instances = inventory.in_states(['RUNNING'])
+        else:
+            instances = inventory.of_user(user_name, states=['RUNNING'])
 
         nodes = []
         total_cost = 0.0
         for instance in instances:
             
-            if self.get_instance_name(instance) in self.account['protected_nodes']:
+            if inventory.name_of(instance) in self.account['protected_nodes']:
                 continue
 
-            if instance.state['Name'] == 'running':
-                running_time = datetime.now(timezone.utc) - instance.launch_time
+            if instance.lifecycle_state == 'RUNNING':
+                running_time = datetime.now(timezone.utc) - instance.time_created
                 instance_unit_cost = self.get_unit_price_instance(instance)
-                running_cost = running_time.seconds/3600.0 * instance_unit_cost
+                running_cost = running_time.total_seconds()/3600.0 * instance_unit_cost
                 total_cost = total_cost + running_cost
-                nodes.append([self.get_instance_name(instance),
-                                    instance.state['Name'], 
+                nodes.append([inventory.name_of(instance),
+                                    instance.lifecycle_state, 
                                     instance.shape, 
-                                    instance.instance_id,
+                                    instance.id,
                                     running_time,
                                     running_cost])
         if verbose == True:
@@ -643,6 +819,7 @@ class OCI(Cloud):
     
 
     def get_availability_domain(identity, compartment_id):
+        import oci
         list_availability_domains_response = oci.pagination.list_call_get_all_results(
                     identity.list_availability_domains, compartment_id)
         # just return the first availability domain
@@ -14,11 +14,13 @@ import os
 import subprocess
 from tabulate import tabulate
 
+from .catalog import NodeTypeCatalog
 from .core import Cloud
 from .. import utils
 
 from colorama import Fore
-import pandas as pd
+
+# NOTE: pandas is imported where it is first used
 
 class SLURMJob:
     def __init__(self, jobid, state, job_name, instance_type, host, running_time="", start_time=""):
@@ -45,9 +47,10 @@ class SLURMCluster(Cloud):
 
         #super().__init__(vendor_cfg, kwargs)
 
-        # load [account].yaml under $SKYWAYROOT/etc/accounts
+        # load [account].yaml under $SKYWAYROOT/etc/accounts and the slurm section of cloud.yaml under $SKYWAYROOT/etc/
+        # (validated and cached, see utils.load_account_config)
         account_path = os.environ['SKYWAYROOT'] + '/etc/accounts/'
-        account_cfg = utils.load_config(account, account_path)
+        account_cfg, vendor_cfg = utils.load_account_config(account)
         if account_cfg['cloud'] != 'slurm' :
             raise Exception(f'Service provider slurm is not associated with this account.')
 
@@ -55,14 +58,11 @@ class SLURMCluster(Cloud):
             setattr(self, k.replace('-','_'), v)
 
         self.usage_history = f"{account_path}usage-{account}.pkl"
+        self.usage_ledger = f"{account_path}usage-{account}.db"
 
-        # load cloud.yaml under $SKYWAYROOT/etc/
-        cloud_path = os.environ['SKYWAYROOT'] + '/etc/'
-        vendor_cfg = utils.load_config('cloud', cloud_path)
-        if 'slurm' not in vendor_cfg:
-            raise Exception(f'Service provider slurm is undefined.')
-
-        self.vendor = vendor_cfg['slurm']
+        self.vendor = vendor_cfg
+        # instance type -> price, cores, memory and GPUs of the node types in cloud.yaml
+        self.catalog = NodeTypeCatalog(vendor_cfg['node-types'])
         self.account_name = account
         self.onpremises = True
        
@@ -162,13 +162,8 @@ class SLURMCluster(Cloud):
         user_name = os.environ['USER']
         user_budget = self.users[user_name]['budget']
 
-        if not os.path.isfile(self.usage_history):
-            print(f"Usage history {self.usage_history} is not available")
-            data = [user_name, "--", "--", "00:00:00", "00:00:00", "0.0", user_budget]
-            df = pd.DataFrame([], columns=['User','InstanceID','InstanceType','Start','End', 'Cost', 'Balance'])
-            #df = pd.DataFrame(columns=['User','InstanceID','InstanceType','Start','End', 'Cost', 'Balance'])
-            df = pd.concat([pd.DataFrame([data], columns=df.columns), df], ignore_index=True)
-            df.to_pickle(self.usage_history)
+        if not os.path.isfile(self.usage_ledger) and not os.path.isfile(self.usage_history):
+            print(f"Usage history {self.usage_ledger} is not available")
             return 0, user_budget
 
         cmd = f"rcchelp usage --user {user_name} | awk \'$1 == \"{user_name}\" " 
@@ -259,7 +254,7 @@ class SLURMCluster(Cloud):
         user_name = os.environ['USER']
         user_budget = self.get_budget(user_name=user_name, verbose=False)
         usage, remaining_balance = self.get_cost_and_usage_from_db(user_name=user_name)
-        running_cost = self.get_running_cost(verbose=False)
+        running_cost = self.get_running_cost(verbose=False, user_name=user_name)
         usage = usage + running_cost
         remaining_balance = user_budget - usage
         unit_price = self.vendor['node-types'][node_type]['price']
@@ -302,6 +297,7 @@ class SLURMCluster(Cloud):
         print(f"{cmd}")
         #p = subprocess.run(cmd, shell=True, text=True, capture_output=True)
         os.system(cmd)
+        self.invalidate_listing()
 
     def connect_node(self, node_name, separate_terminal=True):
         '''
@@ -326,36 +322,21 @@ class SLURMCluster(Cloud):
         '''
         destroy several nodes (aka instances) given a list of node names using scancel
         '''
-        user_name = os.environ['USER']
-
-        # maybe no need to check if the job ID belongs the current user because scancel will throw errors otherwise
+        # the jobs of the user from one squeue call (the jobs of other users are not listed)
+        inventory = self.inventory()
 
         for instanceID in IDs:
             print(f"Cancelling job {instanceID}")
             
-            user_name = os.environ['USER']
-            # job_id state job_name account nodelist   runningtime starttime comment user_name"
-            cmd = f"export SQUEUE_FORMAT=\"%13i %.4t %24j %16a %N %M %V %k %u\"; squeue -j {instanceID} -h"
-
-            proc = subprocess.Popen([cmd], stdout=subprocess.PIPE, shell=True)
-            (out, err) = proc.communicate()
-        
-            # encode output as utf-8 from bytes, remove newline character
-            line = out.decode('utf-8').strip()
-
-            
-            node_info = line.split()
-
-            job_user_name = node_info[8]
-            if job_user_name != user_name:
+            job = inventory.get(str(instanceID))
+            if job is None:
                 continue
-            jobid = node_info[0]
-            state = node_info[1]        
-            job_name = node_info[2]     
-            instance_type = node_info[7] # node_info getting from comment 
-            instance_id = node_info[4]   # nodelist, can be used as public_host_ip
-            running_time = node_info[5]  
-            start_time = node_info[6]
+
+            job_user_name = inventory.user_of(job)
+            jobid = job.jobid
+            instance_type = job.instance_type # node_info getting from comment 
+            running_time = job.running_time
+            start_time = job.start_time
             
             unit_price = self.vendor['node-types'][instance_type]['price']
             time_stamp = running_time.split(':')
@@ -372,20 +353,12 @@ class SLURMCluster(Cloud):
 
             running_cost = running_time_hours * unit_price
         
-            # store the record into the database
-            usage, remaining_balance = self.get_cost_and_usage_from_db(user_name=user_name)
-            data = [job_user_name, jobid, instance_type, start_time, datetime.now(timezone.utc), running_cost, remaining_balance]
-
-            if os.path.isfile(self.usage_history):
-                df = pd.read_pickle(self.usage_history)
-            else:
-                df = pd.DataFrame([], columns=['User','JobID','InstanceType','Start','End', 'Cost', 'Balance'])
-
-            df = pd.concat([pd.DataFrame([data], columns=df.columns), df], ignore_index=True)
-            df.to_pickle(self.usage_history)
+            # store the record into the usage ledger (the job ID as instance ID)
+            self.record_usage(job_user_name, jobid, instance_type, start_time, datetime.now(timezone.utc), running_cost)
 
             cmd = f"scancel {instanceID}"
             os.system(cmd)
+            self.invalidate_listing()
 
     def get_running_nodes(self, verbose=False):
         '''
@@ -452,8 +425,9 @@ class SLURMCluster(Cloud):
             print("", file=output_str)
         return nodes, output_str
 
-    def get_running_cost(self, verbose=True):
+    def get_running_cost(self, verbose=True, user_name=None):
         total_cost = 0.0
+        # squeue lists the jobs of the current user
         user_name = os.environ['USER']
 
         # job_id state job_name account nodelist   runningtime starttime comment user_name"
@@ -521,13 +495,10 @@ class SLURMCluster(Cloud):
         '''
         return the job ID of a job name (instance name) used for scancel in destroy_nodes()
         '''
-        nodes, _ = self.get_running_nodes(verbose=False)
-        instance_ID = None
-        for node in nodes:
-            # node = [job_name, state, instance_type, jobid, instance_id, running_time, running_cost]
-            if node[0] == instance_name:
-                instance_ID = node[3]
-        return instance_ID
+        job = self.inventory().find(instance_name, states=['R'])
+        if job is None:
+            return None
+        return job.jobid
 
 
     def get_host_ip(self, instance_name):
@@ -535,21 +506,16 @@ class SLURMCluster(Cloud):
         get the public IP or host (node list for SLURM) of a instance (job) name
         
         '''
-        nodes, _ = self.get_running_nodes(verbose=False)
-        instance_ID = None
-        for node in nodes:
-            # node = [job_name, state, instance_type, jobid, instance_id, running_time, running_cost]
-            if node[0] == instance_name:
-                instance_ID = node[4]
-        return instance_ID
+        job = self.inventory().find(instance_name, states=['R'])
+        if job is None:
+            return None
+        return job.host
 
     def get_unit_price(self, node_type: str):
         '''
         get the unit price of a node object (inferring from its name and from the cloud.yaml file)
         '''
-        if node_type in self.vendor['node-types']:
-            return self.vendor['node-types'][node_type]['price']
-        return -1.0
+        return self.catalog.price(node_type)
 
     def get_instances(self, filters = []):
         """Member function: get_instances
@@ -583,4 +549,11 @@ class SLURMCluster(Cloud):
             instance = SLURMJob(jobid, state, job_name, instance_type, instance_id, running_time, start_time)
             nodes.append(instance)
             
-        return nodes
\ No newline at end of file
+        return nodes
+
+    def get_instance_keys(self, job):
+        '''
+        the (name, ID, user name, state) of a job, used to index the inventory
+        (squeue only lists the jobs of the current user)
+        '''
+        return job.job_name, job.jobid, os.environ['USER'], job.state
\ No newline at end of file
@@ -0,0 +1,366 @@
+# Copyright (c) 2019-2024 The University of Chicago.
+# Part of skyway, released under the BSD 3-Clause License.
+
+# Maintainer: Trung Nguyen, Yuxing Peng
+
+"""@package docstring
+skywayd: an optional per-user daemon that keeps one initialized driver per account alive
+and serves the requests of the skyway commands over a Unix socket.
+
+The commands get their driver through create(account_name): if skywayd is running,
+a DriverProxy forwards the calls to the warm driver in the daemon, otherwise the driver
+is created in-process as before (see skyway.cloud.create), its calls serialized with
+the background refreshes of the listing cache (see LockedDriver).
+"""
+
+import io
+import os
+import pickle
+import socket
+import socketserver
+import struct
+import sys
+import threading
+
+from . import cloud
+
+# driver methods served by the daemon, the other methods (e.g. connect_node, execute_script)
+# run in the command process because they need the user's terminal
+served_methods = {
+    'check_valid_user', 'get_budget', 'get_group_members', 'get_node_types',
+    'get_cost_and_usage_from_db', 'get_usage_history_from_db',
+    'list_nodes', 'list_nodes_cached', 'get_running_nodes', 'get_running_cost',
+    'get_instance_ID', 'get_host_ip', 'get_node_connection_info', 'get_unit_price',
+    'create_nodes', 'destroy_nodes', 'check_interruption',
+}
+
+# methods that prompt for a confirmation: only served if called with need_confirmation=False
+interactive_methods = {'create_nodes', 'destroy_nodes'}
+
+def socket_path():
+    '''
+    path to the per-user socket of skywayd, ~/.skyway/skywayd.sock unless SKYWAYD_SOCKET is set
+    '''
+    if 'SKYWAYD_SOCKET' in os.environ:
+        return os.environ['SKYWAYD_SOCKET']
+    return os.path.join(os.path.expanduser('~'), '.skyway', 'skywayd.sock')
+
+# messages are pickled objects prefixed with their length (4 bytes),
+# only processes of the same user can connect to the socket (see _check_peer)
+def _send(f, obj):
+    _write(f, pickle.dumps(obj))
+
+def _write(f, data):
+    f.write(struct.pack('!I', len(data)) + data)
+    f.flush()
+
+def _recv(f):
+    header = f.read(4)
+    if len(header) < 4:
+        return None
+    size = struct.unpack('!I', header)[0]
+    return pickle.loads(f.read(size))
+
+# io.StringIO (returned by list_nodes) cannot be pickled, send its content instead
+class _Text(str):
+    pass
+
+def _portable(result):
+    if isinstance(result, io.StringIO):
+        return _Text(result.getvalue())
+    if isinstance(result, tuple):
+        return tuple(_portable(r) for r in result)
+    return result
+
+def _restore(result):
+    if isinstance(result, _Text):
+        return io.StringIO(str(result))
+    if isinstance(result, tuple):
+        return tuple(_restore(r) for r in result)
+    return result
+
+
+class DaemonError(Exception):
+    pass
+
+class DriverProxy():
+    """
+    Forward the calls of a command to the driver of an account kept alive in skywayd,
+    falling back to an in-process driver for the calls the daemon does not serve.
+    """
+
+    def __init__(self, account_name, sock):
+        self._account_name = account_name
+        self._sock = sock
+        self._file = sock.makefile('rwb')
+        self._local = None
+        self._attrs = {}
+
+    def _request(self, request):
+        request['account'] = self._account_name
+        try:
+            _send(self._file, request)
+            response = _recv(self._file)
+        except (OSError, EOFError, pickle.PickleError) as e:
+            raise DaemonError(f"skywayd: {e}")
+        if response is None:
+            raise DaemonError("skywayd closed the connection.")
+
+        # replay what the driver printed in the daemon
+        if response.get('stdout', '') != '':
+            sys.stdout.write(response['stdout'])
+            sys.stdout.flush()
+        if response['ok'] == False:
+            raise response['error']
+        return response['result']
+
+    def _local_driver(self):
+        if self._local is None:
+            self._local = cloud.create(self._account_name)
+        return self._local
+
+    def _call(self, name, args, kwargs):
+        if name in interactive_methods and kwargs.get('need_confirmation', True) == True:
+            return getattr(self._local_driver(), name)(*args, **kwargs)
+        return _restore(self._request({'op': 'call', 'name': name, 'args': args, 'kwargs': kwargs}))
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        if name in served_methods:
+            return lambda *args, **kwargs: self._call(name, args, kwargs)
+
+        # plain attributes (vendor, users, onpremises, ...) are fetched once from the daemon
+        if name not in self._attrs:
+            self._attrs[name] = self._request({'op': 'getattr', 'name': name})
+        kind, value = self._attrs[name]
+        if kind == 'callable':
+            return getattr(self._local_driver(), name)
+        return value
+
+def connect(account_name, path=None):
+    '''
+    connect to skywayd and return a proxy to the driver of an account,
+    or None if skywayd is not running
+    '''
+    if path is None:
+        path = socket_path()
+    if not os.path.exists(path):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(1.0)
+        sock.connect(path)
+        # provisioning requests may take minutes
+        sock.settimeout(None)
+    except OSError:
+        sock.close()
+        return None
+
+    proxy = DriverProxy(account_name, sock)
+    try:
+        proxy._request({'op': 'ping'})
+    except DaemonError:
+        sock.close()
+        return None
+    return proxy
+
+def create(account_name):
+    '''
+    get the driver for an account: served by skywayd if it is running, created in-process otherwise
+    '''
+    if 'SKYWAYD_DISABLE' not in os.environ:
+        proxy = connect(account_name)
+        if proxy is not None:
+            return proxy
+    return LockedDriver(cloud.create(account_name))
+
+class LockedDriver():
+    """
+    An in-process driver whose method calls hold Cloud.call_lock, as the requests served by skywayd do:
+    the background refreshes of the listing cache use the same SDK clients, which are not thread-safe.
+    The calls made by the driver to its own methods (e.g. from its worker threads) are not locked again.
+    """
+
+    def __init__(self, driver):
+        self._driver = driver
+
+    def __getattr__(self, name):
+        value = getattr(self._driver, name)
+        if name.startswith('_') or not callable(value):
+            return value
+
+        def call(*args, **kwargs):
+            with self._driver.call_lock:
+                return value(*args, **kwargs)
+        return call
+
+
+class _ThreadStdout():
+    """
+    sys.stdout replacement in the daemon: what a driver prints while serving a request
+    is captured per thread and sent back to the command that made the request
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def write(self, s):
+        buffer = getattr(self.local, 'buffer', None)
+        if buffer is not None:
+            return buffer.write(s)
+        return self.stream.write(s)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+def _check_peer(sock):
+    '''
+    only accept connections from processes of the same user
+    '''
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return True
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    pid, uid, gid = struct.unpack('3i', creds)
+    return uid == os.getuid()
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        if not _check_peer(self.request):
+            return
+        while True:
+            try:
+                request = _recv(self.rfile)
+            except (OSError, EOFError, pickle.PickleError):
+                return
+            if request is None:
+                return
+            response = self.server.dispatch(request)
+            # the driver call already ran: a result that cannot be pickled is reported as an error
+            # instead of dropping the connection
+            try:
+                data = pickle.dumps(response)
+            except Exception as e:
+                error = Exception(f"skywayd cannot send the result of {request.get('name', request['op'])}: {type(e).__name__}: {e}")
+                data = pickle.dumps({ 'ok': False, 'error': error, 'stdout': response.get('stdout', '') })
+            try:
+                _write(self.wfile, data)
+            except OSError:
+                return
+            if request['op'] == 'shutdown':
+                return
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    The skywayd server: one driver per account, created on the first request for that account,
+    and created again when the account or cloud configuration files change.
+    Calls to the same driver are serialized because the SDK clients are not thread-safe.
+    """
+    daemon_threads = True
+
+    def __init__(self, path=None):
+        if path is None:
+            path = socket_path()
+        self.path = path
+
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        if os.path.exists(path):
+            if connect('', path) is not None:
+                raise Exception(f'skywayd is already running on {path}.')
+            os.remove(path)
+
+        self.drivers = {}
+        self.lock = threading.Lock()
+        super().__init__(path, _Handler)
+        os.chmod(path, 0o600)
+
+        self.stdout = _ThreadStdout(sys.stdout)
+        sys.stdout = self.stdout
+
+    def _config_stamp(self, account_name):
+        etc_path = os.environ['SKYWAYROOT'] + '/etc/'
+        stamp = []
+        for cfg_file in [etc_path + 'accounts/' + account_name + '.yaml', etc_path + 'cloud.yaml']:
+            st = os.stat(cfg_file)
+            stamp.append((st.st_mtime_ns, st.st_size))
+        return stamp
+
+    def get_driver(self, account_name):
+        '''
+        return the (driver, lock) of an account, creating the driver if needed
+        '''
+        stamp = self._config_stamp(account_name)
+        with self.lock:
+            entry = self.drivers.get(account_name)
+            if entry is None or entry['stamp'] != stamp:
+                driver = cloud.create(account_name)
+                # the same lock serializes the background refreshes of the listing cache (see Cloud.call_lock)
+                entry = { 'driver': driver, 'lock': driver.call_lock, 'stamp': stamp }
+                self.drivers[account_name] = entry
+        return entry['driver'], entry['lock']
+
+    def dispatch(self, request):
+        op = request['op']
+        self.stdout.local.buffer = io.StringIO()
+        try:
+            result = None
+            if op == 'status':
+                result = sorted(self.drivers.keys())
+            elif op == 'shutdown':
+                threading.Thread(target=self.shutdown).start()
+            elif request['account'] != '':
+                driver, lock = self.get_driver(request['account'])
+                with lock:
+                    if op == 'getattr':
+                        value = getattr(driver, request['name'])
+                        result = ('callable', None) if callable(value) else ('value', value)
+                    elif op == 'call':
+                        if request['name'] not in served_methods:
+                            raise Exception(f"skywayd does not serve {request['name']}.")
+                        # the inventory of the instances is not shared between requests (see Cloud.inventory)
+                        driver.invalidate_inventory()
+                        method = getattr(driver, request['name'])
+                        result = _portable(method(*request['args'], **request['kwargs']))
+            response = { 'ok': True, 'result': result }
+        except Exception as e:
+            try:
+                pickle.dumps(e)
+            except Exception:
+                e = Exception(f"{type(e).__name__}: {e}")
+            response = { 'ok': False, 'error': e }
+        finally:
+            response['stdout'] = self.stdout.local.buffer.getvalue()
+            self.stdout.local.buffer = None
+        return response
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def serve(accounts=[], path=None):
+    '''
+    run skywayd in the foreground, creating the drivers of the given accounts up front
+    '''
+    server = Server(path)
+    for account_name in accounts:
+        server.get_driver(account_name)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+def request(op, path=None):
+    '''
+    send a control request (status, shutdown) to skywayd, return None if it is not running
+    '''
+    proxy = connect('', path)
+    if proxy is None:
+        return None
+    return proxy._request({'op': op})
@@ -0,0 +1,264 @@
+# Copyright (c) 2019-2024 The University of Chicago.
+# Part of skyway, released under the BSD 3-Clause License.
+
+# Maintainer: Trung Nguyen, Yuxing Peng
+
+"""@package docstring
+Job store: the allocations submitted without waiting (skyway alloc --no-wait, the dashboard),
+in an SQLite database of the user, ~/.skyway/jobs.db (or $SKYWAYJOBS).
+
+A submitted job is recorded as pending and handed to a background worker (python -m skyway.jobs [job id],
+detached from the terminal, logging to job-[id].log next to the database) that creates the nodes
+and advances the job through its states:
+
+  pending  the nodes are being created
+  running  the nodes are running (create_nodes returned)
+  ready    the node accepts SSH connections (the post-boot tasks are under way), or is allocated (on-premises)
+  failed   the nodes could not be created or reached, or the worker exited (see the message)
+
+The store may sit on a home directory shared by several hosts: the host of the worker is recorded
+with its pid, and only the readers on that host can tell that the worker exited.
+
+skyway status and the dashboard read the store instead of calling the vendor APIs.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+# the columns of skyway status
+columns = ['Job', 'Account', 'Name', 'Type', 'State', 'Nodes', 'Submitted', 'Updated', 'Message']
+
+schema = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    account   TEXT NOT NULL,
+    jobname   TEXT NOT NULL,
+    node_type TEXT,
+    walltime  TEXT,
+    region    TEXT,
+    spot      INTEGER NOT NULL DEFAULT 0,
+    state     TEXT NOT NULL,
+    message   TEXT,
+    nodes     TEXT,
+    pid       INTEGER,
+    host      TEXT,
+    submitted TEXT,
+    updated   TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id);
+'''
+
+# the states of the jobs still handled by a worker
+active_states = ['pending', 'running']
+
+def jobs_path():
+    if 'SKYWAYJOBS' in os.environ:
+        return os.environ['SKYWAYJOBS']
+    return os.path.join(os.path.expanduser('~'), '.skyway', 'jobs.db')
+
+def _now():
+    return datetime.now().isoformat(sep=' ', timespec='seconds')
+
+# the columns added after the first version of the store
+added_columns = {
+    'spot': 'INTEGER NOT NULL DEFAULT 0',
+    'host': 'TEXT',
+}
+
+def _pid_alive(pid, host):
+    if pid is None:
+        return False
+    # the worker runs on another host (or a host that was not recorded): cannot tell
+    if host != socket.gethostname():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class JobStore():
+    """
+    The submitted jobs of the user in an SQLite database
+    """
+
+    def __init__(self, db_file=None):
+        self.db_file = jobs_path() if db_file is None else db_file
+        os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
+
+        # the workers and the readers (skyway status, the dashboard) use the store at the same time
+        self.conn = sqlite3.connect(self.db_file, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(schema)
+
+        # the stores created before some of the columns
+        existing = [row['name'] for row in self.conn.execute('PRAGMA table_info(jobs)')]
+        for name, definition in added_columns.items():
+            if name in existing:
+                continue
+            try:
+                self.conn.execute(f'ALTER TABLE jobs ADD COLUMN {name} {definition}')
+            except sqlite3.OperationalError:
+                # added by another process in the meantime
+                pass
+
+    def close(self):
+        self.conn.close()
+
+    def log_file(self, job_id):
+        return os.path.join(os.path.dirname(self.db_file), f"job-{job_id}.log")
+
+    def add(self, account_name, jobname, node_type, walltime="", region="", spot=False):
+        '''
+        record a pending job, return its ID
+        '''
+        now = _now()
+        cursor = self.conn.execute('INSERT INTO jobs (account, jobname, node_type, walltime, region, spot, state, submitted, updated) '
+                                   'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                   (account_name, jobname, node_type, walltime, region, int(spot), 'pending', now, now))
+        return cursor.lastrowid
+
+    def update(self, job_id, state=None, message=None, nodes=None, pid=None):
+        '''
+        set the state (and the message, nodes or worker pid) of a job,
+        the worker pid is recorded with the host it runs on (this host)
+        '''
+        fields = {'updated': _now()}
+        if state is not None:
+            fields['state'] = state
+        if message is not None:
+            fields['message'] = message
+        if nodes is not None:
+            fields['nodes'] = json.dumps(nodes, default=str)
+        if pid is not None:
+            fields['pid'] = pid
+            fields['host'] = socket.gethostname()
+        assignments = ', '.join(f"{k} = ?" for k in fields)
+        self.conn.execute(f'UPDATE jobs SET {assignments} WHERE id = ?', list(fields.values()) + [job_id])
+
+    def get(self, job_id):
+        '''
+        the job with the given ID as a dictionary, None if not found
+        '''
+        jobs = self.list(job_id=job_id)
+        return jobs[0] if len(jobs) > 0 else None
+
+    def list(self, job_id=None, account_name=None, states=None, limit=None):
+        '''
+        the jobs (most recent first) as dictionaries,
+        the jobs whose worker exited without updating them are marked as failed (by a reader on the host of the worker)
+        '''
+        query = 'SELECT * FROM jobs'
+        conditions = []
+        params = []
+        if job_id is not None:
+            conditions.append('id = ?')
+            params.append(job_id)
+        if account_name is not None:
+            conditions.append('account = ?')
+            params.append(account_name)
+        if states is not None:
+            conditions.append(f"state IN ({', '.join('?' for _ in states)})")
+            params += list(states)
+        if len(conditions) > 0:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY id DESC'
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+
+        jobs = []
+        for row in self.conn.execute(query, params).fetchall():
+            job = dict(row)
+            job['nodes'] = json.loads(job['nodes']) if job['nodes'] else {}
+            if job['state'] in active_states and job['pid'] is not None and not _pid_alive(job['pid'], job['host']):
+                job['state'] = 'failed'
+                job['message'] = f"the worker exited, see {self.log_file(job['id'])}"
+                self.update(job['id'], state=job['state'], message=job['message'])
+            jobs.append(job)
+        return jobs
+
+    def wait(self, job_id, states=['ready', 'failed'], interval=5, timeout=None):
+        '''
+        wait for a job to reach one of the states (reading the store only), return the job
+        '''
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job['state'] in states:
+                return job
+            if deadline is not None and time.time() > deadline:
+                return job
+            time.sleep(interval)
+
+def submit(account_name, jobname, node_type, walltime="", region="", spot=False):
+    '''
+    record a pending job and start its worker in the background, return the job ID
+    '''
+    store = JobStore()
+    job_id = store.add(account_name, jobname, node_type, walltime, region, spot)
+    with open(store.log_file(job_id), 'w') as log:
+        worker = subprocess.Popen([sys.executable, '-m', 'skyway.jobs', str(job_id)],
+                                  stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+                                  start_new_session=True)
+    store.update(job_id, pid=worker.pid)
+    store.close()
+    return job_id
+
+def _wait_for_ssh(node_info, timeout=600, interval=10):
+    # the node accepts SSH connections once sshd is up
+    cmd = f"ssh -i {node_info['private_key']} -o StrictHostKeyChecking=accept-new -o ConnectTimeout=10 -o BatchMode=yes {node_info['login']} true"
+    deadline = time.time() + timeout
+    while True:
+        p = subprocess.run(cmd, shell=True, text=True, capture_output=True)
+        if p.returncode == 0:
+            return True
+        if time.time() + interval > deadline:
+            return False
+        time.sleep(interval)
+
+def run(job_id):
+    '''
+    the worker of a job: create the nodes, then wait for them to be ready, updating the store
+    '''
+    from .cli import InstanceDescriptor
+
+    store = JobStore()
+    job = store.get(job_id)
+    if job is None:
+        raise Exception(f"Job {job_id} is not found in {store.db_file}.")
+    store.update(job_id, pid=os.getpid())
+
+    try:
+        instanceDescriptor = InstanceDescriptor(job['jobname'], job['account'], job['node_type'], job['walltime'], job['region'] or "",
+                                                bool(job['spot']))
+        nodes = instanceDescriptor.submitJob()
+        if not nodes:
+            store.update(job_id, state='failed', message="no node was created")
+            return 1
+        store.update(job_id, state='running', nodes=nodes)
+
+        # on-premises nodes and nodes without SSH connection info are ready once running
+        node_info = None
+        if instanceDescriptor.account.onpremises == False:
+            node_info = instanceDescriptor.account.get_node_connection_info(instanceDescriptor.getNodeID())
+        if node_info is not None and _wait_for_ssh(node_info) == False:
+            store.update(job_id, state='failed', message="the node does not accept SSH connections")
+            return 1
+        store.update(job_id, state='ready', message="")
+    except Exception as e:
+        store.update(job_id, state='failed', message=f"{type(e).__name__}: {e}")
+        raise
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(run(int(sys.argv[1])))
@@ -0,0 +1,315 @@
+# Copyright (c) 2019-2024 The University of Chicago.
+# Part of skyway, released under the BSD 3-Clause License.
+
+# Maintainer: Trung Nguyen, Yuxing Peng
+
+"""@package docstring
+Usage ledger: the records of the terminated nodes (user, instance, type, start, end, cost, balance)
+of an account, stored in an SQLite database $SKYWAYROOT/etc/accounts/usage-[account].db.
+
+The database is in WAL mode: a record is appended in its own transaction, so that the users
+of an account terminating nodes at the same time do not overwrite each other's records,
+and the per-user queries use an index instead of loading the whole history.
+
+The per-user and account totals are updated by triggers as the records are appended,
+so that a balance check reads one row instead of summing the history:
+skyway ledger verify -A [account] compares the totals with the records,
+skyway ledger rebuild -A [account] recomputes them.
+
+The records of the former usage-[account].pkl files are imported when the ledger is first opened,
+or with: skyway ledger migrate -A [account]
+"""
+
+import os
+import sqlite3
+
+# the columns of the usage history, as in the former usage-[account].pkl files
+columns = ['User', 'InstanceID', 'InstanceType', 'Start', 'End', 'Cost', 'Balance']
+
+schema = '''
+CREATE TABLE IF NOT EXISTS usage (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    user          TEXT NOT NULL,
+    instance_id   TEXT,
+    instance_type TEXT,
+    start         TEXT,
+    end           TEXT,
+    cost          REAL NOT NULL DEFAULT 0,
+    balance       REAL
+);
+CREATE INDEX IF NOT EXISTS usage_user ON usage (user, id);
+CREATE INDEX IF NOT EXISTS usage_user_end ON usage (user, end);
+CREATE INDEX IF NOT EXISTS usage_instance ON usage (instance_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS user_totals (
+    user    TEXT PRIMARY KEY,
+    cost    REAL NOT NULL DEFAULT 0,
+    records INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS account_totals (
+    id      INTEGER PRIMARY KEY CHECK (id = 1),
+    cost    REAL NOT NULL DEFAULT 0,
+    records INTEGER NOT NULL DEFAULT 0
+);
+'''
+
+# the totals are updated in the same transaction as the records
+triggers = '''
+CREATE TRIGGER IF NOT EXISTS usage_insert AFTER INSERT ON usage
+BEGIN
+    INSERT INTO user_totals (user, cost, records) VALUES (NEW.user, NEW.cost, 1)
+        ON CONFLICT(user) DO UPDATE SET cost = cost + NEW.cost, records = records + 1;
+    INSERT INTO account_totals (id, cost, records) VALUES (1, NEW.cost, 1)
+        ON CONFLICT(id) DO UPDATE SET cost = cost + NEW.cost, records = records + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS usage_delete AFTER DELETE ON usage
+BEGIN
+    UPDATE user_totals SET cost = cost - OLD.cost, records = records - 1 WHERE user = OLD.user;
+    UPDATE account_totals SET cost = cost - OLD.cost, records = records - 1 WHERE id = 1;
+END;
+'''
+
+def ledger_path(account_name):
+    return os.environ['SKYWAYROOT'] + f'/etc/accounts/usage-{account_name}.db'
+
+def pickle_path(account_name):
+    return os.environ['SKYWAYROOT'] + f'/etc/accounts/usage-{account_name}.pkl'
+
+def open_ledger(account_name):
+    '''
+    open the usage ledger of an account
+    '''
+    return UsageLedger(ledger_path(account_name), pickle_path(account_name))
+
+def _to_text(value):
+    # timestamps are stored in ISO format, the other values (e.g. "00:00:00" or squeue start times) as given
+    if value is None:
+        return None
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+class UsageLedger():
+    """
+    The usage records of an account in an SQLite database
+    """
+
+    def __init__(self, db_file, pkl_file=None):
+        '''
+        open (or create) the ledger, importing the records of pkl_file if no pickle was imported before
+        '''
+        self.db_file = db_file
+
+        # the drivers served by skywayd are called from several threads (one at a time)
+        self.conn = sqlite3.connect(db_file, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(schema + triggers)
+
+        # ledgers created before the totals were introduced: compute the totals once
+        if self.conn.execute("SELECT 1 FROM meta WHERE key = 'totals'").fetchone() is None:
+            with self.transaction():
+                self._compute_totals()
+                self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('totals', '1')")
+
+        if pkl_file is not None and os.path.isfile(pkl_file):
+            count = self.import_pickle(pkl_file, first=True)
+            if count > 0:
+                print(f"Imported {count} usage records from {pkl_file} into {db_file}")
+
+    def close(self):
+        self.conn.close()
+
+    def append(self, user, instance_id, instance_type, start, end, cost, balance=None):
+        '''
+        append the record of a terminated node, in its own transaction
+        '''
+        with self.transaction():
+            self.conn.execute('INSERT INTO usage (user, instance_id, instance_type, start, end, cost, balance) '
+                              'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                              (user, _to_text(instance_id), _to_text(instance_type), _to_text(start), _to_text(end),
+                               float(cost), None if balance is None else float(balance)))
+
+    def has_instance(self, instance_id):
+        '''
+        whether a record of the instance is in the ledger
+        '''
+        row = self.conn.execute('SELECT 1 FROM usage WHERE instance_id = ? LIMIT 1', (_to_text(instance_id),)).fetchone()
+        return row is not None
+
+    def transaction(self):
+        return _Transaction(self.conn)
+
+    def get_meta(self, key, default=None):
+        row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return default if row is None else row[0]
+
+    def set_meta(self, key, value):
+        with self.transaction():
+            self.conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def records_after(self, last_id, limit):
+        '''
+        at most limit records with an id greater than last_id, in the order they were appended
+        (id, user, instance_id, instance_type, start, end, cost, balance)
+        '''
+        return self.conn.execute('SELECT id, user, instance_id, instance_type, start, end, cost, balance FROM usage '
+                                 'WHERE id > ? ORDER BY id LIMIT ?', (last_id, limit)).fetchall()
+
+    def user_cost(self, user):
+        '''
+        the accumulating cost of a user (one row of the totals)
+        '''
+        row = self.conn.execute('SELECT cost FROM user_totals WHERE user = ?', (user,)).fetchone()
+        return 0.0 if row is None else row[0]
+
+    def account_cost(self):
+        '''
+        the accumulating cost of all the users of the account
+        '''
+        row = self.conn.execute('SELECT cost FROM account_totals WHERE id = 1').fetchone()
+        return 0.0 if row is None else row[0]
+
+    def _compute_totals(self):
+        self.conn.execute('DELETE FROM user_totals')
+        self.conn.execute('DELETE FROM account_totals')
+        self.conn.execute('INSERT INTO user_totals (user, cost, records) '
+                          'SELECT user, SUM(cost), COUNT(*) FROM usage GROUP BY user')
+        self.conn.execute('INSERT INTO account_totals (id, cost, records) '
+                          'SELECT 1, COALESCE(SUM(cost), 0), COUNT(*) FROM usage')
+
+    def rebuild_totals(self):
+        '''
+        recompute the per-user and account totals from the records
+        '''
+        with self.transaction():
+            self._compute_totals()
+
+    def verify_totals(self, tolerance=1e-6):
+        '''
+        compare the totals with the records, return the list of
+        [user, cost, cost from the records, records, number of records] that differ
+        (user is None for the account totals)
+        '''
+        # in one transaction: the totals and the records are read from the same snapshot
+        with self.transaction():
+            stored = {}
+            for user, cost, records in self.conn.execute('SELECT user, cost, records FROM user_totals'):
+                stored[user] = (cost, records)
+            stored[None] = self.conn.execute('SELECT cost, records FROM account_totals WHERE id = 1').fetchone() or (0.0, 0)
+
+            actual = {}
+            for user, cost, records in self.conn.execute('SELECT user, SUM(cost), COUNT(*) FROM usage GROUP BY user'):
+                actual[user] = (cost, records)
+            actual[None] = self.conn.execute('SELECT COALESCE(SUM(cost), 0), COUNT(*) FROM usage').fetchone()
+
+        mismatches = []
+        for user in set(stored) | set(actual):
+            cost, records = stored.get(user, (0.0, 0))
+            actual_cost, actual_records = actual.get(user, (0.0, 0))
+            if abs(cost - actual_cost) > tolerance or records != actual_records:
+                mismatches.append([user, cost, actual_cost, records, actual_records])
+        return mismatches
+
+    def history(self, user):
+        '''
+        the records of a user (most recent first) as a pandas DataFrame
+        '''
+        import pandas as pd
+        rows = self.conn.execute('SELECT user, instance_id, instance_type, start, end FROM usage '
+                                 'WHERE user = ? ORDER BY id DESC', (user,)).fetchall()
+        return pd.DataFrame(rows, columns=columns[:5])
+
+    def query(self, user, since=None, until=None, instance_type=None, limit=None, offset=0, batch_size=500):
+        '''
+        yield the records of a user (most recent first) as tuples (user, instance_id, instance_type, start, end, cost),
+        fetched batch_size at a time;
+        since and until (e.g. 2024-06 or 2024-06-15) select the records by the time the node was terminated
+        '''
+        sql = 'SELECT user, instance_id, instance_type, start, end, cost FROM usage WHERE user = ?'
+        params = [user]
+        if since is not None:
+            sql += ' AND end >= ?'
+            params.append(since)
+        if until is not None:
+            # the ISO timestamps starting with until sort before until + '~'
+            sql += ' AND end < ?'
+            params.append(until + '~')
+        if instance_type is not None:
+            sql += ' AND instance_type = ?'
+            params.append(instance_type)
+        sql += ' ORDER BY id DESC'
+        if limit is not None or offset > 0:
+            sql += ' LIMIT ? OFFSET ?'
+            params += [limit if limit is not None else -1, offset]
+
+        cursor = self.conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if len(rows) == 0:
+                break
+            for row in rows:
+                yield row
+
+    def import_pickle(self, pkl_file, first=False):
+        '''
+        import the records of a usage-[account].pkl file, return the number of records imported;
+        a file is only imported once (unless it is modified afterwards),
+        with first=True only if no pickle was imported into the ledger before
+        '''
+        import pandas as pd
+        st = os.stat(pkl_file)
+        stamp = f"{os.path.abspath(pkl_file)}:{st.st_mtime_ns}:{st.st_size}"
+
+        # already imported: no need to take the write lock
+        if first and self.get_meta('imported') is not None:
+            return 0
+
+        count = 0
+        # the check, the records and the stamp in one transaction:
+        # processes opening a new ledger at the same time import the records once
+        with self.transaction():
+            imported = self.conn.execute("SELECT value FROM meta WHERE key = 'imported'").fetchone()
+            if imported is not None and (first or imported[0] == stamp):
+                return 0
+
+            df = pd.read_pickle(pkl_file)
+            # the SLURM records have JobID instead of InstanceID
+            df = df.rename(columns={'JobID': 'InstanceID'})
+
+            # the records were prepended to the pickle: import the oldest first
+            for i in reversed(range(len(df))):
+                record = df.iloc[i]
+                # skip the placeholder rows written when the pickle was created
+                if str(record['InstanceID']) == '--':
+                    continue
+                balance = record['Balance'] if 'Balance' in df.columns else None
+                self.conn.execute('INSERT INTO usage (user, instance_id, instance_type, start, end, cost, balance) '
+                                  'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                  (str(record['User']), _to_text(record['InstanceID']), _to_text(record['InstanceType']),
+                                   _to_text(record['Start']), _to_text(record['End']),
+                                   float(record['Cost']), None if balance is None else float(balance)))
+                count += 1
+            self.conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', ('imported', stamp))
+        return count
+
+class _Transaction():
+    """
+    BEGIN IMMEDIATE ... COMMIT (ROLLBACK on error): the write lock is taken at the start of the transaction
+    """
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.conn.execute('COMMIT')
+        else:
+            self.conn.execute('ROLLBACK')
+        return False
@@ -3,17 +3,105 @@
 
 # Maintainer: Yuxing Peng, Trung Nguyen
 
+import hashlib
 import os
+import pickle
+import tempfile
 import yaml
 from subprocess import PIPE, Popen
 
+# use the C (libyaml) loader when PyYAML is built with it
+yaml_loader = getattr(yaml, 'CFullLoader', yaml.FullLoader)
+
+# parsed configuration files are stored as binary snapshots under ~/.skyway/cache (or $SKYWAYCACHE),
+# keyed by the modification times and sizes of the .yaml files, so that repeated commands skip YAML parsing
+def config_cache_path():
+    if 'SKYWAYCACHE' in os.environ:
+        return os.environ['SKYWAYCACHE']
+    return os.path.join(os.path.expanduser('~'), '.skyway', 'cache')
+
+def _file_stamp(cfg_files):
+    stamp = []
+    for cfg_file in cfg_files:
+        st = os.stat(cfg_file)
+        stamp.append((os.path.abspath(cfg_file), st.st_mtime_ns, st.st_size))
+    return stamp
+
+def _load_snapshot(key, stamp):
+    snapshot_file = os.path.join(config_cache_path(), 'config-' + hashlib.sha1(key.encode()).hexdigest() + '.pkl')
+    try:
+        with open(snapshot_file, 'rb') as f:
+            snapshot = pickle.load(f)
+        if snapshot['stamp'] == stamp:
+            return snapshot['data']
+    except Exception:
+        pass
+    return None
+
+def _save_snapshot(key, stamp, data):
+    # the snapshots contain credentials: the cache folder and files are only accessible by the user
+    try:
+        cache_path = config_cache_path()
+        os.makedirs(cache_path, mode=0o700, exist_ok=True)
+        snapshot_file = os.path.join(cache_path, 'config-' + hashlib.sha1(key.encode()).hexdigest() + '.pkl')
+        fd, tmp_file = tempfile.mkstemp(dir=cache_path)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump({ 'stamp': stamp, 'data': data }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, snapshot_file)
+    except OSError:
+        # the cache is optional (e.g. read-only home folder)
+        pass
+
+def parse_yaml(cfg_file):
+    with open(cfg_file, 'r') as f:
+        return yaml.load(f.read(), Loader=yaml_loader)
+
 def load_config(cfg_name, cfg_path):
     cfg_file = cfg_path + cfg_name + '.yaml'
     if not os.path.isfile(cfg_file):
         raise Exception(f'Configuration file {cfg_file} cannot be found.')
 
-    with open(cfg_file, 'r') as f:
-        return yaml.load(f.read(), Loader=yaml.FullLoader)
+    stamp = _file_stamp([cfg_file])
+    cfg = _load_snapshot(cfg_file, stamp)
+    if cfg is None:
+        cfg = parse_yaml(cfg_file)
+        _save_snapshot(cfg_file, stamp, cfg)
+    return cfg
+
+def load_account_config(account_name):
+    '''
+    load $SKYWAYROOT/etc/accounts/[account_name].yaml and the section of its vendor in $SKYWAYROOT/etc/cloud.yaml,
+    return (account_cfg, vendor_cfg) from one validated snapshot
+    '''
+    etc_path = os.environ['SKYWAYROOT'] + '/etc/'
+    account_file = etc_path + 'accounts/' + account_name + '.yaml'
+    cloud_file = etc_path + 'cloud.yaml'
+    for cfg_file in [account_file, cloud_file]:
+        if not os.path.isfile(cfg_file):
+            raise Exception(f'Configuration file {cfg_file} cannot be found.')
+
+    key = account_file + ':' + cloud_file
+    stamp = _file_stamp([account_file, cloud_file])
+    snapshot = _load_snapshot(key, stamp)
+    if snapshot is not None:
+        return snapshot
+
+    account_cfg = parse_yaml(account_file)
+    vendor_cfg = parse_yaml(cloud_file)
+
+    # validate before storing the snapshot
+    for entry in ['cloud', 'account', 'users']:
+        if entry not in account_cfg:
+            raise Exception(f'Entry {entry} is missing in {account_file}.')
+    vendor = account_cfg['cloud']
+    if vendor not in vendor_cfg:
+        raise Exception(f'Cloud vendor {vendor} is undefined.')
+    if 'node-types' not in vendor_cfg[vendor]:
+        raise Exception(f'Entry node-types is missing for {vendor} in {cloud_file}.')
+
+    snapshot = (account_cfg, vendor_cfg[vendor])
+    _save_snapshot(key, stamp, snapshot)
+    return snapshot
 
 # execute a command, return output as a list of rows, each row is converted to a list of words
 def proc(command, strict=True):
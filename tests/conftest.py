@@ -0,0 +1,37 @@
+# Copyright (c) 2019-2024 The University of Chicago.
+# Part of skyway, released under the BSD 3-Clause License.
+
+# the tests do not need the cloud SDKs: skyway is imported with a minimal $SKYWAYROOT,
+# and each test gets its own folders (see the skyway_root fixture)
+
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# skyway reads $SKYWAYROOT/etc/skyway.yaml when imported
+_root = tempfile.mkdtemp(prefix='skyway-tests-')
+atexit.register(shutil.rmtree, _root, ignore_errors=True)
+os.makedirs(os.path.join(_root, 'etc', 'accounts'))
+with open(os.path.join(_root, 'etc', 'skyway.yaml'), 'w') as f:
+    f.write("paths:\n  etc: <ROOT>/etc\n  var: <ROOT>/var\n  run: <ROOT>/run\n")
+os.environ['SKYWAYROOT'] = _root
+os.environ['SKYWAYCACHE'] = os.path.join(_root, 'cache')
+os.environ['SKYWAYD_DISABLE'] = '1'
+
+@pytest.fixture
+def skyway_root(tmp_path, monkeypatch):
+    '''
+    a $SKYWAYROOT of its own for a test (etc/accounts, var and run)
+    '''
+    import skyway
+    os.makedirs(tmp_path / 'etc' / 'accounts')
+    monkeypatch.setenv('SKYWAYROOT', str(tmp_path))
+    for name in ['etc', 'var', 'run']:
+        monkeypatch.setitem(skyway.cfg['paths'], name, str(tmp_path / name))
+    return tmp_path
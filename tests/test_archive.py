@@ -0,0 +1,97 @@
+# Copyright (c) 2019-2024 The University of Chicago.
+# Part of skyway, released under the BSD 3-Clause License.
+
+import os
+
+import pytest
+
+pytest.importorskip('pyarrow')
+
+from skyway import archive, ledger
+
+def _append(records):
+    usage_ledger = ledger.open_ledger('test')
+    for user, instance_id, end, cost in records:
+        usage_ledger.append(user, instance_id, 't2.micro', '2024-01-01T00:00:00', end, cost)
+    usage_ledger.close()
+
+def _files(root):
+    return sorted(os.path.relpath(os.path.join(path, f), root)
+                  for path, _, files in os.walk(root) for f in files)
+
+def test_export_partitions_by_month(skyway_root):
+    _append([('user1', 'i-1', '2024-05-31T23:00:00', 1.0),
+             ('user1', 'i-2', '2024-06-01T01:00:00', 2.0),
+             ('user2', 'i-3', '2024-06-15T12:00:00', 3.0)])
+
+    assert archive.export_account('test') == 3
+    assert _files(archive.archive_path()) == [
+        os.path.join('account=test', 'year=2024', 'month=5', 'part-1-1.parquet'),
+        os.path.join('account=test', 'year=2024', 'month=6', 'part-2-3.parquet'),
+    ]
+
+def test_export_end_not_a_date(skyway_root, capsys):
+    _append([('user1', 'i-1', '2024-06-01T01:00:00', 1.0),
+             ('user2', 'i-2', '00:00:00', 0.5),
+             ('user2', 'i-3', None, 0.25)])
+
+    # reported, not written to a partition that no report reads
+    assert archive.export_account('test') == 1
+    out = capsys.readouterr().out
+    assert "2 usage records not archived" in out
+    assert "record 2: user user2, instance i-2, end 00:00:00" in out
+    assert _files(archive.archive_path()) == [os.path.join('account=test', 'year=2024', 'month=6', 'part-1-1.parquet')]
+
+    # and not reported again
+    assert archive.export_account('test') == 0
+    assert capsys.readouterr().out == ""
+
+def test_export_again(skyway_root):
+    _append([('user1', 'i-1', '2024-06-01T01:00:00', 1.0)])
+    assert archive.export_account('test') == 1
+    files = _files(archive.archive_path())
+
+    # nothing new: no file is written
+    assert archive.export_account('test') == 0
+    assert _files(archive.archive_path()) == files
+
+    # only the records appended since the watermark are written, in a new file
+    _append([('user1', 'i-2', '2024-06-02T01:00:00', 2.0)])
+    assert archive.export_account('test') == 1
+    assert _files(archive.archive_path()) == sorted(files + [os.path.join('account=test', 'year=2024', 'month=6', 'part-2-2.parquet')])
+
+    usage_ledger = ledger.open_ledger('test')
+    assert usage_ledger.get_meta('archived') == '2'
+    usage_ledger.close()
+
+    data, headers = archive.report()
+    assert headers == ['account', 'user', 'Cost', 'Nodes']
+    assert data == [['test', 'user1', pytest.approx(3.0), 2]]
+
+def test_export_in_batches(skyway_root):
+    _append([('user1', f'i-{i}', f'2024-06-{i:02d}T00:00:00', 1.0) for i in range(1, 6)])
+    assert archive.export_account('test', batch_size=2) == 5
+    assert len(_files(archive.archive_path())) == 3
+
+    data, _ = archive.report(by='month')
+    assert data == [['test', 2024, 6, pytest.approx(5.0), 5]]
+
+def test_report(skyway_root):
+    _append([('user1', 'i-1', '2024-04-10T00:00:00', 1.0),
+             ('user1', 'i-2', '2024-05-10T00:00:00', 2.0),
+             ('user2', 'i-3', '2024-06-10T00:00:00', 4.0),
+             ('user1', 'i-4', '2024-07-10T00:00:00', 8.0)])
+    archive.export_account('test')
+
+    data, _ = archive.report(since='2024-05', until='2024-06')
+    assert data == [['test', 'user1', pytest.approx(2.0), 1], ['test', 'user2', pytest.approx(4.0), 1]]
+
+    data, _ = archive.report(users=['user1'], by='month')
+    assert [row[2] for row in data] == [4, 5, 7]
+
+    assert archive.report(accounts=['other']) == ([], ['account', 'user', 'Cost', 'Nodes'])
+
+def test_export_without_ledger(skyway_root):
+    assert archive.export_account('missing') == 0
+    with pytest.raises(Exception):
+        archive.report()
@@ -0,0 +1,123 @@
+# Copyright (c) 2019-2024 The University of Chicago.
+# Part of skyway, released under the BSD 3-Clause License.
+
+import os
+import threading
+import time
+
+import pytest
+
+from skyway import cache
+
+class Counter():
+    '''
+    a compute function returning the number of times it was called
+    '''
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.calls
+
+@pytest.fixture
+def file_cache(skyway_root):
+    return cache.FileCache(os.path.join(cache.run_path(), 'test'), ttl=30, stale=120)
+
+def _set_age(file_cache, age):
+    entry = file_cache._read()
+    entry['time'] = time.time() - age
+    file_cache._write(entry)
+
+def test_fresh_value(file_cache):
+    compute = Counter()
+    assert file_cache.get(compute) == (1, 0.0)
+    value, age = file_cache.get(compute)
+    assert value == 1 and age < file_cache.ttl
+    assert compute.calls == 1
+
+def test_stale_value_refreshed_in_background(file_cache):
+    compute = Counter()
+    file_cache.get(compute)
+    _set_age(file_cache, file_cache.ttl + 10)
+
+    refreshed = threading.Event()
+    def slow_compute():
+        value = compute()
+        refreshed.set()
+        return value
+
+    # the stale value is returned right away
+    value, age = file_cache.get(slow_compute)
+    assert value == 1 and age >= file_cache.ttl
+
+    assert refreshed.wait(10)
+    for _ in range(100):
+        entry = file_cache._read()
+        if entry['value'] == 2:
+            break
+        time.sleep(0.05)
+    assert file_cache.get(compute)[0] == 2
+    assert compute.calls == 2
+
+def test_expired_value(file_cache):
+    compute = Counter()
+    file_cache.get(compute)
+    _set_age(file_cache, file_cache.ttl + file_cache.stale + 10)
+    assert file_cache.get(compute) == (2, 0.0)
+
+def test_invalidate(file_cache):
+    compute = Counter()
+    file_cache.get(compute)
+    file_cache.invalidate()
+    assert file_cache.get(compute) == (2, 0.0)
+    assert file_cache.get(compute)[0] == 2
+
+def test_invalidated_while_computing(file_cache):
+    # the value computed before an invalidation is returned, but not stored
+    def compute():
+        file_cache.invalidate()
+        return 'old'
+    assert file_cache.get(compute) == ('old', 0.0)
+    assert file_cache.get(Counter()) == (1, 0.0)
+
+def test_metadata_cache_not_stale(skyway_root):
+    metadata_cache = cache.metadata_cache('test')
+    assert metadata_cache.stale == 0
+    assert os.path.dirname(metadata_cache.path) == cache.var_path()
+
+def test_untrusted_file_ignored(file_cache):
+    compute = Counter()
+    file_cache.get(compute)
+    os.chmod(file_cache.path, 0o666)
+    assert file_cache._read() is None
+    assert file_cache.get(compute) == (2, 0.0)
+    # written again by this user, not writable by the others
+    assert os.stat(file_cache.path).st_mode & 0o777 == 0o644
+
+def test_unpicklable_value(file_cache):
+    lock = threading.Lock()
+    assert file_cache.get(lambda: lock) == (lock, 0.0)
+    assert not os.path.exists(file_cache.path)
+
+def test_background_refresh_holds_the_lock(file_cache):
+    compute = Counter()
+    file_cache.get(compute)
+    _set_age(file_cache, file_cache.ttl + 10)
+
+    # e.g. the call lock of a driver, held by a call of the command
+    lock = threading.RLock()
+    with lock:
+        assert file_cache.get(compute, lock=lock)[0] == 1
+        time.sleep(0.2)
+        assert compute.calls == 1
+        # the lock file is not taken by the waiting refresh
+        fd = file_cache._lock(blocking=False)
+        assert fd is not None
+        file_cache._unlock(fd)
+
+    for _ in range(100):
+        if compute.calls == 2:
+            break
+        time.sleep(0.05)
+    assert compute.calls == 2
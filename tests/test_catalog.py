@@ -0,0 +1,46 @@
+# Copyright (c) 2019-2024 The University of Chicago.
+# Part of skyway, released under the BSD 3-Clause License.
+
+from skyway.cloud.catalog import NodeTypeCatalog
+
+node_types = {
+    't1': { 'name': 't2.micro', 'price': 0.0116, 'cores': 1, 'memgb': 1 },
+    # shares the instance type of t1
+    't1-large-disk': { 'name': 't2.micro', 'price': 0.02, 'cores': 1, 'memgb': 1 },
+    'g1': { 'name': 'p3.2xlarge', 'price': '3.06', 'cores': 8, 'memgb': 61, 'gpu': 1, 'gpu-type': 'V100', 'spot-price': 0.92 },
+    # no name: the node type is the instance type
+    'n1-standard-1': { 'price': 0.0475 },
+}
+
+def test_lookup():
+    catalog = NodeTypeCatalog(node_types)
+    assert len(catalog) == 4
+
+    info = catalog.lookup('p3.2xlarge')
+    assert info.node_type == 'g1' and info.cores == 8 and info.gpu == 1 and info.gpu_type == 'V100'
+    # the first node type of an instance type gives the price
+    assert catalog.lookup('t2.micro').node_type == 't1'
+    assert catalog.lookup('n1-standard-1').price == 0.0475
+    assert catalog.lookup('m5.large') is None
+
+def test_prices():
+    catalog = NodeTypeCatalog(node_types)
+    assert catalog.price_of('t2.micro') == 0.0116
+    assert catalog.price('t1-large-disk') == 0.02
+    assert catalog.price('g1') == 3.06
+    assert catalog.price_of('m5.large') == -1.0
+    assert catalog.price('x1') == -1.0
+
+def test_spot_prices():
+    catalog = NodeTypeCatalog(node_types)
+    assert catalog.spot_price('g1') == 0.92
+    assert catalog.spot_price_of('p3.2xlarge') == 0.92
+    # the on-demand price if not given
+    assert catalog.spot_price('t1') == 0.0116
+    assert catalog.spot_price('x1') == -1.0
+    assert catalog.spot_price_of('m5.large') == -1.0
+
+def test_empty():
+    catalog = NodeTypeCatalog(None)
+    assert len(catalog) == 0
+    assert catalog.price_of('t2.micro') == -1.0
@@ -0,0 +1,90 @@
+# Copyright (c) 2019-2024 The University of Chicago.
+# Part of skyway, released under the BSD 3-Clause License.
+
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from skyway import cli
+
+class FakeDriver():
+    '''
+    a driver listing one node, failing for the accounts named error*, hanging for the accounts named hang*
+    '''
+    lock = threading.Lock()
+    active = 0
+    peak = 0
+
+    def __init__(self, account_name, release):
+        self.account_name = account_name
+        self.release = release
+
+    def list_nodes_cached(self):
+        with FakeDriver.lock:
+            FakeDriver.active += 1
+            FakeDriver.peak = max(FakeDriver.peak, FakeDriver.active)
+        try:
+            if self.account_name.startswith('hang'):
+                self.release.wait(30)
+            elif self.account_name.startswith('error'):
+                raise ValueError("no credentials")
+            else:
+                time.sleep(0.05)
+            return [['node1', 'user1', 'running', 't1', 'i-1', '10.0.0.1', '0:10:00', 0.01]]
+        finally:
+            with FakeDriver.lock:
+                FakeDriver.active -= 1
+
+@pytest.fixture
+def accounts(monkeypatch):
+    release = threading.Event()
+    FakeDriver.active = FakeDriver.peak = 0
+    def set_accounts(account_names):
+        monkeypatch.setattr(cli.account, 'accounts', lambda: account_names)
+        monkeypatch.setattr(cli.daemon, 'create', lambda account_name: FakeDriver(account_name, release))
+    yield set_accounts
+    # let the hung threads return
+    release.set()
+
+def _list_all(jobs, timeout, format='table'):
+    return cli.list_all_accounts(SimpleNamespace(jobs=jobs, timeout=timeout, format=format))
+
+def test_list_all(accounts, capsys):
+    accounts(['a1', 'a2', 'error1', 'a3'])
+    assert _list_all(jobs=2, timeout=10, format='jsonl') == 1
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [line['Account'] for line in lines] == ['a1', 'a2', 'error1', 'a3']
+    assert lines[0]['Name'] == 'node1'
+    assert lines[2]['Error'] == "ValueError: no credentials"
+    assert FakeDriver.peak <= 2
+
+def test_timed_out_accounts_count_against_jobs(accounts, capsys):
+    accounts(['a1', 'hang1', 'a2', 'hang2', 'a3', 'a4'])
+    start = time.time()
+    assert _list_all(jobs=3, timeout=0.5) == 1
+    assert time.time() - start < 5
+    out = capsys.readouterr().out
+    assert out.count("timed out after 0.5 seconds") == 2
+    # the hung accounts keep their thread: never more than 3 accounts at a time
+    assert FakeDriver.peak <= 3
+    for account_name in ['a1', 'a2', 'a3', 'a4']:
+        assert f"{account_name}  " in out
+
+def test_all_threads_hung(accounts, capsys):
+    accounts(['hang1', 'hang2', 'a1'])
+    start = time.time()
+    assert _list_all(jobs=2, timeout=0.5) == 1
+    assert time.time() - start < 5
+    out = capsys.readouterr().out
+    assert "not listed, 2 accounts did not respond" in out
+
+def test_check_region(skyway_root):
+    (skyway_root / 'etc' / 'accounts' / 'rcc-aws.yaml').write_text("cloud: aws\n")
+    (skyway_root / 'etc' / 'accounts' / 'rcc-gcp.yaml').write_text("cloud: gcp\n")
+    cli.check_region('rcc-aws', 'us-west-2')
+    cli.check_region('rcc-gcp', "")
+    with pytest.raises(Exception, match="Account rcc-gcp \\(gcp\\) does not support --region"):
+        cli.check_region('rcc-gcp', 'us-west1')
@@ -0,0 +1,88 @@
+# Copyright (c) 2019-2024 The University of Chicago.
+# Part of skyway, released under the BSD 3-Clause License.
+
+import threading
+import time
+
+import pytest
+
+from skyway.cloud.core import Cloud
+
+def _driver(create_workers=16, node_types=None):
+    return Cloud({ 'create-workers': create_workers, 'node-types': node_types or {} }, {})
+
+def _wait(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def test_first_launch_wins():
+    delays = { 'us-east-1a': 0.3, 'us-east-1b': 0.05, 'us-east-1c': 0.2 }
+    cancelled = []
+    def launch(zone):
+        time.sleep(delays[zone])
+        return f"node in {zone}"
+
+    winner = _driver().race_launches(launch, list(delays), lambda zone, node: cancelled.append((zone, node)))
+    assert winner == ('us-east-1b', "node in us-east-1b")
+
+    # the launches that succeed later are cancelled
+    assert _wait(lambda: len(cancelled) == 2)
+    assert sorted(cancelled) == [('us-east-1a', "node in us-east-1a"), ('us-east-1c', "node in us-east-1c")]
+
+def test_failed_launches_skipped():
+    def launch(zone):
+        if zone != 'us-east-1c':
+            raise Exception("InsufficientInstanceCapacity")
+        time.sleep(0.05)
+        return "node"
+    cancelled = []
+    assert _driver().race_launches(launch, ['us-east-1a', 'us-east-1b', 'us-east-1c'],
+                                   lambda zone, node: cancelled.append(zone)) == ('us-east-1c', "node")
+    time.sleep(0.1)
+    assert cancelled == []
+
+def test_all_launches_fail():
+    def launch(zone):
+        raise Exception(f"no capacity in {zone}")
+    with pytest.raises(Exception) as e:
+        _driver().race_launches(launch, ['us-east-1a', 'us-east-1b'], lambda zone, node: None)
+    assert "All the launches failed" in str(e.value)
+    assert "us-east-1a: no capacity in us-east-1a" in str(e.value)
+    assert "us-east-1b: no capacity in us-east-1b" in str(e.value)
+
+def test_launches_not_started_are_dropped():
+    launched = []
+    lock = threading.Lock()
+    def launch(zone):
+        with lock:
+            launched.append(zone)
+        time.sleep(0.05)
+        return "node"
+
+    # one launch at a time: the first one succeeds, the others never start
+    assert _driver(create_workers=1).race_launches(launch, ['a', 'b', 'c'], lambda zone, node: None) == ('a', "node")
+    time.sleep(0.2)
+    assert launched == ['a']
+
+def test_cancel_errors_reported(capsys):
+    def launch(zone):
+        time.sleep(0.05 if zone == 'a' else 0.2)
+        return "node"
+    def cancel(zone, node):
+        raise Exception("cannot terminate")
+    assert _driver().race_launches(launch, ['a', 'b'], cancel) == ('a', "node")
+    out = []
+    assert _wait(lambda: out.append(capsys.readouterr().out) or "Cannot cancel the launch in b: cannot terminate" in ''.join(out))
+
+def test_get_fallback():
+    driver = _driver(node_types={
+        'g1': { 'name': 'p3.2xlarge', 'fallback': { 'zones': ['us-east-1a'], 'node-types': ['g2'] } },
+        'g2': { 'name': 'g5.2xlarge', 'fallback': { 'node-types': ['g9'] } },
+        'c1': { 'name': 'c5.large' },
+    })
+    assert driver.get_fallback('g1') == { 'zones': ['us-east-1a'], 'node-types': ['g2'] }
+    assert driver.get_fallback('c1') == {}
+    with pytest.raises(ValueError, match="g9"):
+        driver.get_fallback('g2')
@@ -0,0 +1,125 @@
+# Copyright (c) 2019-2024 The University of Chicago.
+# Part of skyway, released under the BSD 3-Clause License.
+
+import io
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+from skyway import daemon
+
+class FakeDriver():
+    '''
+    a driver recording where (daemon or command process) its methods are called
+    '''
+    created = []
+
+    def __init__(self, account_name, where):
+        self.account_name = account_name
+        self.where = where
+        self.vendor = 'fake'
+        self.call_lock = threading.Lock()
+        FakeDriver.created.append(self)
+
+    def invalidate_inventory(self):
+        pass
+
+    def list_nodes(self):
+        print(f"listing {self.account_name}")
+        return io.StringIO(f"nodes of {self.account_name} in {self.where}")
+
+    def destroy_nodes(self, node_names=None, IDs=None, need_confirmation=True):
+        return self.where
+
+    def get_budget(self):
+        raise ValueError("no budget")
+
+    def get_running_nodes(self):
+        # cannot be pickled
+        return threading.Lock()
+
+@pytest.fixture
+def server(skyway_root, monkeypatch):
+    for cfg_file in ['accounts/test.yaml', 'cloud.yaml']:
+        (skyway_root / 'etc' / cfg_file).write_text("")
+
+    FakeDriver.created = []
+    # the drivers created in the daemon thread, and in the command process for the interactive calls
+    monkeypatch.setattr(daemon.cloud, 'create',
+                        lambda account_name: FakeDriver(account_name, 'daemon' if threading.current_thread().name != 'MainThread' else 'command'))
+
+    stdout = sys.stdout
+    server = daemon.Server(str(skyway_root / 'run' / 'skywayd.sock'))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    sys.stdout = stdout
+
+def test_served_calls(server, capsys):
+    proxy = daemon.connect('test', server.path)
+    assert proxy is not None
+
+    listing = proxy.list_nodes()
+    # StringIO results are sent as text and restored
+    assert isinstance(listing, io.StringIO)
+    assert listing.getvalue() == "nodes of test in daemon"
+    # what the driver printed is replayed by the command
+    assert "listing test" in capsys.readouterr().out
+
+    # plain attributes are read from the driver in the daemon
+    assert proxy.vendor == 'fake'
+    assert daemon.request('status', server.path) == ['test']
+
+def test_interactive_calls(server):
+    proxy = daemon.connect('test', server.path)
+    assert proxy.destroy_nodes(IDs=['i-1'], need_confirmation=False) == 'daemon'
+    # the confirmation prompt needs the terminal of the command
+    assert proxy.destroy_nodes(IDs=['i-1']) == 'command'
+
+def test_errors(server):
+    proxy = daemon.connect('test', server.path)
+    with pytest.raises(ValueError, match="no budget"):
+        proxy.get_budget()
+    with pytest.raises(Exception, match="cannot send the result of get_running_nodes"):
+        proxy.get_running_nodes()
+    # the connection is still usable
+    assert proxy.list_nodes().getvalue() == "nodes of test in daemon"
+
+def test_driver_created_again_when_config_changes(server, skyway_root):
+    proxy = daemon.connect('test', server.path)
+    proxy.list_nodes()
+    proxy.list_nodes()
+    assert len(FakeDriver.created) == 1
+
+    account_file = skyway_root / 'etc' / 'accounts' / 'test.yaml'
+    account_file.write_text("changed: true\n")
+    os.utime(account_file, ns=(time.time_ns() + 10**9, time.time_ns() + 10**9))
+    proxy.list_nodes()
+    assert len(FakeDriver.created) == 2
+
+def test_not_running(skyway_root):
+    assert daemon.connect('test', str(skyway_root / 'run' / 'skywayd.sock')) is None
+    assert daemon.request('status', str(skyway_root / 'run' / 'skywayd.sock')) is None
+
+def test_in_process_calls_locked(skyway_root, monkeypatch):
+    monkeypatch.setattr(daemon.cloud, 'create', lambda account_name: FakeDriver(account_name, 'command'))
+    driver = daemon.create('test')
+    assert isinstance(driver, daemon.LockedDriver)
+    assert driver.vendor == 'fake'
+
+    # a call waits while another thread (e.g. a background refresh of the listing) holds the call lock
+    fake = FakeDriver.created[-1]
+    results = []
+    fake.call_lock.acquire()
+    thread = threading.Thread(target=lambda: results.append(driver.list_nodes().getvalue()))
+    thread.start()
+    time.sleep(0.2)
+    assert results == []
+    fake.call_lock.release()
+    thread.join(5)
+    assert results == ["nodes of test in command"]
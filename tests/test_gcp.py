@@ -0,0 +1,35 @@
+# Copyright (c) 2019-2024 The University of Chicago.
+# Part of skyway, released under the BSD 3-Clause License.
+
+from types import SimpleNamespace
+
+from skyway.cloud.gcp import GCP
+
+def _node(name, user_name, status, preemptible):
+    return SimpleNamespace(name=name, extra={ 'name': name, 'labels': { 'user': user_name }, 'status': status,
+                                              'scheduling': { 'preemptible': preemptible } })
+
+nodes = [
+    _node('node1', 'user1', 'RUNNING', True),
+    _node('node2', 'user1', 'TERMINATED', False),
+    _node('node3', 'user2', 'RUNNING', False),
+    SimpleNamespace(name='node4', extra={ 'name': 'node4', 'labels': None, 'status': 'RUNNING', 'scheduling': {} }),
+]
+
+def _driver():
+    # the driver methods that do not need the account configuration, with a libcloud driver listing the nodes
+    driver = GCP.__new__(GCP)
+    driver._driver = SimpleNamespace(list_nodes=lambda: list(nodes))
+    return driver
+
+def _names(instances):
+    return [instance.name for instance in instances]
+
+def test_get_instances_filters():
+    driver = _driver()
+    assert _names(driver.get_instances()) == ['node1', 'node2', 'node3', 'node4']
+    assert _names(driver.get_instances(filters=['labels.user = "user1"', 'status = RUNNING'])) == ['node1']
+    assert _names(driver.get_instances(filters=['name = "node1"', 'labels.user = "user1"', 'scheduling.preemptible = true'])) == ['node1']
+    assert _names(driver.get_instances(filters=['status != RUNNING'])) == ['node2']
+    # unlabeled nodes have no user
+    assert _names(driver.get_instances(filters=['labels.user = "user2"'])) == ['node3']
@@ -0,0 +1,72 @@
+# Copyright (c) 2019-2024 The University of Chicago.
+# Part of skyway, released under the BSD 3-Clause License.
+
+from types import SimpleNamespace
+
+from skyway.cloud.core import Cloud
+from skyway.cloud.inventory import Inventory
+
+def _instance(name, ID, user_name, state):
+    return SimpleNamespace(name=name, id=ID, user=user_name, state=state)
+
+def _keys(instance):
+    return instance.name, instance.id, instance.user, instance.state
+
+instances = [
+    _instance('node1', 'i-1', 'user1', 'running'),
+    # names are not unique: a terminated node still listed
+    _instance('node1', 'i-0', 'user1', 'terminated'),
+    _instance('node2', 'i-2', 'user2', 'stopped'),
+    _instance('node3', 'i-3', 'user1', 'stopped'),
+]
+
+def test_lookups():
+    inventory = Inventory(instances, _keys)
+    assert len(inventory) == 4
+    assert list(inventory) == instances
+
+    assert inventory.get('i-2') is instances[2]
+    assert inventory.get('i-2', states=['running']) is None
+    assert inventory.get('i-9') is None
+
+    assert inventory.find('node1') is instances[0]
+    assert inventory.find('node1', states=['terminated']) is instances[1]
+    assert inventory.find('node9') is None
+
+    assert inventory.of_user('user1', states=['running', 'stopped']) == [instances[0], instances[3]]
+    assert inventory.of_user('user9') == []
+    assert inventory.in_states(['stopped', 'running']) == [instances[2], instances[3], instances[0]]
+
+    assert inventory.keys_of(instances[1]) == ('node1', 'i-0', 'user1', 'terminated')
+    assert inventory.name_of(instances[2]) == 'node2'
+    assert inventory.id_of(instances[2]) == 'i-2'
+    assert inventory.user_of(instances[2]) == 'user2'
+    assert inventory.state_of(instances[2]) == 'stopped'
+
+class FakeCloud(Cloud):
+    '''
+    a driver counting its listing calls
+    '''
+    def __init__(self):
+        super().__init__({}, {})
+        self.listings = 0
+
+    def get_instances(self):
+        self.listings += 1
+        return list(instances)
+
+    def get_instance_keys(self, node):
+        return _keys(node)
+
+def test_one_listing_per_command():
+    driver = FakeCloud()
+    assert driver.inventory().get('i-1') is instances[0]
+    assert driver.inventory().find('node2') is instances[2]
+    assert driver.listings == 1
+
+    # listed again after nodes are created or destroyed
+    driver.invalidate_inventory()
+    driver.inventory()
+    assert driver.listings == 2
+    driver.inventory(refresh=True)
+    assert driver.listings == 3
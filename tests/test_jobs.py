@@ -0,0 +1,68 @@
+# Copyright (c) 2019-2024 The University of Chicago.
+# Part of skyway, released under the BSD 3-Clause License.
+
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+from skyway import jobs
+
+@pytest.fixture
+def store(tmp_path):
+    store = jobs.JobStore(str(tmp_path / 'jobs.db'))
+    yield store
+    store.close()
+
+def _exited_pid():
+    worker = subprocess.Popen([sys.executable, '-c', 'pass'])
+    worker.wait()
+    return worker.pid
+
+def test_states(store):
+    job_id = store.add('test', 'job1', 't2.micro', '01:00:00', spot=True)
+    job = store.get(job_id)
+    assert job['state'] == 'pending' and job['spot'] == 1 and job['nodes'] == {}
+
+    store.update(job_id, state='running', nodes={'node1': '10.0.0.1'})
+    job = store.get(job_id)
+    assert job['state'] == 'running' and job['nodes'] == {'node1': '10.0.0.1'}
+
+    assert [job['id'] for job in store.list(states=['running'])] == [job_id]
+    assert store.list(account_name='other') == []
+    assert store.get(job_id + 1) is None
+
+def test_exited_worker(store):
+    job_id = store.add('test', 'job1', 't2.micro')
+    store.update(job_id, pid=_exited_pid())
+    job = store.get(job_id)
+    assert job['state'] == 'failed'
+    assert store.log_file(job_id) in job['message']
+
+def test_worker_on_another_host(store):
+    job_id = store.add('test', 'job1', 't2.micro')
+    store.update(job_id, pid=_exited_pid())
+    store.conn.execute("UPDATE jobs SET host = 'elsewhere' WHERE id = ?", (job_id,))
+    assert store.get(job_id)['state'] == 'pending'
+
+def test_running_worker(store):
+    job_id = store.add('test', 'job1', 't2.micro')
+    store.update(job_id, pid=os.getpid())
+    assert store.get(job_id)['state'] == 'pending'
+
+def test_older_store(tmp_path):
+    db_file = str(tmp_path / 'jobs.db')
+    conn = sqlite3.connect(db_file)
+    conn.execute('CREATE TABLE jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, account TEXT NOT NULL, jobname TEXT NOT NULL, '
+                 'node_type TEXT, walltime TEXT, region TEXT, state TEXT NOT NULL, message TEXT, nodes TEXT, '
+                 'pid INTEGER, submitted TEXT, updated TEXT)')
+    conn.execute("INSERT INTO jobs (account, jobname, state) VALUES ('test', 'job1', 'ready')")
+    conn.commit()
+    conn.close()
+
+    store = jobs.JobStore(db_file)
+    job = store.get(1)
+    assert job['spot'] == 0 and job['host'] is None
+    store.close()
@@ -0,0 +1,153 @@
+# Copyright (c) 2019-2024 The University of Chicago.
+# Part of skyway, released under the BSD 3-Clause License.
+
+import time
+
+import pytest
+
+from skyway import ledger
+
+@pytest.fixture
+def usage_ledger(skyway_root):
+    usage_ledger = ledger.open_ledger('test')
+    yield usage_ledger
+    usage_ledger.close()
+
+def test_totals_follow_the_records(usage_ledger):
+    usage_ledger.append('user1', 'i-1', 't2.micro', '2024-06-01T10:00:00', '2024-06-01T12:00:00', 1.5)
+    usage_ledger.append('user1', 'i-2', 't2.micro', '2024-06-02T10:00:00', '2024-06-02T11:00:00', 0.5)
+    usage_ledger.append('user2', 'i-3', 'c5.large', '2024-06-03T10:00:00', '2024-06-03T11:00:00', 2.0)
+
+    assert usage_ledger.user_cost('user1') == pytest.approx(2.0)
+    assert usage_ledger.user_cost('user2') == pytest.approx(2.0)
+    assert usage_ledger.user_cost('user3') == 0.0
+    assert usage_ledger.account_cost() == pytest.approx(4.0)
+    assert usage_ledger.verify_totals() == []
+
+    # the totals are also updated when records are deleted
+    usage_ledger.conn.execute("DELETE FROM usage WHERE instance_id = 'i-1'")
+    assert usage_ledger.user_cost('user1') == pytest.approx(0.5)
+    assert usage_ledger.account_cost() == pytest.approx(2.5)
+    assert usage_ledger.verify_totals() == []
+
+def test_verify_and_rebuild_totals(usage_ledger):
+    usage_ledger.append('user1', 'i-1', 't2.micro', '2024-06-01T10:00:00', '2024-06-01T12:00:00', 1.5)
+    usage_ledger.conn.execute("UPDATE user_totals SET cost = 10 WHERE user = 'user1'")
+    usage_ledger.conn.execute("UPDATE account_totals SET records = 5")
+
+    mismatches = usage_ledger.verify_totals()
+    assert sorted(m[0] or '' for m in mismatches) == ['', 'user1']
+
+    usage_ledger.rebuild_totals()
+    assert usage_ledger.verify_totals() == []
+    assert usage_ledger.user_cost('user1') == pytest.approx(1.5)
+
+def test_totals_computed_for_older_ledgers(skyway_root):
+    usage_ledger = ledger.open_ledger('test')
+    usage_ledger.append('user1', 'i-1', 't2.micro', '2024-06-01T10:00:00', '2024-06-01T12:00:00', 1.5)
+    # a ledger written before the totals were introduced
+    usage_ledger.conn.execute("DELETE FROM meta WHERE key = 'totals'")
+    usage_ledger.conn.execute("DELETE FROM user_totals")
+    usage_ledger.conn.execute("DELETE FROM account_totals")
+    usage_ledger.close()
+
+    usage_ledger = ledger.open_ledger('test')
+    assert usage_ledger.verify_totals() == []
+    assert usage_ledger.account_cost() == pytest.approx(1.5)
+    usage_ledger.close()
+
+def test_has_instance(usage_ledger):
+    usage_ledger.append('user1', 'i-1', 't2.micro', '2024-06-01T10:00:00', '2024-06-01T12:00:00', 1.5)
+    assert usage_ledger.has_instance('i-1')
+    assert not usage_ledger.has_instance('i-2')
+
+def test_query(usage_ledger):
+    for month in range(1, 7):
+        usage_ledger.append('user1', f'i-{month}', 't2.micro', f'2024-{month:02d}-01T10:00:00', f'2024-{month:02d}-15T10:00:00', 1.0)
+    usage_ledger.append('user2', 'i-7', 't2.micro', '2024-03-01T10:00:00', '2024-03-15T10:00:00', 1.0)
+
+    records = list(usage_ledger.query('user1', since='2024-02', until='2024-04', batch_size=2))
+    # most recent first, until includes the whole month
+    assert [r[1] for r in records] == ['i-4', 'i-3', 'i-2']
+    assert [r[1] for r in usage_ledger.query('user1', limit=2, offset=1)] == ['i-5', 'i-4']
+
+def test_import_pickle(skyway_root):
+    pd = pytest.importorskip('pandas')
+    # the records were prepended to the pickle files, below the placeholder row written with the file
+    df = pd.DataFrame([['user2', 'i-3', 'c5.large', '2024-06-03T10:00:00', '2024-06-03T11:00:00', 2.0, 96.5],
+                       ['user1', 'i-2', 't2.micro', '2024-06-02T10:00:00', '2024-06-02T11:00:00', 0.5, 98.5],
+                       ['user1', 'i-1', 't2.micro', '2024-06-01T10:00:00', '2024-06-01T12:00:00', 1.5, 99.0],
+                       ['user1', '--', '--', '00:00:00', '00:00:00', 0.0, 100.0]],
+                      columns=ledger.columns)
+    pkl_file = ledger.pickle_path('test')
+    df.to_pickle(pkl_file)
+
+    # imported when the ledger is created
+    usage_ledger = ledger.open_ledger('test')
+    assert [r[2] for r in usage_ledger.records_after(0, 10)] == ['i-1', 'i-2', 'i-3']
+    assert usage_ledger.user_cost('user1') == pytest.approx(2.0)
+    assert usage_ledger.account_cost() == pytest.approx(4.0)
+    assert usage_ledger.verify_totals() == []
+
+    # only once
+    assert usage_ledger.import_pickle(pkl_file) == 0
+    assert usage_ledger.account_cost() == pytest.approx(4.0)
+    usage_ledger.close()
+
+def test_import_slurm_pickle(usage_ledger, skyway_root):
+    pd = pytest.importorskip('pandas')
+    df = pd.DataFrame([['user1', '1234', 'cpu', '2024-06-01T10:00:00', '2024-06-01T12:00:00', 0.25]],
+                      columns=['User', 'JobID', 'InstanceType', 'Start', 'End', 'Cost'])
+    pkl_file = str(skyway_root / 'usage-slurm.pkl')
+    df.to_pickle(pkl_file)
+
+    assert usage_ledger.import_pickle(pkl_file) == 1
+    assert usage_ledger.has_instance('1234')
+    assert usage_ledger.verify_totals() == []
+
+def test_import_pickle_once_from_concurrent_processes(skyway_root):
+    pd = pytest.importorskip('pandas')
+    import multiprocessing
+    df = pd.DataFrame([['user1', f'i-{i}', 't2.micro', '2024-06-01T10:00:00', '2024-06-01T12:00:00', 1.0, 0.0] for i in range(200)],
+                      columns=ledger.columns)
+    df.to_pickle(ledger.pickle_path('test'))
+
+    # processes importing into the new ledger at the same time, reading the pickle slowly
+    context = multiprocessing.get_context('fork')
+    barrier = context.Barrier(4)
+    def import_pickle():
+        read_pickle = pd.read_pickle
+        pd.read_pickle = lambda f: (time.sleep(0.2), read_pickle(f))[1]
+        usage_ledger = ledger.UsageLedger(ledger.ledger_path('test'))
+        barrier.wait()
+        usage_ledger.import_pickle(ledger.pickle_path('test'), first=True)
+        usage_ledger.close()
+    processes = [context.Process(target=import_pickle) for _ in range(4)]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+    assert all(p.exitcode == 0 for p in processes)
+
+    usage_ledger = ledger.open_ledger('test')
+    assert usage_ledger.account_cost() == pytest.approx(200.0)
+    assert usage_ledger.verify_totals() == []
+    usage_ledger.close()
+
+def test_pickle_imported_into_existing_ledger(skyway_root):
+    pd = pytest.importorskip('pandas')
+    usage_ledger = ledger.open_ledger('test')
+    usage_ledger.append('user1', 'i-0', 't2.micro', '2024-05-01T10:00:00', '2024-05-01T12:00:00', 1.0)
+    usage_ledger.close()
+
+    df = pd.DataFrame([['user1', 'i-1', 't2.micro', '2024-06-01T10:00:00', '2024-06-01T12:00:00', 1.5, 0.0]],
+                      columns=ledger.columns)
+    df.to_pickle(ledger.pickle_path('test'))
+
+    # imported when first opened, not when the pickle is modified afterwards (see skyway ledger migrate)
+    for _ in range(2):
+        usage_ledger = ledger.open_ledger('test')
+        assert usage_ledger.account_cost() == pytest.approx(2.5)
+        usage_ledger.close()
+        df.iloc[0, 5] = 3.0
+        df.to_pickle(ledger.pickle_path('test'))
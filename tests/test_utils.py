@@ -0,0 +1,92 @@
+# Copyright (c) 2019-2024 The University of Chicago.
+# Part of skyway, released under the BSD 3-Clause License.
+
+import os
+
+import pytest
+
+from skyway import utils
+
+@pytest.fixture
+def snapshots(skyway_root, monkeypatch):
+    '''
+    count the YAML files parsed, with the snapshots in a folder of the test
+    '''
+    cache_path = skyway_root / 'cache'
+    monkeypatch.setenv('SKYWAYCACHE', str(cache_path))
+    parsed = []
+    parse_yaml = utils.parse_yaml
+    def counting_parse_yaml(cfg_file):
+        parsed.append(os.path.basename(cfg_file))
+        return parse_yaml(cfg_file)
+    monkeypatch.setattr(utils, 'parse_yaml', counting_parse_yaml)
+    return cache_path, parsed
+
+def _write(path, text):
+    path.write_text(text)
+    # a modification time of its own, whatever the resolution of the file system
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+def test_load_config_snapshot(skyway_root, snapshots):
+    cache_path, parsed = snapshots
+    etc_path = str(skyway_root / 'etc') + '/'
+    _write(skyway_root / 'etc' / 'test.yaml', "a: 1\n")
+
+    assert utils.load_config('test', etc_path) == {'a': 1}
+    assert utils.load_config('test', etc_path) == {'a': 1}
+    assert parsed == ['test.yaml']
+
+    # the snapshots are only readable by the user
+    assert os.stat(cache_path).st_mode & 0o777 == 0o700
+    assert all(os.stat(cache_path / f).st_mode & 0o077 == 0 for f in os.listdir(cache_path))
+
+    # parsed again when the file changes
+    _write(skyway_root / 'etc' / 'test.yaml', "a: 2\n")
+    assert utils.load_config('test', etc_path) == {'a': 2}
+    assert parsed == ['test.yaml', 'test.yaml']
+
+def test_load_config_missing(skyway_root, snapshots):
+    with pytest.raises(Exception, match="cannot be found"):
+        utils.load_config('missing', str(skyway_root / 'etc') + '/')
+
+def test_load_account_config(skyway_root, snapshots):
+    _, parsed = snapshots
+    _write(skyway_root / 'etc' / 'accounts' / 'test.yaml', "cloud: aws\naccount: {}\nusers: {}\n")
+    _write(skyway_root / 'etc' / 'cloud.yaml', "aws:\n  node-types: {t1: {}}\ngcp:\n  node-types: {}\n")
+
+    account_cfg, vendor_cfg = utils.load_account_config('test')
+    assert account_cfg['cloud'] == 'aws'
+    assert vendor_cfg == {'node-types': {'t1': {}}}
+    assert utils.load_account_config('test') == (account_cfg, vendor_cfg)
+    assert parsed == ['test.yaml', 'cloud.yaml']
+
+    # parsed again when either file changes
+    _write(skyway_root / 'etc' / 'cloud.yaml', "aws:\n  node-types: {t2: {}}\n")
+    assert utils.load_account_config('test')[1] == {'node-types': {'t2': {}}}
+
+def test_invalid_account_config_not_stored(skyway_root, snapshots):
+    _, parsed = snapshots
+    _write(skyway_root / 'etc' / 'accounts' / 'test.yaml', "cloud: azure\naccount: {}\nusers: {}\n")
+    _write(skyway_root / 'etc' / 'cloud.yaml', "aws:\n  node-types: {}\n")
+
+    for _ in range(2):
+        with pytest.raises(Exception, match="Cloud vendor azure is undefined"):
+            utils.load_account_config('test')
+    assert parsed == ['test.yaml', 'cloud.yaml'] * 2
+
+    _write(skyway_root / 'etc' / 'accounts' / 'test.yaml', "cloud: aws\nusers: {}\n")
+    with pytest.raises(Exception, match="Entry account is missing"):
+        utils.load_account_config('test')
+
+def test_account_load_cfg(skyway_root, snapshots):
+    from skyway import account
+    _, parsed = snapshots
+    _write(skyway_root / 'etc' / 'accounts' / 'test.yaml', "cloud: aws\n")
+
+    assert account.accounts() == ['test']
+    assert account.load_cfg('test') == {'cloud': 'aws'}
+    assert account.load_cfg('test') == {'cloud': 'aws'}
+    assert parsed == ['test.yaml']
+    with pytest.raises(Exception, match="does not exist"):
+        account.load_cfg('other')